@@ -2,8 +2,6 @@
 Celery tasks for the analytics service.
 """
 import logging
-import numpy as np
-import pandas as pd
 from datetime import timedelta
 from celery import shared_task
 from django.db.models import Avg, Count, F, Q, Sum
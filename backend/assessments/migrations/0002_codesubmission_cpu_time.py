@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assessments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codesubmission',
+            name='cpu_time',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='User plus system CPU seconds', max_digits=10, null=True),
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assessments', '0002_codesubmission_cpu_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testcase',
+            name='comparison_mode',
+            field=models.CharField(choices=[('exact', 'Exact'), ('whitespace', 'Ignore trailing whitespace'), ('tokens', 'Token-wise'), ('float', 'Float tolerance'), ('custom', 'Custom checker')], default='whitespace', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='testcase',
+            name='abs_tolerance',
+            field=models.FloatField(default=1e-06, help_text='Absolute tolerance for numbers in float mode'),
+        ),
+        migrations.AddField(
+            model_name='testcase',
+            name='rel_tolerance',
+            field=models.FloatField(default=1e-06, help_text='Relative tolerance for numbers in float mode'),
+        ),
+        migrations.AddField(
+            model_name='testcase',
+            name='checker',
+            field=models.CharField(blank=True, help_text='Registered output checker for custom mode', max_length=100),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assessments', '0003_testcase_comparison'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='reference_solution',
+            field=models.TextField(blank=True, help_text='Known-good solution that calibrates the time limits of coding questions'),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='reference_language',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+    ]
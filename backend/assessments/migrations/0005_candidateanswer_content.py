@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assessments', '0004_question_reference_solution'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='candidateanswer',
+            old_name='answer_content',
+            new_name='content',
+        ),
+        migrations.AddField(
+            model_name='candidateanswer',
+            name='is_correct',
+            field=models.BooleanField(default=False),
+        ),
+    ]
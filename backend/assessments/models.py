@@ -49,6 +49,8 @@ class Question(models.Model):
         ('hard', 'Hard'),
     ])
     points = models.PositiveIntegerField(default=1)
+    reference_solution = models.TextField(blank=True, help_text="Known-good solution that calibrates the time limits of coding questions")
+    reference_language = models.CharField(max_length=50, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -76,6 +78,16 @@ class TestCase(models.Model):
     question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='test_cases')
     input_data = models.TextField()
     expected_output = models.TextField()
+    comparison_mode = models.CharField(max_length=20, choices=[
+        ('exact', 'Exact'),
+        ('whitespace', 'Ignore trailing whitespace'),
+        ('tokens', 'Token-wise'),
+        ('float', 'Float tolerance'),
+        ('custom', 'Custom checker'),
+    ], default='whitespace')
+    abs_tolerance = models.FloatField(default=1e-6, help_text="Absolute tolerance for numbers in float mode")
+    rel_tolerance = models.FloatField(default=1e-6, help_text="Relative tolerance for numbers in float mode")
+    checker = models.CharField(max_length=100, blank=True, help_text="Registered output checker for custom mode")
     is_hidden = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -315,6 +327,7 @@ class CodeSubmission(models.Model):
     language = models.CharField(max_length=50)
     code_content = models.TextField()
     execution_time = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    cpu_time = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, help_text="User plus system CPU seconds")
     memory_usage = models.PositiveIntegerField(null=True, blank=True)
     passed_test_cases = models.PositiveIntegerField(default=0)
     total_test_cases = models.PositiveIntegerField(default=0)
@@ -124,12 +124,16 @@ class QuestionSerializer(serializers.ModelSerializer):
             'type',
             'difficulty',
             'points',
+            'reference_solution',
+            'reference_language',
             'skills',
             'skill_ids',
             'created_at', 
             'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
+        # Candidates see questions too; the reference solution only goes in
+        extra_kwargs = {'reference_solution': {'write_only': True}}
     
     def create(self, validated_data):
         skills = validated_data.pop('skills', [])
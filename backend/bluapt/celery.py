@@ -3,6 +3,7 @@ Celery configuration for bluapt project.
 """
 import os
 from celery import Celery
+from celery.signals import celeryd_after_setup, worker_process_init
 from django.conf import settings
 
 # Set the default Django settings module for the 'celery' program.
@@ -19,22 +20,102 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
 # Configure task routes
-app.conf.task_routes = {
+# Execution runs are split into priority lanes (settings.EXECUTION_LANES), each
+# consumed by its own workers so grading storms and rejudges never queue in
+# front of interactive runs, e.g.:
+#   celery -A bluapt worker -Q execution.interactive --pool=threads -c 50
+#   celery -A bluapt worker -Q execution.grading --pool=threads -c 100
+#   celery -A bluapt worker -Q execution.rejudge --pool=threads -c 20
+# Static analysis (execution.analysis) fans out to its own process pool, e.g.:
+#   celery -A bluapt worker -Q execution.analysis --pool=threads -c 2
+# Shards of a sharded grading run (execution.grading) go to the queue of its lane.
+# Nodes serving only some languages (EXECUTION_NODE_LANGUAGES) also consume, and
+# are sent runs through, per-language queues such as execution.grading.cpp.
+# Runs of a code submission or organisation go to one of the fair queues of
+# their queue (EXECUTION_FAIR_QUEUES), e.g. execution.grading.fair3, which the
+# workers of that queue consume as well.
+EXECUTION_LANE_TASKS = {
+    'execution.tasks.execute_code': 'interactive',
+    'execution.tasks.grade_submission': 'grading',
+    'execution.tasks.rejudge_submission': 'rejudge',
+    'execution.tasks.rejudge_question': 'rejudge',
+    'execution.tasks.calibrate_time_limits': 'rejudge',
+}
+
+app.conf.task_routes = ('execution.nodes.route_fair_queue', {
+    **{
+        task: {'queue': settings.EXECUTION_LANES[lane]['queue']}
+        for task, lane in EXECUTION_LANE_TASKS.items()
+    },
+    # Static analysis runs on its own workers, off the grading path
+    'execution.tasks.analyze_*': {'queue': 'execution.analysis'},
+    # Housekeeping, consumed by every execution worker (execution.nodes)
     'execution.tasks.*': {'queue': 'execution'},
     'assessments.tasks.*': {'queue': 'assessments'},
     'analytics.tasks.*': {'queue': 'analytics'},
-}
+})
 
 # Configure task time limits
 app.conf.task_time_limit = 300  # 5 minutes
 app.conf.task_soft_time_limit = 240  # 4 minutes
 
-# Configure task rate limits
+# Long grading runs should not sit prefetched behind a busy worker
+app.conf.worker_prefetch_multiplier = 1
+
+# Periodic tasks (run with `celery -A bluapt beat`)
+app.conf.beat_schedule = {
+    # Sends one sweep to the node queue of every execution host, which cleans up its own Docker daemon
+    'reap-orphaned-sandboxes': {
+        'task': 'execution.tasks.reap_sandboxes',
+        'schedule': settings.EXECUTION_REAPER_INTERVAL,
+        'options': {'expires': settings.EXECUTION_REAPER_INTERVAL},
+    },
+}
+
+# Configure task rate limits; Celery enforces them per worker, so a lane's
+# overall rate grows with the number of workers consuming its queue
 app.conf.task_annotations = {
-    'execution.tasks.execute_code': {'rate_limit': '10/m'},
+    **{
+        task: {'rate_limit': settings.EXECUTION_LANES[lane]['rate_limit']}
+        for task, lane in EXECUTION_LANE_TASKS.items()
+    },
     'execution.tasks.check_plagiarism': {'rate_limit': '5/m'},
 }
 
+
+# Execution workers pull, pin and warm the sandbox images of their languages before
+# taking runs, then advertise them (execution.nodes)
+_execution_children = False
+
+
+@celeryd_after_setup.connect
+def warm_up_execution_worker(sender, instance, **kwargs):
+    global _execution_children
+    queues = list(instance.app.amqp.queues.consume_from or instance.app.amqp.queues)
+    if not any(name.startswith('execution') for name in queues):
+        return
+    from execution.nodes import node_languages, start_node_heartbeat, subscribe_language_queues
+    subscribe_language_queues(instance.app.amqp.queues, queues)
+    # Prefork children keep their own sandboxes, so the parent only pulls
+    prefork = 'prefork' in getattr(instance.pool_cls, '__module__', str(instance.pool_cls))
+    _execution_children = prefork
+    if settings.EXECUTION_WARMUP_ON_START:
+        from execution.warmup import warm_up
+        warm_up(node_languages(), sandboxes=not prefork)
+    if not prefork:
+        start_node_heartbeat()
+
+
+@worker_process_init.connect
+def warm_up_execution_child(**kwargs):
+    if _execution_children:
+        from execution.nodes import node_languages, start_node_heartbeat
+        if settings.EXECUTION_WARMUP_ON_START:
+            from execution.warmup import warm_up
+            warm_up(node_languages(), pull=False)
+        start_node_heartbeat()
+
+
 @app.task(bind=True)
 def debug_task(self):
     """Task to debug Celery worker."""
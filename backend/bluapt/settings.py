@@ -225,6 +225,18 @@ CORS_EXPOSE_HEADERS = [
 # For development, allow all origins
 # CORS_ALLOW_ALL_ORIGINS = True  # This is now set above
 
+# Cache settings
+# Shared Redis cache when REDIS_URL is set, per-process memory cache otherwise
+CACHES = {
+    'default': {
+        'BACKEND': (
+            'django.core.cache.backends.redis.RedisCache' if os.getenv('REDIS_URL')
+            else 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('REDIS_URL', 'bluapt'),
+    }
+}
+
 # Celery settings
 CELERY_BROKER_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
@@ -233,6 +245,112 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
+# Code execution settings
+EXECUTION_POOL_MIN_SIZE = int(os.getenv('EXECUTION_POOL_MIN_SIZE', '1'))
+EXECUTION_POOL_MAX_SIZE = int(os.getenv('EXECUTION_POOL_MAX_SIZE', '4'))
+EXECUTION_POOL_MAX_USES = int(os.getenv('EXECUTION_POOL_MAX_USES', '50'))
+EXECUTION_POOL_ACQUIRE_TIMEOUT = int(os.getenv('EXECUTION_POOL_ACQUIRE_TIMEOUT', '30'))
+EXECUTION_POOL_HEARTBEAT_INTERVAL = int(os.getenv('EXECUTION_POOL_HEARTBEAT_INTERVAL', '30'))  # Seconds between pool owner heartbeats
+EXECUTION_POOL_OWNER_TTL = int(os.getenv('EXECUTION_POOL_OWNER_TTL', '120'))  # An owner without a heartbeat for this long is gone
+EXECUTION_SANDBOX_USER = os.getenv('EXECUTION_SANDBOX_USER', '65534:65534')  # Unprivileged uid:gid that candidate code runs as in sandbox containers
+EXECUTION_SANDBOX_PIDS_LIMIT = int(os.getenv('EXECUTION_SANDBOX_PIDS_LIMIT', '64'))  # Processes per sandbox container
+EXECUTION_SANDBOX_CPUS = float(os.getenv('EXECUTION_SANDBOX_CPUS', '1'))  # CPUs per sandbox container
+EXECUTION_SANDBOX_SCRATCH_SIZE = os.getenv('EXECUTION_SANDBOX_SCRATCH_SIZE', '64m')  # tmpfs holding the workspace
+EXECUTION_SANDBOX_TMP_SIZE = os.getenv('EXECUTION_SANDBOX_TMP_SIZE', '64m')  # tmpfs /tmp of sandbox containers
+EXECUTION_SANDBOX_KILL_GRACE = int(os.getenv('EXECUTION_SANDBOX_KILL_GRACE', '5'))  # Seconds past an exec's wall timeout before its container is killed
+EXECUTION_REAPER_INTERVAL = int(os.getenv('EXECUTION_REAPER_INTERVAL', '60'))  # Seconds between orphaned sandbox sweeps
+EXECUTION_REAPER_GRACE = int(os.getenv('EXECUTION_REAPER_GRACE', '300'))  # Minimum age of a container or record before it is reaped
+EXECUTION_REAPER_CONCURRENCY = int(os.getenv('EXECUTION_REAPER_CONCURRENCY', '8'))  # Orphans killed at once
+EXECUTION_BATCH_PARALLELISM = int(os.getenv('EXECUTION_BATCH_PARALLELISM', '4'))
+EXECUTION_GRADING_SHARD_SIZE = int(os.getenv('EXECUTION_GRADING_SHARD_SIZE', '20'))  # Test cases per grading shard; 0 grades in one sandbox
+EXECUTION_GRADING_MAX_SHARDS = int(os.getenv('EXECUTION_GRADING_MAX_SHARDS', '16'))  # Shards grow past the shard size beyond this
+EXECUTION_GRADING_STOP_ON_FAILURE = os.getenv('EXECUTION_GRADING_STOP_ON_FAILURE', 'False') == 'True'  # Cancel remaining shards once a test case fails
+EXECUTION_SANDBOX_BACKEND = os.getenv('EXECUTION_SANDBOX_BACKEND', 'docker')  # 'docker' or 'local'
+EXECUTION_LOCAL_SCRATCH_DIR = os.getenv('EXECUTION_LOCAL_SCRATCH_DIR', '/dev/shm')
+EXECUTION_LOCAL_WRAPPER = os.getenv('EXECUTION_LOCAL_WRAPPER', '')
+EXECUTION_LOCAL_RUNTIME_PATHS = [path for path in os.getenv('EXECUTION_LOCAL_RUNTIME_PATHS', '/usr,/bin,/sbin,/lib,/lib32,/lib64,/etc/alternatives,/etc/ld.so.cache').split(',') if path]  # Mounted read-only in the local sandbox's private root
+EXECUTION_LOCAL_ALLOW_UNISOLATED = os.getenv('EXECUTION_LOCAL_ALLOW_UNISOLATED', 'False') == 'True'  # Dev/CI only: run without a private root when namespaces are unavailable
+EXECUTION_LOCAL_TMP_SIZE = os.getenv('EXECUTION_LOCAL_TMP_SIZE', '64m')  # tmpfs /tmp of each local sandbox
+EXECUTION_LOCAL_MAX_PROCESSES = int(os.getenv('EXECUTION_LOCAL_MAX_PROCESSES', '64'))
+EXECUTION_LOCAL_MAX_FILE_SIZE = int(os.getenv('EXECUTION_LOCAL_MAX_FILE_SIZE', str(16 * 1024 * 1024)))
+EXECUTION_LOCAL_KILL_GRACE = int(os.getenv('EXECUTION_LOCAL_KILL_GRACE', '5'))
+EXECUTION_COMPILE_CACHE_DIR = os.getenv('EXECUTION_COMPILE_CACHE_DIR', '/tmp/bluapt-compile-cache')
+EXECUTION_COMPILE_CACHE_MAX_BYTES = int(os.getenv('EXECUTION_COMPILE_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+EXECUTION_TEST_CASE_CACHE = os.getenv('EXECUTION_TEST_CASE_CACHE', 'True') == 'True'  # Keep question test cases on the worker
+EXECUTION_TEST_CASE_CACHE_DIR = os.getenv('EXECUTION_TEST_CASE_CACHE_DIR', '/tmp/bluapt-test-cases')
+EXECUTION_TEST_CASE_CACHE_MAX_BYTES = int(os.getenv('EXECUTION_TEST_CASE_CACHE_MAX_BYTES', str(1024 * 1024 * 1024)))
+EXECUTION_TEST_CASE_CACHE_MEMORY_BYTES = int(os.getenv('EXECUTION_TEST_CASE_CACHE_MEMORY_BYTES', str(256 * 1024 * 1024)))  # Per process
+EXECUTION_PREFLIGHT = os.getenv('EXECUTION_PREFLIGHT', 'True') == 'True'  # Reject syntax errors before acquiring a sandbox
+EXECUTION_PREFLIGHT_NODE = os.getenv('EXECUTION_PREFLIGHT_NODE', 'node')  # Parses JavaScript for pre-flight checks; '' disables
+EXECUTION_PREFLIGHT_TIMEOUT = int(os.getenv('EXECUTION_PREFLIGHT_TIMEOUT', '5'))
+EXECUTION_ANALYSIS_ON_GRADE = os.getenv('EXECUTION_ANALYSIS_ON_GRADE', 'True') == 'True'  # Queue static analysis of graded submissions
+EXECUTION_ANALYSIS_PROCESSES = int(os.getenv('EXECUTION_ANALYSIS_PROCESSES', str(os.cpu_count() or 1)))  # 0 analyses in the task's own process
+EXECUTION_ANALYSIS_BATCH_SIZE = int(os.getenv('EXECUTION_ANALYSIS_BATCH_SIZE', '100'))  # Submissions analysed together per assessment
+EXECUTION_ANALYSIS_CACHE_TTL = int(os.getenv('EXECUTION_ANALYSIS_CACHE_TTL', str(7 * 24 * 3600)))
+
+# Per-question time limits calibrated from reference solutions (execution.limits)
+EXECUTION_TIME_LIMITS = os.getenv('EXECUTION_TIME_LIMITS', 'True') == 'True'  # Grade questions with a reference solution under calibrated limits
+EXECUTION_TIME_LIMIT_MULTIPLIER = float(os.getenv('EXECUTION_TIME_LIMIT_MULTIPLIER', '3'))  # Limit per reference runtime in the same language
+EXECUTION_TIME_LIMIT_MIN = float(os.getenv('EXECUTION_TIME_LIMIT_MIN', '1'))  # Seconds; covers interpreter and JVM start-up
+EXECUTION_TIME_LIMIT_LANGUAGE_FACTORS = {  # Relative slowness of each language for the same algorithm
+    'cpp': 1.0,
+    'java': 2.0,
+    'javascript': 2.0,
+    'python': 5.0,
+}
+EXECUTION_CALIBRATION_RUNS = int(os.getenv('EXECUTION_CALIBRATION_RUNS', '3'))  # Reference runs per calibration; the median counts
+EXECUTION_CALIBRATION_LOCK_TTL = int(os.getenv('EXECUTION_CALIBRATION_LOCK_TTL', '600'))  # Seconds before a lost calibration is queued again
+EXECUTION_EVENT_BUS = os.getenv('EXECUTION_EVENT_BUS', 'redis')  # 'redis', or 'local' when runs happen in the web process (tests, eager Celery)
+EXECUTION_EVENT_BUS_URL = os.getenv('REDIS_URL', CELERY_BROKER_URL)
+EXECUTION_EVENTS_KEEPALIVE = int(os.getenv('EXECUTION_EVENTS_KEEPALIVE', '15'))  # Seconds between SSE keep-alive comments
+EXECUTION_EVENTS_TIMEOUT = int(os.getenv('EXECUTION_EVENTS_TIMEOUT', '330'))  # Longest an SSE stream stays open
+EXECUTION_STATE_TTL = int(os.getenv('EXECUTION_STATE_TTL', '3600'))  # In-progress status and container tracking
+EXECUTION_CANCEL_POLL_INTERVAL = float(os.getenv('EXECUTION_CANCEL_POLL_INTERVAL', '0.5'))  # Seconds between checks that a running run was cancelled
+EXECUTION_RESULT_CACHE_TTL = int(os.getenv('EXECUTION_RESULT_CACHE_TTL', '3600'))  # 0 disables memoization
+EXECUTION_OUTPUT_MAX_BYTES = int(os.getenv('EXECUTION_OUTPUT_MAX_BYTES', str(64 * 1024)))  # Kept per stream
+EXECUTION_OUTPUT_GZIP = os.getenv('EXECUTION_OUTPUT_GZIP', 'False') == 'True'  # Also store full output gzipped
+EXECUTION_WARMUP_ON_START = os.getenv('EXECUTION_WARMUP_ON_START', 'True') == 'True'  # Pull, pin and warm images in execution workers
+EXECUTION_NODE_LANGUAGES = [language for language in os.getenv('EXECUTION_NODE_LANGUAGES', '').split(',') if language]  # Languages this node serves; empty serves all
+EXECUTION_LANGUAGE_QUEUES = os.getenv('EXECUTION_LANGUAGE_QUEUES', 'True') == 'True'  # Route runs through per-language queues of each lane
+EXECUTION_NODE_HEARTBEAT_INTERVAL = int(os.getenv('EXECUTION_NODE_HEARTBEAT_INTERVAL', '10'))  # Seconds between capacity reports
+EXECUTION_NODE_TTL = int(os.getenv('EXECUTION_NODE_TTL', '30'))  # A node without a report for this long gets no runs
+EXECUTION_ENGINE_MAX_CONCURRENCY = int(os.getenv('EXECUTION_ENGINE_MAX_CONCURRENCY', '200'))  # Sandbox sessions per process
+EXECUTION_ENGINE_MAX_THREADS = int(os.getenv('EXECUTION_ENGINE_MAX_THREADS', '64'))  # For blocking backend calls; bounds concurrent Docker execs
+
+# Execution priority lanes: each has its own Celery queue, sandbox concurrency budget and rate limit.
+# - queue: the lane's tasks (bluapt.celery.EXECUTION_LANE_TASKS) are routed there, so each lane
+#   is drained by its own workers and a backlog in one never delays another
+# - concurrency: sandbox sessions of the lane a worker process runs at once (ExecutionEngine);
+#   a run waits for its lane's budget before it takes a shared slot
+# - rate_limit: Celery task rate limit, enforced per worker, of the lane's tasks
+EXECUTION_LANES = {
+    'interactive': {  # "Run" button sample runs
+        'queue': 'execution.interactive',
+        'concurrency': int(os.getenv('EXECUTION_INTERACTIVE_CONCURRENCY', '50')),
+        'rate_limit': os.getenv('EXECUTION_INTERACTIVE_RATE_LIMIT', '120/m'),
+    },
+    'grading': {  # Final submission grading
+        'queue': 'execution.grading',
+        'concurrency': int(os.getenv('EXECUTION_GRADING_CONCURRENCY', '100')),
+        'rate_limit': os.getenv('EXECUTION_GRADING_RATE_LIMIT', '60/m'),
+    },
+    'rejudge': {  # Batch and background rejudges
+        'queue': 'execution.rejudge',
+        'concurrency': int(os.getenv('EXECUTION_REJUDGE_CONCURRENCY', '20')),
+        'rate_limit': os.getenv('EXECUTION_REJUDGE_RATE_LIMIT', '30/m'),
+    },
+}
+
+# Fair sharing of sandbox slots between organisations, e.g. EXECUTION_ORG_WEIGHTS="<org id>:3,<org id>:0.5"
+EXECUTION_ORG_WEIGHTS = {
+    org: float(weight)
+    for org, weight in (item.split(':') for item in os.getenv('EXECUTION_ORG_WEIGHTS', '').split(',') if item)
+}
+EXECUTION_ORG_DEFAULT_WEIGHT = float(os.getenv('EXECUTION_ORG_DEFAULT_WEIGHT', '1'))
+EXECUTION_ORG_MAX_CONCURRENCY = int(os.getenv('EXECUTION_ORG_MAX_CONCURRENCY', '100'))  # Sandbox sessions per organisation and process
+EXECUTION_ORG_USAGE_HALF_LIFE = int(os.getenv('EXECUTION_ORG_USAGE_HALF_LIFE', '60'))  # Seconds until past usage counts half
+EXECUTION_FAIR_QUEUES = int(os.getenv('EXECUTION_FAIR_QUEUES', '8'))  # Queues per lane queue that organisations are hashed into; 1 disables
+
 # Sentry settings
 if os.getenv('SENTRY_DSN'):
     import sentry_sdk
@@ -33,7 +33,7 @@ api_v1_patterns = [
     # path('organizations/', include('users.urls.organizations')),
     path('skills/', include('skills.urls')),
     path('assessments/', include('assessments.urls')),
-    # path('execution/', include('execution.urls')),
+    path('execution/', include('execution.urls')),
     # path('analytics/', include('analytics.urls')),
 ]
 
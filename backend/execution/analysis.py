@@ -0,0 +1,278 @@
+"""
+Static analysis of code submissions for reviewers.
+
+Each code submission can get a StaticAnalysisResult holding its pylint
+score and messages, bandit's security issues and the cyclomatic complexity
+of each function. Analysis runs in Celery tasks separate from grading, on a
+pool of worker processes, and its findings are cached by a hash of the code,
+so identical code (shared templates, resubmissions, rejudges) is analysed once.
+Whole assessments are analysed in one batch that deduplicates the code of
+their submissions before anything runs.
+
+Analysis is registered per language; languages without an analyzer are
+skipped.
+"""
+import ast
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.cache import cache
+from .models import StaticAnalysisResult
+
+# Changing the analyzers or their options changes every cache key
+ANALYSIS_VERSION = '1'
+CACHE_KEY_PREFIX = 'execution:analysis:'
+
+# Fields of StaticAnalysisResult that hold findings
+FINDING_FIELDS = ['lint_score', 'lint_messages', 'security_issues', 'complexity', 'max_complexity', 'errors']
+
+PYLINT_ARGS = [
+    '--persistent=n', '--reports=n', '--score=y', '--jobs=1',
+    # Candidates solve one exercise per file; missing docstrings are noise to reviewers
+    '--disable=missing-module-docstring,missing-class-docstring,missing-function-docstring',
+]
+
+# Findings kept per tool; the score and counts still cover every message
+MAX_MESSAGES = 100
+
+# Each of these adds a path through the code
+DECISION_NODES = (
+    ast.If, ast.For, ast.AsyncFor, ast.While, ast.IfExp, ast.ExceptHandler, ast.Assert,
+) + ((ast.match_case,) if hasattr(ast, 'match_case') else ())
+
+_analyzers = {}
+
+
+def register_analyzer(language):
+    """Register the static analysis of a language."""
+    def decorator(analyze):
+        _analyzers[language] = analyze
+        return analyze
+    return decorator
+
+
+def analysis_key(code, language):
+    """
+    Build the cache key for analysing a program.
+
+    Args:
+        code (str): The source code
+        language (str): The programming language
+
+    Returns:
+        str: Hex digest identifying the analysis
+    """
+    digest = hashlib.sha256()
+    for part in (ANALYSIS_VERSION, language, code):
+        data = (part or '').encode('utf-8')
+        digest.update(len(data).to_bytes(8, 'big'))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def _block_complexity(node):
+    complexity = 1
+    pending = list(ast.iter_child_nodes(node))
+    while pending:
+        child = pending.pop()
+        if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            # Counted as blocks of their own
+            continue
+        if isinstance(child, DECISION_NODES):
+            complexity += 1
+        elif isinstance(child, ast.BoolOp):
+            complexity += len(child.values) - 1
+        elif isinstance(child, ast.comprehension):
+            complexity += 1 + len(child.ifs)
+        pending.extend(ast.iter_child_nodes(child))
+    return complexity
+
+
+def cyclomatic_complexity(code):
+    """
+    Compute the McCabe complexity of each function of a Python program.
+
+    Args:
+        code (str): The source code
+
+    Returns:
+        dict: Qualified function name (``<module>`` for top-level code) to complexity
+    """
+    tree = ast.parse(code)
+    blocks = {'<module>': _block_complexity(tree)}
+
+    def visit(node, prefix):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                name = prefix + child.name
+                blocks[name] = max(blocks.get(name, 0), _block_complexity(child))
+                visit(child, name + '.')
+            elif isinstance(child, ast.ClassDef):
+                visit(child, prefix + child.name + '.')
+            else:
+                visit(child, prefix)
+
+    visit(tree, '')
+    return blocks
+
+
+def run_pylint(path):
+    """Lint a file; returns its score out of 10 and its messages."""
+    from pylint.lint import Run
+    from pylint.reporters import CollectingReporter
+
+    reporter = CollectingReporter()
+    run = Run([path, *PYLINT_ARGS], reporter=reporter, exit=False)
+    messages = [
+        {
+            'line': message.line,
+            'column': message.column,
+            'category': message.category,
+            'symbol': message.symbol,
+            'message_id': message.msg_id,
+            'message': message.msg,
+        }
+        for message in reporter.messages
+    ]
+    score = getattr(run.linter.stats, 'global_note', None)
+    return (round(score, 2) if score is not None else None), messages
+
+
+def run_bandit(path):
+    """Scan a file for security issues."""
+    from bandit.core import config, manager
+
+    scanner = manager.BanditManager(config.BanditConfig(), 'file')
+    scanner.discover_files([path])
+    scanner.run_tests()
+    return [
+        {
+            'line': issue.lineno,
+            'test_id': issue.test_id,
+            'test': issue.test,
+            'severity': issue.severity,
+            'confidence': issue.confidence,
+            'message': issue.text,
+        }
+        for issue in scanner.get_issue_list()
+    ]
+
+
+@register_analyzer('python')
+def analyze_python(code):
+    findings = {
+        'lint_score': None, 'lint_messages': [], 'security_issues': [],
+        'complexity': {}, 'max_complexity': None, 'errors': {},
+    }
+    try:
+        findings['complexity'] = cyclomatic_complexity(code)
+        findings['max_complexity'] = max(findings['complexity'].values())
+    except (SyntaxError, ValueError) as e:
+        findings['errors']['complexity'] = f"{type(e).__name__}: {e}"
+
+    # One tool failing still leaves the findings of the others
+    with tempfile.TemporaryDirectory(prefix='bluapt-analysis-') as directory:
+        path = os.path.join(directory, 'program.py')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(code)
+        try:
+            findings['lint_score'], messages = run_pylint(path)
+            findings['lint_messages'] = messages[:MAX_MESSAGES]
+        except Exception as e:
+            findings['errors']['pylint'] = f"{type(e).__name__}: {e}"
+        try:
+            findings['security_issues'] = run_bandit(path)[:MAX_MESSAGES]
+        except Exception as e:
+            findings['errors']['bandit'] = f"{type(e).__name__}: {e}"
+    return findings
+
+
+def run_analyzer(language, code):
+    """Analyse a program in the current process."""
+    return _analyzers[language](code)
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_analysis_executor():
+    """
+    Get this process's pool of analysis processes, creating it on first use.
+
+    Returns:
+        ProcessPoolExecutor: The pool, or None where processes cannot have
+            children (Celery prefork children are daemonic), so analysis runs inline
+    """
+    global _executor, _executor_pid
+    if multiprocessing.current_process().daemon or settings.EXECUTION_ANALYSIS_PROCESSES <= 0:
+        return None
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ProcessPoolExecutor(max_workers=settings.EXECUTION_ANALYSIS_PROCESSES)
+            _executor_pid = os.getpid()
+    return _executor
+
+
+def _analyze(jobs):
+    """Run (language, code) jobs, in parallel when a process pool is available."""
+    executor = get_analysis_executor()
+    if executor is None:
+        return [run_analyzer(language, code) for language, code in jobs]
+    return list(executor.map(run_analyzer, *zip(*jobs)))
+
+
+def analyze_submissions(code_submissions):
+    """
+    Analyse code submissions and store their findings.
+
+    Args:
+        code_submissions (list): CodeSubmission instances
+
+    Returns:
+        dict: Number of submissions ``analyzed``, distinct programs ``run`` through the
+            analyzers and submissions ``skipped`` for lack of an analyzer
+    """
+    keys = {
+        submission.id: analysis_key(submission.code_content, submission.language)
+        for submission in code_submissions if submission.language in _analyzers
+    }
+    found = {
+        key[len(CACHE_KEY_PREFIX):]: findings
+        for key, findings in cache.get_many([CACHE_KEY_PREFIX + key for key in set(keys.values())]).items()
+    }
+
+    # Identical code analysed for another submission is reused from the database
+    missing = set(keys.values()) - set(found)
+    if missing:
+        for row in StaticAnalysisResult.objects.filter(code_hash__in=missing).values('code_hash', *FINDING_FIELDS):
+            found.setdefault(row.pop('code_hash'), row)
+
+    jobs = {}
+    for submission in code_submissions:
+        key = keys.get(submission.id)
+        if key is not None and key not in found:
+            jobs.setdefault(key, (submission.language, submission.code_content))
+    if jobs:
+        analyzed = dict(zip(jobs, _analyze(list(jobs.values()))))
+        found.update(analyzed)
+        cache.set_many({CACHE_KEY_PREFIX + key: findings for key, findings in analyzed.items()},
+                       timeout=settings.EXECUTION_ANALYSIS_CACHE_TTL)
+
+    StaticAnalysisResult.objects.bulk_create([
+        StaticAnalysisResult(
+            code_submission_id=submission.id,
+            code_hash=keys[submission.id],
+            language=submission.language,
+            **{field: found[keys[submission.id]][field] for field in FINDING_FIELDS},
+        )
+        for submission in code_submissions if submission.id in keys
+    ], update_conflicts=True, unique_fields=['code_submission_id'],
+        update_fields=['code_hash', 'language', *FINDING_FIELDS, 'updated_at'])
+
+    return {'analyzed': len(keys), 'run': len(jobs), 'skipped': len(code_submissions) - len(keys)}
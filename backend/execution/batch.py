@@ -0,0 +1,316 @@
+"""
+Batched test case execution for the execution service.
+
+All test cases of a submission are copied into one sandbox and run by a
+small POSIX shell runner, so grading costs one sandbox invocation instead of
+one per test case.
+"""
+import math
+import os
+import re
+import shlex
+from .comparators import compare_test_output
+from .output import CapturedOutput, capture
+
+# Exit codes of a program killed for running out of time: the runner's own kill and `timeout` (coreutils, busybox)
+TIMEOUT_EXIT_CODES = (124, 143)
+
+# Name the runner script goes by ($0) in the sandbox
+RUNNER_NAME = 'run_tests.sh'
+CASES_DIR = 'cases'
+OUTPUT_DIR = 'out'
+
+# Seconds between samples of the program's peak resident set size
+MEMORY_POLL_INTERVAL = '0.01'
+
+# The runner measures each case itself: wall clock around the program, CPU
+# time from the shell's `times` before and after, and peak RSS by sampling
+# VmHWM of the program's process while it runs; it kills the program's
+# session once the timeout passes. A program that does not run as a child of
+# the runner (see zygote.py) records the pid to sample in the .pid file
+# itself and reports its CPU time in a .cpu file.
+#
+# Everything the runner writes, the programs' output included, goes to the
+# output directory next to the workspace. The runner runs privileged and the
+# programs through the sandbox's ``unprivileged`` prefix, which leaves them
+# unable to write there, so they cannot rewrite their own measurements.
+RUNNER_TEMPLATE = """cd {workspace}
+out={output_dir}
+rm -rf $out && mkdir -m 755 $out
+{setup}now() {{
+  t=$(date +%s.%N 2>/dev/null)
+  case "$t" in *N*|'') read t rest < /proc/uptime ;; esac
+  echo "$t"
+}}
+run_case() {{
+  (
+    start=$(now)
+    times > $out/$1.times
+    {unprivileged}setsid sh -c {program} $out/$1.pid < {cases_dir}/$1.in > $out/$1.out 2> $out/$1.err &
+    echo $! > $out/$1.job
+    wait $!
+    code=$?
+    times >> $out/$1.times
+    end=$(now)
+    # Take down anything the program left running in its session
+    kill -9 -$! 2>/dev/null
+    echo "$code $start $end" > $out/$1.rc
+  ) &
+  job=$!
+  read up rest < /proc/uptime
+  deadline=$((${{up%.*}}${{up#*.}} + {timeout_ticks}))
+  peak=0
+  timed_out=0
+  while [ ! -f $out/$1.rc ] && kill -0 $job 2>/dev/null; do
+    pid=
+    [ -f $out/$1.pid ] && read pid < $out/$1.pid
+    [ -z "$pid" ] && [ -f $out/$1.job ] && read pid < $out/$1.job
+    case "$pid" in
+      ''|*[!0-9]*) ;;
+      *) while read key value rest; do
+           if [ "$key" = VmHWM: ] && [ "$value" -gt "$peak" ]; then peak=$value; fi
+         done 2>/dev/null < /proc/$pid/status ;;
+    esac
+    read up rest < /proc/uptime
+    if [ $timed_out = 0 ] && [ ${{up%.*}}${{up#*.}} -ge $deadline ] && read group < $out/$1.job; then
+      timed_out=1
+      kill -9 -$group $group 2>/dev/null
+    fi
+    sleep {poll_interval}
+  done
+  wait $job
+  read code start end < $out/$1.rc
+  [ $timed_out = 1 ] && code=124
+  echo "$code $start $end $peak" > $out/$1.meta
+}}
+i=0
+while [ $i -lt {count} ]; do
+  run_case $i &
+  i=$((i + 1))
+  if [ $((i % {parallelism})) -eq 0 ]; then wait; fi
+done
+wait
+"""
+
+TIMES_PATTERN = re.compile(r'(\d+)m\s*([\d.]+)s')
+
+
+class RunnerFailed(RuntimeError):
+    """Raised when the runner itself did not finish, so its test case results cannot be trusted."""
+
+
+def build_batch_files(test_cases):
+    """
+    Build the input files for a batch of test cases.
+
+    Args:
+        test_cases (list): Test case dicts with ``input_data``
+
+    Returns:
+        dict: Mapping of workspace-relative file name to content
+    """
+    return {
+        f"{CASES_DIR}/{index}.in": test_case.get('input_data') or ''
+        for index, test_case in enumerate(test_cases)
+    }
+
+
+def output_dir(workspace):
+    """Return where the runner leaves its measurements and the programs' output: next to the workspace."""
+    return os.path.join(os.path.dirname(workspace.rstrip('/')), OUTPUT_DIR)
+
+
+def build_batch_script(workspace, program_command, count, timeout, parallelism=1, setup='', unprivileged=''):
+    """
+    Build the shell runner that executes every test case inside one sandbox.
+
+    Args:
+        workspace (str): Directory holding the program and test inputs
+        program_command (str): Command that runs the (compiled) program
+        count (int): Number of test cases
+        timeout (float): Per-test-case timeout in seconds
+        parallelism (int): How many test cases run at the same time
+        setup (str): Shell commands run once before the first test case
+        unprivileged (str): Prefix from ``Sandbox.unprivileged`` that the program runs under
+
+    Returns:
+        str: Shell script text
+    """
+    return RUNNER_TEMPLATE.format(
+        workspace=workspace,
+        output_dir=output_dir(workspace),
+        cases_dir=CASES_DIR,
+        # Hundredths of a second, the resolution of /proc/uptime
+        timeout_ticks=math.ceil(timeout * 100),
+        unprivileged=f"{unprivileged} " if unprivileged else '',
+        # The program gets its pid file as $0 and execs in place, keeping the pid the runner samples
+        program=shlex.quote(f'exec {program_command}'),
+        poll_interval=MEMORY_POLL_INTERVAL,
+        count=count,
+        parallelism=max(int(parallelism), 1),
+        setup=setup,
+    )
+
+
+def _tee(chunks, output):
+    for chunk in chunks:
+        output.write(chunk)
+        yield chunk
+
+
+def capture_compared(chunks, limit, test_case, compress=False):
+    """
+    Capture a test case's stdout while comparing all of it with the expected output.
+
+    Args:
+        chunks (iterable): Byte chunks of the program's stdout
+        limit (int): Maximum number of bytes to keep
+        test_case (dict): Test case with ``expected_output`` and optional ``comparison`` options
+        compress (bool): Also keep a gzip archive of the full stream
+
+    Returns:
+        CapturedOutput: The captured stream, with its ``comparison`` result
+    """
+    output = CapturedOutput(limit, compress)
+    chunks = iter(chunks)
+    output.comparison = compare_test_output(_tee(chunks, output), test_case)
+    # The comparison stops at the first mismatch; capture whatever is left
+    for chunk in chunks:
+        output.write(chunk)
+    return output.close()
+
+
+def collect_batch_outputs(files, limit, compress=False, test_cases=None):
+    """
+    Capture the runner's output files in one pass with a size cap per stream.
+
+    Args:
+        files (iterable): (name, byte chunks) pairs from ``Sandbox.iter_files`` of ``output_dir``
+        limit (int): Maximum number of bytes kept per stdout/stderr file
+        compress (bool): Also keep gzip archives of the full stdout/stderr
+        test_cases (list, optional): Test cases whose stdout is compared with
+            their expected output while it streams past
+
+    Returns:
+        dict: Mapping of file name to CapturedOutput
+    """
+    expected = {
+        f"{OUTPUT_DIR}/{index}.out": test_case
+        for index, test_case in enumerate(test_cases or [])
+        if 'expected_output' in test_case
+    }
+    outputs = {}
+    for name, chunks in files:
+        is_stream = name.endswith(('.out', '.err'))
+        if name in expected:
+            outputs[name] = capture_compared(chunks, limit, expected[name], compress=compress)
+        else:
+            # Bookkeeping files are tiny; the cap only guards against tampering
+            outputs[name] = capture(chunks, limit, compress=compress and is_stream)
+    return outputs
+
+
+def case_outputs(files, index):
+    """Return the (stdout, stderr) captures of one test case, or None for missing files."""
+    return files.get(f"{OUTPUT_DIR}/{index}.out"), files.get(f"{OUTPUT_DIR}/{index}.err")
+
+
+def _decode(data):
+    if isinstance(data, CapturedOutput):
+        return data.text()
+    return (data or b'').decode('utf-8', errors='replace')
+
+
+def _truncated(data):
+    return isinstance(data, CapturedOutput) and data.truncated
+
+
+def _cpu_time(times_output):
+    """Return the CPU time (user + sys) children used between two `times` reports."""
+    values = [int(minutes) * 60 + float(seconds) for minutes, seconds in TIMES_PATTERN.findall(times_output)]
+    if len(values) < 8:
+        return 0
+    return max((values[6] + values[7]) - (values[2] + values[3]), 0)
+
+
+def _empty_result(test_case, stderr=''):
+    return {
+        'test_case_id': test_case.get('id'),
+        'verdict': 'error',
+        'exit_code': None,
+        'execution_time': 0,
+        'cpu_time': 0,
+        'memory_usage': 0,
+        'stdout': '',
+        'stderr': stderr,
+        'output_truncated': False,
+        'mismatch': None,
+    }
+
+
+def compile_error_results(test_cases, compile_error):
+    """Mark every test case as an error because the program did not compile."""
+    return [_empty_result(test_case, compile_error) for test_case in test_cases]
+
+
+def parse_batch_results(files, test_cases):
+    """
+    Turn the runner's output files into per-test-case verdicts.
+
+    Args:
+        files (dict): Mapping of workspace-relative file name to bytes or CapturedOutput;
+            stdout compared while it was captured keeps that result, anything else is
+            compared here (a truncated head carries a marker and so never matches)
+        test_cases (list): Test case dicts; without ``expected_output`` a
+            successful run gets the verdict ``completed``
+
+    Returns:
+        list: One result dict per test case, in input order
+    """
+    results = []
+    for index, test_case in enumerate(test_cases):
+        result = _empty_result(test_case)
+        meta = _decode(files.get(f"{OUTPUT_DIR}/{index}.meta")).split()
+        if len(meta) == 4:
+            exit_code = int(meta[0])
+            stdout_file, stderr_file = case_outputs(files, index)
+            stdout = _decode(stdout_file)
+            comparison = None
+            if exit_code in TIMEOUT_EXIT_CODES:
+                verdict = 'timeout'
+            elif exit_code != 0:
+                verdict = 'error'
+            elif 'expected_output' not in test_case:
+                verdict = 'completed'
+            else:
+                comparison = getattr(stdout_file, 'comparison', None) or compare_test_output(stdout, test_case)
+                if 'error' in comparison:
+                    verdict = 'error'
+                else:
+                    verdict = 'passed' if comparison['match'] else 'failed'
+            stderr = _decode(stderr_file)
+            if verdict == 'error' and comparison is not None:
+                # The test case cannot be judged; say why next to what the program printed
+                stderr = '\n'.join(filter(None, [stderr, comparison['error']]))
+            cpu = _decode(files.get(f"{OUTPUT_DIR}/{index}.cpu")).split()
+            if cpu:
+                cpu_time = float(cpu[0])
+            else:
+                cpu_time = _cpu_time(_decode(files.get(f"{OUTPUT_DIR}/{index}.times")))
+            result.update({
+                'verdict': verdict,
+                'exit_code': exit_code,
+                'execution_time': round(max(float(meta[2]) - float(meta[1]), 0), 2),
+                'cpu_time': round(cpu_time, 2),
+                # Peak resident set size of the program, in KB
+                'memory_usage': int(meta[3]),
+                'stdout': stdout,
+                'stderr': stderr,
+                'output_truncated': _truncated(stdout_file) or _truncated(stderr_file),
+                # Where the output first differs from the expected output
+                'mismatch': None if comparison is None or comparison['match'] or verdict == 'error' else {
+                    key: value for key, value in comparison.items() if key != 'match'
+                },
+            })
+        results.append(result)
+    return results
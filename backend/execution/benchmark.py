@@ -0,0 +1,233 @@
+"""
+Benchmark harness for the execution service.
+
+Replays a synthetic workload through ``execute_code`` and ``check_plagiarism``
+and reports throughput, latency percentiles and database queries per run.
+Runs use the configured sandbox backend; ``manage.py benchmark_execution``
+swaps in an in-memory stand-in for the Docker daemon, so the whole execution
+path (pool, engine, output capture, verdicts, bookkeeping) runs without one.
+"""
+import random
+import threading
+import time
+import uuid
+from queue import Empty, Queue
+from django.db import connection, connections
+from . import tasks
+
+# Statements that only delimit a transaction, and are not counted as queries
+TRANSACTION_STATEMENTS = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE SAVEPOINT')
+
+DEFAULT_WORKLOAD = {
+    'languages': {'python': 0.5, 'javascript': 0.2, 'java': 0.15, 'cpp': 0.15},
+    'code_size': [200, 4000],  # Bytes of source code, min and max
+    'test_cases': [1, 20],  # Test cases per run, min and max
+    'input_size': 64,  # Bytes of input per test case
+}
+
+CODE_TEMPLATES = {
+    'python': "import sys\nprint(sys.stdin.read(), end='')\n",
+    'javascript': "process.stdin.pipe(process.stdout);\n",
+    'java': "public class Main { public static void main(String[] a) throws Exception { System.in.transferTo(System.out); } }\n",
+    'cpp': "#include <iostream>\nint main() { std::cout << std::cin.rdbuf(); }\n",
+}
+
+COMMENT_PREFIXES = {'python': '# ', 'javascript': '// ', 'java': '// ', 'cpp': '// '}
+
+WORDS = ['total', 'index', 'result', 'value', 'count', 'left', 'right', 'node', 'queue', 'visited']
+
+
+def generate_code(language, size, rng):
+    """Build an echo program for ``language`` padded with comments to about ``size`` bytes."""
+    lines = [CODE_TEMPLATES[language]]
+    length = len(lines[0])
+    while length < size:
+        line = COMMENT_PREFIXES[language] + ' '.join(rng.choice(WORDS) for _ in range(8)) + '\n'
+        lines.append(line)
+        length += len(line)
+    return ''.join(lines)
+
+
+def generate_runs(workload, count, seed=0):
+    """
+    Generate the runs of a workload.
+
+    Args:
+        workload (dict): Language mix, code size, test case count and input size; see DEFAULT_WORKLOAD
+        count (int): Number of runs
+        seed (int, optional): Seed for reproducible workloads
+
+    Returns:
+        list: ``(code, language, test_cases)`` tuples
+    """
+    workload = {**DEFAULT_WORKLOAD, **(workload or {})}
+    rng = random.Random(seed)
+    languages = list(workload['languages'])
+    weights = [workload['languages'][language] for language in languages]
+    runs = []
+    for _ in range(count):
+        language = rng.choices(languages, weights)[0]
+        code = generate_code(language, rng.randint(*workload['code_size']), rng)
+        test_cases = []
+        for index in range(rng.randint(*workload['test_cases'])):
+            input_data = ''.join(rng.choice('0123456789 ') for _ in range(workload['input_size']))
+            test_cases.append({'id': str(index), 'input_data': input_data, 'expected_output': input_data})
+        runs.append((code, language, test_cases))
+    return runs
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def _replay(calls, concurrency):
+    """Run callables on ``concurrency`` threads, timing each one and counting its queries."""
+    def count_queries(counter):
+        def wrapper(execute, sql, params, many, context):
+            if not sql.lstrip().upper().startswith(TRANSACTION_STATEMENTS):
+                counter[0] += 1
+            return execute(sql, params, many, context)
+        return wrapper
+
+    pending = Queue()
+    for call in calls:
+        pending.put(call)
+    samples = []
+    samples_lock = threading.Lock()
+
+    def worker():
+        try:
+            while True:
+                try:
+                    call = pending.get_nowait()
+                except Empty:
+                    return
+                queries = [0]
+                with connection.execute_wrapper(count_queries(queries)):
+                    started = time.perf_counter()
+                    result = call()
+                    elapsed = time.perf_counter() - started
+                with samples_lock:
+                    samples.append((elapsed, queries[0], result))
+        finally:
+            connections.close_all()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, name=f'benchmark-{index}') for index in range(max(concurrency, 1))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - started
+
+
+def _report(samples, seconds, failed):
+    latencies = [elapsed for elapsed, _, _ in samples]
+    return {
+        'runs': len(samples),
+        'failed': sum(1 for _, _, result in samples if failed(result)),
+        'seconds': round(seconds, 3),
+        'runs_per_second': round(len(samples) / seconds, 2) if seconds else 0,
+        'latency': {
+            'p50': round(percentile(latencies, 0.50), 4),
+            'p95': round(percentile(latencies, 0.95), 4),
+            'p99': round(percentile(latencies, 0.99), 4),
+            'max': round(max(latencies, default=0), 4),
+        },
+        'queries_per_run': round(sum(queries for _, queries, _ in samples) / len(samples), 2) if samples else 0,
+    }
+
+
+def benchmark_execution(workload=None, runs=100, concurrency=8, seed=0):
+    """
+    Replay a workload through ``execute_code``.
+
+    Args:
+        workload (dict, optional): Overrides for DEFAULT_WORKLOAD
+        runs (int, optional): Number of runs
+        concurrency (int, optional): Runs in flight at once
+        seed (int, optional): Seed for reproducible workloads
+
+    Returns:
+        dict: Run count, failures, runs per second, latency percentiles and queries per run
+    """
+    calls = [
+        # Memoized results would hide the sandbox path being measured
+        lambda code=code, language=language, test_cases=test_cases: tasks.execute_code(
+            code, language, test_cases=test_cases, bypass_cache=True
+        )
+        for code, language, test_cases in generate_runs(workload, runs, seed)
+    ]
+    samples, seconds = _replay(calls, concurrency)
+    return _report(
+        samples, seconds,
+        lambda result: result['status'] != 'completed'
+        or any(case['verdict'] != 'passed' for case in result['test_results']),
+    )
+
+
+def create_plagiarism_fixture(workload=None, submissions=50, seed=0):
+    """
+    Create one coding question with ``submissions`` code submissions to compare.
+
+    Returns:
+        tuple: (question ID, list of (code submission ID, language) pairs)
+    """
+    from assessments.models import (
+        Assessment, CandidateAnswer, CandidateAssessment, CandidateTest, CodeSubmission, Question,
+        Test, TestLibrary
+    )
+    from users.models import Organization, User
+
+    organization = Organization.objects.create(name='Benchmark')
+    user = User.objects.create_user(f'benchmark-{uuid.uuid4().hex}@example.com', first_name='Bench', last_name='Mark')
+    library = TestLibrary.objects.create(
+        title='Benchmark', description='', creator=user, category='benchmark', difficulty='beginner'
+    )
+    question = Question.objects.create(test=library, content='Echo the input', type='coding', difficulty='easy')
+    test = Test.objects.create(
+        title='Benchmark', description='', instructions='', category='benchmark', difficulty='easy',
+        created_by=user, organization=organization,
+    )
+    assessment = Assessment.objects.create(
+        title='Benchmark', description='', time_limit=60, passing_score=50, created_by=user, organization=organization
+    )
+    candidate_test = CandidateTest.objects.create(
+        candidate_assessment=CandidateAssessment.objects.create(candidate=user, assessment=assessment),
+        test=test,
+    )
+    code_submissions = []
+    for code, language, _ in generate_runs({**(workload or {}), 'test_cases': [0, 0]}, submissions, seed):
+        answer = CandidateAnswer.objects.create(candidate_test=candidate_test, question=question, content=code)
+        code_submissions.append(
+            CodeSubmission.objects.create(candidate_answer=answer, language=language, code_content=code)
+        )
+    return str(question.id), [(str(submission.id), submission.language) for submission in code_submissions]
+
+
+def benchmark_plagiarism(workload=None, submissions=50, concurrency=1, seed=0):
+    """
+    Run ``check_plagiarism`` for every submission to one generated question.
+
+    Args:
+        workload (dict, optional): Overrides for DEFAULT_WORKLOAD
+        submissions (int, optional): Number of submissions to the question
+        concurrency (int, optional): Checks in flight at once
+        seed (int, optional): Seed for reproducible workloads
+
+    Returns:
+        dict: Check count, failures, checks per second, latency percentiles and queries per check
+    """
+    question_id, code_submissions = create_plagiarism_fixture(workload, submissions, seed)
+    calls = [
+        lambda submission_id=submission_id, language=language: tasks.check_plagiarism(
+            submission_id, language, question_id=question_id
+        )
+        for submission_id, language in code_submissions
+    ]
+    samples, seconds = _replay(calls, concurrency)
+    return _report(samples, seconds, lambda result: 'error' in result)
@@ -0,0 +1,149 @@
+"""
+Coalescing of "Run" clicks per candidate test and question.
+
+Each (candidate_test, question) pair has one slot in the Django cache naming
+its latest run and a fingerprint of what that run executes. Queueing a run
+into a slot:
+
+- hands back the slot's run if it is identical and has not failed, so
+  repeated clicks share one execution (and its event stream)
+- otherwise supersedes the slot's run: it is flagged as cancelled, which a
+  queued run notices before it acquires a sandbox and a running one notices
+  within ``EXECUTION_CANCEL_POLL_INTERVAL``, when its sandbox is killed (only
+  cancellable runs watch: interactive runs and stop-on-failure shards)
+
+A request that cannot lock its slot in time runs without coalescing and
+leaves the slot alone. Cancelled runs end with the status ``cancelled``.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import secrets
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+from .lifecycle import get_status
+
+logger = logging.getLogger(__name__)
+
+SLOT_KEY_PREFIX = 'execution:slot:'
+CANCEL_KEY_PREFIX = 'execution:cancel:'
+
+# Runs in these states are not worth sharing with a new identical request
+UNSHAREABLE_STATUSES = ('failed', 'timeout', 'cancelled')
+
+# Longest wait for another request holding a slot, in seconds
+SLOT_LOCK_TIMEOUT = 2
+
+# Deletes a lock only while it still holds its owner's token
+RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+
+class RunCancelled(Exception):
+    """Raised when a run is cancelled while it is in a sandbox."""
+
+
+def run_fingerprint(code, language, **options):
+    """Identify what a run executes, so identical requests can share it."""
+    payload = json.dumps({'code': code, 'language': language, **options}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _release(lock_key, token):
+    """Delete a lock unless it expired and another request took it since."""
+    backend = getattr(cache, '_cache', None)
+    if hasattr(backend, 'get_client'):
+        # Redis: compare and delete in one step; integers are stored as is
+        key = cache.make_and_validate_key(lock_key)
+        backend.get_client(key, write=True).eval(RELEASE_SCRIPT, 1, key, token)
+    elif cache.get(lock_key) == token:
+        cache.delete(lock_key)
+
+
+@contextmanager
+def _slot_lock(slot_key):
+    """Lock a slot; yields whether the lock was taken before SLOT_LOCK_TIMEOUT."""
+    # cache.add is atomic, so it doubles as a short-lived mutex
+    lock_key = slot_key + ':lock'
+    token = secrets.randbits(62)
+    deadline = time.monotonic() + SLOT_LOCK_TIMEOUT
+    locked = cache.add(lock_key, token, timeout=SLOT_LOCK_TIMEOUT)
+    while not locked and time.monotonic() < deadline:
+        time.sleep(0.01)
+        locked = cache.add(lock_key, token, timeout=SLOT_LOCK_TIMEOUT)
+    try:
+        yield locked
+    finally:
+        if locked:
+            _release(lock_key, token)
+
+
+def claim_slot(candidate_test_id, question_id, fingerprint, execution_id):
+    """
+    Make a run the latest of its (candidate_test, question) slot.
+
+    Args:
+        candidate_test_id (str): Candidate test the run belongs to
+        question_id (str): Question the run belongs to
+        fingerprint (str): Result of ``run_fingerprint``
+        execution_id (str): ID the run gets if it is not shared
+
+    Returns:
+        tuple: (execution_id to use, whether it is a new run, execution_id of the
+            run it supersedes or None)
+    """
+    slot_key = f"{SLOT_KEY_PREFIX}{candidate_test_id}:{question_id}"
+    with _slot_lock(slot_key) as locked:
+        if not locked:
+            logger.warning(f"Slot {slot_key} stayed locked; running {execution_id} without coalescing")
+            return execution_id, True, None
+        current = cache.get(slot_key)
+        if current is not None and current['fingerprint'] == fingerprint:
+            status = get_status(current['execution_id'])
+            if status is not None and status not in UNSHAREABLE_STATUSES:
+                return current['execution_id'], False, None
+        cache.set(slot_key, {'execution_id': execution_id, 'fingerprint': fingerprint},
+                  timeout=settings.EXECUTION_STATE_TTL)
+    return execution_id, True, current['execution_id'] if current is not None else None
+
+
+def cancel_run(execution_id):
+    """Ask for a run to be cancelled; it stops wherever it is when it notices."""
+    cache.set(CANCEL_KEY_PREFIX + str(execution_id), True, timeout=settings.EXECUTION_STATE_TTL)
+
+
+def is_cancelled(execution_id):
+    return bool(cache.get(CANCEL_KEY_PREFIX + str(execution_id)))
+
+
+async def run_cancellable(execution_id, sandbox, session):
+    """
+    Run a sandbox session, killing the sandbox if the run is cancelled meanwhile.
+
+    Args:
+        execution_id (str): ID of the run
+        sandbox (Sandbox): Sandbox the session runs in
+        session: ``run_session`` coroutine
+
+    Returns:
+        dict: The session's result
+
+    Raises:
+        RunCancelled: If the run was cancelled before it finished
+    """
+    task = asyncio.ensure_future(session)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=settings.EXECUTION_CANCEL_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await asyncio.to_thread(is_cancelled, execution_id):
+                await asyncio.to_thread(sandbox.kill)
+                raise RunCancelled(execution_id)
+    finally:
+        if not task.done():
+            task.cancel()
+            # Let the session unwind; its sandbox is gone, so errors are expected
+            await asyncio.gather(task, return_exceptions=True)
@@ -0,0 +1,229 @@
+"""
+Output comparison for test case verdicts.
+
+``compare_output`` checks a program's output against the expected output in
+one streaming pass over both, so outputs far larger than what is kept for
+display are still judged in full, and it stops at the first difference.
+
+Modes:
+
+- ``exact``: character for character
+- ``whitespace``: trailing whitespace on each line and blank lines at the
+  start and end of the output are ignored
+- ``tokens``: the outputs are compared as sequences of whitespace-separated tokens
+- ``float``: like ``tokens``, but numbers match when they are within
+  ``abs_tol`` or ``rel_tol`` of each other
+- ``custom``: a checker registered with ``register_checker`` decides
+
+The result is a dict with ``match`` and, on a mismatch, the ``line`` and
+``column`` of the program's output where it starts plus an excerpt of the
+``expected`` and ``actual`` text there.
+"""
+import codecs
+import math
+import os
+import re
+from itertools import zip_longest
+
+COMPARISON_MODES = ('exact', 'whitespace', 'tokens', 'float', 'custom')
+DEFAULT_MODE = 'whitespace'
+DEFAULT_TOLERANCE = 1e-6
+
+CHUNK_SIZE = 64 * 1024
+
+# Longest excerpt of expected and actual text reported with a mismatch
+EXCERPT_LENGTH = 80
+
+TOKEN_PATTERN = re.compile(r'\S+')
+
+_checkers = {}
+
+
+def register_checker(name):
+    """
+    Register a custom checker for the ``custom`` mode.
+
+    A checker is called as ``checker(actual, expected, test_case)`` with
+    iterators of text chunks for both outputs and returns a bool or a
+    comparison dict.
+    """
+    def decorator(checker):
+        _checkers[name] = checker
+        return checker
+    return decorator
+
+
+def _chunks(data):
+    """Iterate over the text chunks of a str, bytes or an iterable of either."""
+    if isinstance(data, (str, bytes)):
+        whole = data
+        data = (whole[start:start + CHUNK_SIZE] for start in range(0, len(whole), CHUNK_SIZE))
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    for chunk in data:
+        text = decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+        if text:
+            yield text
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def _lines(chunks):
+    """Yield (line without its newline, line number)."""
+    number = 1
+    pending = ''
+    for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split('\n')
+        for line in lines:
+            yield line, number
+            number += 1
+    if pending:
+        yield pending, number
+
+
+def _significant_lines(chunks):
+    """Yield (line, line number, column) with trailing whitespace and outer blank lines dropped."""
+    held = []
+    started = False
+    for line, number in _lines(chunks):
+        line = line.rstrip()
+        if not line:
+            # Blank lines only count once something follows them
+            if started:
+                held.append(number)
+            continue
+        started = True
+        for blank in held:
+            yield '', blank, 1
+        held.clear()
+        yield line, number, 1
+
+
+def _tokens(chunks):
+    """Yield (token, line number, column)."""
+    for line, number in _lines(chunks):
+        for match in TOKEN_PATTERN.finditer(line):
+            yield match.group(), number, match.start() + 1
+
+
+def _mismatch(line, column, expected, actual):
+    return {
+        'match': False,
+        'line': line,
+        'column': column,
+        'expected': expected[:EXCERPT_LENGTH],
+        'actual': actual[:EXCERPT_LENGTH],
+    }
+
+
+def _advance(line, column, text):
+    newlines = text.count('\n')
+    if newlines:
+        return line + newlines, len(text) - text.rfind('\n')
+    return line, column + len(text)
+
+
+def _compare_exact(actual, expected):
+    actual_chunks, expected_chunks = _chunks(actual), _chunks(expected)
+    actual_buffer = expected_buffer = ''
+    line, column = 1, 1
+    while True:
+        actual_buffer = actual_buffer or next(actual_chunks, '')
+        expected_buffer = expected_buffer or next(expected_chunks, '')
+        if not actual_buffer and not expected_buffer:
+            return {'match': True}
+        size = min(len(actual_buffer), len(expected_buffer))
+        actual_part, expected_part = actual_buffer[:size], expected_buffer[:size]
+        if actual_part != expected_part or not size:
+            same = len(os.path.commonprefix([actual_part, expected_part]))
+            line, column = _advance(line, column, actual_part[:same])
+            return _mismatch(line, column, expected_buffer[same:], actual_buffer[same:])
+        line, column = _advance(line, column, actual_part)
+        actual_buffer, expected_buffer = actual_buffer[size:], expected_buffer[size:]
+
+
+def _compare_items(actual, expected, equal, within_item=False):
+    line, column = 1, 1
+    for actual_item, expected_item in zip_longest(actual, expected):
+        if actual_item is None:
+            # The program's output ended early
+            return _mismatch(line, column, expected_item[0], '')
+        value, line, column = actual_item
+        if expected_item is None:
+            return _mismatch(line, column, '', value)
+        if not equal(value, expected_item[0]):
+            if within_item:
+                same = len(os.path.commonprefix([value, expected_item[0]]))
+                return _mismatch(line, column + same, expected_item[0][same:], value[same:])
+            return _mismatch(line, column, expected_item[0], value)
+        column += len(value)
+    return {'match': True}
+
+
+def _numbers_equal(actual, expected, abs_tol, rel_tol):
+    if actual == expected:
+        return True
+    try:
+        actual_number, expected_number = float(actual), float(expected)
+    except ValueError:
+        return False
+    if math.isnan(actual_number) or math.isnan(expected_number):
+        return math.isnan(actual_number) and math.isnan(expected_number)
+    return math.isclose(actual_number, expected_number, rel_tol=rel_tol, abs_tol=abs_tol)
+
+
+def compare_output(actual, expected, mode=DEFAULT_MODE, abs_tol=DEFAULT_TOLERANCE, rel_tol=DEFAULT_TOLERANCE,
+                   checker=None, test_case=None):
+    """
+    Compare a program's output with the expected output.
+
+    Args:
+        actual: Program output as str, bytes or an iterable of chunks
+        expected: Expected output as str, bytes or an iterable of chunks
+        mode (str, optional): One of COMPARISON_MODES
+        abs_tol (float, optional): Absolute tolerance for numbers in ``float`` mode
+        rel_tol (float, optional): Relative tolerance for numbers in ``float`` mode
+        checker (str, optional): Name of a registered checker for ``custom`` mode
+        test_case (dict, optional): Test case passed on to custom checkers
+
+    Returns:
+        dict: ``match`` and, on a mismatch, its ``line``, ``column``, ``expected`` and ``actual`` text
+    """
+    if mode == 'exact':
+        return _compare_exact(actual, expected)
+    if mode == 'whitespace':
+        return _compare_items(_significant_lines(_chunks(actual)), _significant_lines(_chunks(expected)),
+                              str.__eq__, within_item=True)
+    if mode == 'tokens':
+        return _compare_items(_tokens(_chunks(actual)), _tokens(_chunks(expected)), str.__eq__)
+    if mode == 'float':
+        return _compare_items(
+            _tokens(_chunks(actual)), _tokens(_chunks(expected)),
+            lambda a, e: _numbers_equal(a, e, abs_tol, rel_tol),
+        )
+    if mode == 'custom':
+        if checker not in _checkers:
+            raise ValueError(f"Unknown output checker: {checker}")
+        result = _checkers[checker](_chunks(actual), _chunks(expected), test_case)
+        return result if isinstance(result, dict) else {'match': bool(result)}
+    raise ValueError(f"Unknown comparison mode: {mode}")
+
+
+def compare_test_output(actual, test_case):
+    """
+    Compare output with a test case's ``expected_output`` using its ``comparison`` options.
+
+    Invalid options (an unknown mode or checker, an unexpected argument) only
+    concern this test case, so they come back as a comparison dict with an
+    ``error`` message instead of raising.
+    """
+    try:
+        return compare_output(
+            actual,
+            test_case.get('expected_output') or '',
+            test_case=test_case,
+            **(test_case.get('comparison') or {}),
+        )
+    except (TypeError, ValueError) as e:
+        return {'match': False, 'error': f"Invalid comparison options: {e}"}
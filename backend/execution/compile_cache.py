@@ -0,0 +1,207 @@
+"""
+Content-addressed cache of compiled programs for the execution service.
+
+Build artifacts are stored as one tar file per cache key in a local
+directory. The directory is bounded in size and evicts the least recently
+used entries first; a hit refreshes the entry's modification time. A build
+that failed is stored too, as an entry holding only the compiler output, so
+the same program is not compiled again just to fail again.
+"""
+import hashlib
+import io
+import logging
+import os
+import tarfile
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Member of a cache entry holding the output of a failed compilation
+COMPILE_ERROR_NAME = '.compile_error'
+
+# Part of every cache key; bump it when the layout of entries changes, so
+# entries written by older workers are never read and age out of the cache
+CACHE_FORMAT_VERSION = 2
+
+
+def compile_cache_key(language, code, compile_command, runtime_digest):
+    """
+    Build the cache key for a compilation.
+
+    Args:
+        language (str): The programming language
+        code (str): The source code
+        compile_command (str): Compiler command line including flags
+        runtime_digest (str): Identity of the compiler image or binary
+
+    Returns:
+        str: Hex digest identifying the build
+    """
+    digest = hashlib.sha256()
+    for part in (str(CACHE_FORMAT_VERSION), language, compile_command, runtime_digest, code):
+        data = (part or '').encode('utf-8')
+        digest.update(len(data).to_bytes(8, 'big'))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class CompileCache:
+    """Size-bounded LRU store of build artifacts on local disk."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.tar")
+
+    def get(self, key):
+        """
+        Look up the artifacts for a cache key.
+
+        Args:
+            key (str): Key from ``compile_cache_key``
+
+        Returns:
+            dict: Mapping of file name to bytes, or None on a miss
+        """
+        path = self._path(key)
+        try:
+            with tarfile.open(path, mode='r') as tar:
+                files = {
+                    member.name: tar.extractfile(member).read()
+                    for member in tar.getmembers()
+                    if member.isfile()
+                }
+            self._touch(path)
+        except (FileNotFoundError, tarfile.TarError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logger.warning(f"Discarding corrupt compile cache entry {key}: {e}")
+                self._remove(path)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return files
+
+    def get_error(self, key):
+        """
+        Look up the compiler output of a build that failed, without counting a hit or miss.
+
+        Args:
+            key (str): Key from ``compile_cache_key``
+
+        Returns:
+            str: Compiler output, or None unless the build is known to fail
+        """
+        try:
+            with tarfile.open(self._path(key), mode='r') as tar:
+                try:
+                    member = tar.getmember(COMPILE_ERROR_NAME)
+                except KeyError:
+                    return None
+                output = tar.extractfile(member).read().decode('utf-8', errors='replace')
+        except (FileNotFoundError, tarfile.TarError):
+            return None
+        self._touch(self._path(key))
+        return output
+
+    def put_error(self, key, output):
+        """
+        Remember that a build failed.
+
+        Args:
+            key (str): Key from ``compile_cache_key``
+            output (str): Compiler output
+        """
+        self.put(key, {COMPILE_ERROR_NAME: output.encode('utf-8')})
+
+    def put(self, key, files):
+        """
+        Store the artifacts of a successful compilation.
+
+        Args:
+            key (str): Key from ``compile_cache_key``
+            files (dict): Mapping of file name to bytes
+        """
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w') as tar:
+            for name, data in files.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mode = 0o755
+                tar.addfile(info, io.BytesIO(data))
+
+        # Write to a temporary file first so readers never see a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(buffer.getvalue())
+        os.replace(temp_path, self._path(key))
+        self._touch(self._path(key))
+        self._evict()
+
+    def _touch(self, path):
+        # Filesystem timestamps come from a coarse clock; set a precise one for LRU order
+        now = time.time_ns()
+        os.utime(path, ns=(now, now))
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.tar'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self):
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+
+    def stats(self):
+        """Return the number of entries, their total size and hit counts."""
+        entries = self._entries()
+        return {
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_compile_cache():
+    """Get the worker's compile cache, creating it on first use."""
+    global _cache
+    from django.conf import settings
+
+    with _cache_lock:
+        if _cache is None:
+            _cache = CompileCache(
+                settings.EXECUTION_COMPILE_CACHE_DIR,
+                settings.EXECUTION_COMPILE_CACHE_MAX_BYTES,
+            )
+    return _cache
@@ -0,0 +1,165 @@
+"""
+Asyncio execution engine for the execution service.
+
+Each worker process runs one event loop on a background thread. Sandbox
+sessions (copying files, compiling, running the test runner, collecting
+output) are coroutines on that loop, so one process keeps many sandboxes
+busy at once: the local backend waits on its processes natively, and
+blocking backends such as the Docker SDK are driven from the loop's
+thread pool. A Docker exec holds one of its ``EXECUTION_ENGINE_MAX_THREADS``
+threads until the command returns, so that, not the concurrency limit,
+bounds how many Docker sandboxes run commands at once. Callers on any thread submit a coroutine and wait for its
+result, which lets ``execute_code`` keep its synchronous task signature.
+Sandbox slots are shared out between organisations by a FairScheduler,
+on top of the per-lane concurrency budgets.
+Run the worker with a thread pool (``celery worker --pool=threads``) to
+have many tasks in flight per process.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .fair import FairScheduler
+
+
+class ExecutionEngine:
+    """Background event loop that runs sandbox sessions concurrently."""
+
+    def __init__(self, max_concurrency=200, max_threads=64, lane_limits=None, org_weights=None,
+                 default_org_weight=1, max_per_org=None, usage_half_life=60):
+        self.max_concurrency = max_concurrency
+        self.max_threads = max_threads
+        self.lane_limits = dict(lane_limits or {})
+        self.org_weights = dict(org_weights or {})
+        self.default_org_weight = default_org_weight
+        self.max_per_org = max_per_org
+        self.usage_half_life = usage_half_life
+        self.in_flight = 0
+        self.completed = 0
+        self.lane_in_flight = {lane: 0 for lane in self.lane_limits}
+        self.loop = None
+        self._thread = None
+        self._scheduler = None
+        self._lane_semaphores = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the event loop thread if it is not running yet."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self.loop = asyncio.new_event_loop()
+            self.loop.set_default_executor(
+                ThreadPoolExecutor(max_workers=self.max_threads, thread_name_prefix='execution-engine')
+            )
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run_loop, args=(ready,), name='execution-engine', daemon=True)
+            self._thread.start()
+            ready.wait()
+
+    def _run_loop(self, ready):
+        asyncio.set_event_loop(self.loop)
+        self._scheduler = FairScheduler(
+            self.max_concurrency,
+            weights=self.org_weights,
+            default_weight=self.default_org_weight,
+            max_per_tenant=self.max_per_org,
+            half_life=self.usage_half_life,
+        )
+        self._lane_semaphores = {
+            lane: asyncio.Semaphore(limit) for lane, limit in self.lane_limits.items()
+        }
+        self.loop.call_soon(ready.set)
+        self.loop.run_forever()
+
+    async def _limited(self, coro, lane, organization_id):
+        # A lane's budget is taken first so a busy lane cannot hold the shared slots
+        lane_semaphore = self._lane_semaphores.get(lane)
+        if lane_semaphore is not None:
+            await lane_semaphore.acquire()
+        try:
+            await self._scheduler.acquire(organization_id)
+            self.in_flight += 1
+            if lane_semaphore is not None:
+                self.lane_in_flight[lane] += 1
+            started = time.monotonic()
+            try:
+                return await coro
+            finally:
+                self._scheduler.release(organization_id, time.monotonic() - started)
+                self.in_flight -= 1
+                self.completed += 1
+                if lane_semaphore is not None:
+                    self.lane_in_flight[lane] -= 1
+        finally:
+            if lane_semaphore is not None:
+                lane_semaphore.release()
+
+    def submit(self, coro, lane=None, organization_id=None):
+        """
+        Schedule a coroutine on the engine.
+
+        Args:
+            coro: Coroutine to run, e.g. a sandbox session
+            lane (str, optional): Priority lane whose concurrency budget the coroutine uses
+            organization_id (str, optional): Organisation whose fair share the coroutine uses
+
+        Returns:
+            concurrent.futures.Future: Resolves to the coroutine's result
+        """
+        self.start()
+        return asyncio.run_coroutine_threadsafe(self._limited(coro, lane, organization_id), self.loop)
+
+    def run(self, coro, timeout=None, lane=None, organization_id=None):
+        """Run a coroutine on the engine and block the calling thread until it finishes."""
+        return self.submit(coro, lane=lane, organization_id=organization_id).result(timeout)
+
+    def stop(self):
+        """Stop the event loop thread."""
+        with self._lock:
+            if self._thread is None:
+                return
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+            self.loop.close()
+            self._thread = None
+
+    def stats(self):
+        """Return the number of running and finished sessions, overall, per lane and per organisation."""
+        return {
+            'in_flight': self.in_flight,
+            'completed': self.completed,
+            'max_concurrency': self.max_concurrency,
+            'lanes': {
+                lane: {'in_flight': self.lane_in_flight[lane], 'concurrency': limit}
+                for lane, limit in self.lane_limits.items()
+            },
+            'organizations': self._scheduler.stats() if self._scheduler else {},
+        }
+
+
+_engine = None
+_engine_pid = None
+_engine_lock = threading.Lock()
+
+
+def get_execution_engine():
+    """Get the worker process's execution engine, creating it on first use."""
+    global _engine, _engine_pid
+    from django.conf import settings
+
+    with _engine_lock:
+        # A forked worker inherits the object but not the loop thread
+        if _engine is None or _engine_pid != os.getpid():
+            _engine = ExecutionEngine(
+                max_concurrency=settings.EXECUTION_ENGINE_MAX_CONCURRENCY,
+                max_threads=settings.EXECUTION_ENGINE_MAX_THREADS,
+                lane_limits={lane: config['concurrency'] for lane, config in settings.EXECUTION_LANES.items()},
+                org_weights=settings.EXECUTION_ORG_WEIGHTS,
+                default_org_weight=settings.EXECUTION_ORG_DEFAULT_WEIGHT,
+                max_per_org=settings.EXECUTION_ORG_MAX_CONCURRENCY,
+                usage_half_life=settings.EXECUTION_ORG_USAGE_HALF_LIFE,
+            )
+            _engine_pid = os.getpid()
+    return _engine
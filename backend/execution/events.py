@@ -0,0 +1,192 @@
+"""
+Execution progress events.
+
+Workers publish a run's progress (queued, running, one event per test case,
+completed) on a pub/sub channel keyed by its execution_id, and the
+server-sent-events endpoint relays them to the browser, so clients follow a
+run instead of polling for its result. ``EXECUTION_EVENT_BUS`` picks Redis
+pub/sub, shared by workers and web processes, or an in-memory bus that only
+reaches subscribers in the same process. The in-memory bus never carries a
+worker's events to a web process, so it only suits runs that happen in the
+web process itself: tests and eager Celery.
+
+Events are for the candidate following a run, so a test case event never
+carries the expected output, and a hidden test case only reports its
+verdict and measurements (``test_case_event``).
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = 'execution:events:'
+
+# Result fields of a hidden test case left out of its events; they reveal its input or expected output
+HIDDEN_RESULT_FIELDS = ('stdout', 'stderr', 'mismatch')
+
+# Statuses after which a run publishes nothing more
+TERMINAL_STATUSES = ('completed', 'compile_error', 'failed', 'timeout', 'cancelled')
+
+
+def channel_name(execution_id):
+    return CHANNEL_PREFIX + str(execution_id)
+
+
+class LocalEventBus:
+    """In-process pub/sub; subscribers are asyncio queues on their own event loops."""
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, message)
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            self._subscribers[channel].add(subscriber)
+        try:
+            yield self._messages(subscriber[1])
+        finally:
+            with self._lock:
+                self._subscribers[channel].discard(subscriber)
+                if not self._subscribers[channel]:
+                    del self._subscribers[channel]
+
+    @staticmethod
+    async def _messages(queue):
+        while True:
+            yield await queue.get()
+
+
+class _RedisListener:
+    """One Redis pub/sub connection of an event loop, shared by all of its subscribers."""
+
+    def __init__(self, url):
+        import redis.asyncio
+        self._pubsub = redis.asyncio.Redis.from_url(url).pubsub()
+        self._queues = defaultdict(set)
+        self._lock = asyncio.Lock()
+        self._reader = None
+
+    async def add(self, channel, queue):
+        async with self._lock:
+            if channel not in self._queues:
+                await self._pubsub.subscribe(channel)
+            self._queues[channel].add(queue)
+            if self._reader is None or self._reader.done():
+                self._reader = asyncio.ensure_future(self._read())
+
+    async def remove(self, channel, queue):
+        async with self._lock:
+            self._queues[channel].discard(queue)
+            if not self._queues[channel]:
+                del self._queues[channel]
+                await self._pubsub.unsubscribe(channel)
+
+    async def _read(self):
+        # Stops once nobody listens; the next subscriber starts another reader
+        while self._queues:
+            try:
+                item = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except Exception as e:
+                logger.warning(f"Error reading execution events: {e}")
+                await asyncio.sleep(1)
+                continue
+            if item is None or item['type'] != 'message':
+                continue
+            message = json.loads(item['data'])
+            for queue in self._queues.get(item['channel'].decode(), ()):
+                queue.put_nowait(message)
+
+
+class RedisEventBus:
+    """Pub/sub over Redis, so web processes see events published by workers."""
+
+    def __init__(self, url):
+        import redis
+        self.url = url
+        self._client = redis.Redis.from_url(url)
+        # Subscribers on one event loop share its listener's connection
+        self._listeners = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        self._client.publish(channel, json.dumps(message))
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            listener = self._listeners.get(loop)
+            if listener is None:
+                listener = self._listeners[loop] = _RedisListener(self.url)
+        queue = asyncio.Queue()
+        await listener.add(channel, queue)
+        try:
+            yield LocalEventBus._messages(queue)
+        finally:
+            await listener.remove(channel, queue)
+
+
+_bus = None
+_bus_lock = threading.Lock()
+
+
+def get_event_bus():
+    """Get the process's event bus, creating it on first use or when its settings change."""
+    global _bus
+    config = (settings.EXECUTION_EVENT_BUS, settings.EXECUTION_EVENT_BUS_URL)
+    with _bus_lock:
+        if _bus is None or _bus[0] != config:
+            if settings.EXECUTION_EVENT_BUS == 'redis':
+                _bus = (config, RedisEventBus(settings.EXECUTION_EVENT_BUS_URL))
+            else:
+                _bus = (config, LocalEventBus())
+    return _bus[1]
+
+
+def publish_event(execution_id, event, **data):
+    """
+    Publish a progress event of a run.
+
+    Args:
+        execution_id (str): ID of the run
+        event (str): ``queued``, ``running``, ``test_case`` or ``completed``
+        **data: Event payload
+    """
+    try:
+        get_event_bus().publish(channel_name(execution_id), {'event': event, 'execution_id': str(execution_id), **data})
+    except Exception as e:
+        # Progress events are best effort; the run's result is still saved
+        logger.warning(f"Error publishing {event} event for execution {execution_id}: {e}")
+
+
+def test_case_event(test_result, hidden=False):
+    """
+    Return the payload of a test case event, without what candidates must not see.
+
+    Args:
+        test_result (dict): Result of the test case
+        hidden (bool): Whether the test case is hidden from candidates
+
+    Returns:
+        dict: The result without the expected output, and for a hidden test case
+            without the program's output either
+    """
+    if hidden:
+        return {key: value for key, value in test_result.items() if key not in HIDDEN_RESULT_FIELDS}
+    event = dict(test_result)
+    if event.get('mismatch'):
+        event['mismatch'] = {key: value for key, value in event['mismatch'].items() if key != 'expected'}
+    return event
@@ -0,0 +1,138 @@
+"""
+Per-organisation fair scheduling of sandbox sessions.
+
+The execution engine hands out its sandbox slots through a FairScheduler
+instead of a plain semaphore. Every organisation (tenant) has its own
+queue of waiting runs, a weight and a cap on runs in flight. When a slot
+frees up it goes to the waiting tenant with the smallest weighted usage,
+where usage is the sandbox time its runs took recently (decaying with
+``half_life``) plus one second for each run still in flight. A tenant
+submitting thousands of runs therefore only gets its weighted share while
+others are waiting, and idle capacity is never held back.
+
+This only shares out the runs one worker already took from the broker;
+across workers, runs are kept apart by organisation in fair queues (see
+execution.nodes).
+"""
+import asyncio
+import itertools
+import time
+from collections import deque
+
+# Tenant for runs that do not belong to an organisation
+DEFAULT_TENANT = 'default'
+
+
+class _Tenant:
+    def __init__(self, weight, max_in_flight):
+        self.weight = weight
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.completed = 0
+        self.usage = 0.0
+        self.updated = time.monotonic()
+        self.waiters = deque()
+
+
+class FairScheduler:
+    """Weighted fair queuing of sandbox slots between organisations."""
+
+    def __init__(self, capacity, weights=None, default_weight=1, max_per_tenant=None, half_life=60):
+        self.capacity = capacity
+        self.weights = dict(weights or {})
+        self.default_weight = default_weight
+        self.max_per_tenant = max_per_tenant or capacity
+        self.half_life = half_life
+        self.in_flight = 0
+        self._tenants = {}
+        self._sequence = itertools.count()
+
+    def _tenant(self, tenant):
+        state = self._tenants.get(tenant)
+        if state is None:
+            state = self._tenants[tenant] = _Tenant(
+                self.weights.get(tenant, self.default_weight), self.max_per_tenant
+            )
+        return state
+
+    def _decay(self, state, now):
+        state.usage *= 0.5 ** ((now - state.updated) / self.half_life)
+        state.updated = now
+
+    def _share(self, state, now):
+        self._decay(state, now)
+        return (state.usage + state.in_flight) / state.weight
+
+    def _grant(self, state):
+        state.in_flight += 1
+        self.in_flight += 1
+
+    def _dispatch(self):
+        now = time.monotonic()
+        while self.in_flight < self.capacity:
+            ready = [
+                state for state in self._tenants.values()
+                if state.waiters and state.in_flight < state.max_in_flight
+            ]
+            if not ready:
+                return
+            # Ties go to the tenant whose oldest run has waited longest
+            state = min(ready, key=lambda state: (self._share(state, now), state.waiters[0][0]))
+            _, future = state.waiters.popleft()
+            if not future.done():
+                self._grant(state)
+                future.set_result(None)
+
+    async def acquire(self, tenant=None):
+        """Wait until a sandbox slot is granted to the tenant."""
+        tenant = tenant or DEFAULT_TENANT
+        state = self._tenant(tenant)
+        future = asyncio.get_running_loop().create_future()
+        waiter = (next(self._sequence), future)
+        state.waiters.append(waiter)
+        # Grants the slot straight away when one is free and nobody is ahead
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was granted just as the run was cancelled
+                self.release(tenant, 0)
+            elif waiter in state.waiters:
+                state.waiters.remove(waiter)
+            raise
+
+    def release(self, tenant=None, elapsed=0):
+        """
+        Give a slot back and charge the tenant for the time it was used.
+
+        Args:
+            tenant (str, optional): Tenant the slot was granted to
+            elapsed (float, optional): Seconds the run held the slot
+        """
+        tenant = tenant or DEFAULT_TENANT
+        state = self._tenants[tenant]
+        self._decay(state, time.monotonic())
+        state.usage += elapsed
+        state.in_flight -= 1
+        state.completed += 1
+        self.in_flight -= 1
+        # Forget tenants that have gone quiet
+        if not state.in_flight and not state.waiters and state.usage < 0.01:
+            del self._tenants[tenant]
+        self._dispatch()
+
+    def stats(self):
+        """Return in-flight, waiting and recent usage figures per tenant."""
+        now = time.monotonic()
+        tenants = {}
+        for tenant, state in self._tenants.items():
+            self._decay(state, now)
+            tenants[tenant] = {
+                'in_flight': state.in_flight,
+                'waiting': len(state.waiters),
+                'completed': state.completed,
+                'usage': round(state.usage, 3),
+                'weight': state.weight,
+            }
+        return tenants
@@ -0,0 +1,154 @@
+"""
+Sharded grading of code submissions.
+
+A submission to a question with more than ``EXECUTION_GRADING_SHARD_SIZE``
+test cases is not graded in one sandbox: its test cases are split into
+shards that run as a Celery chord, one ``grade_shard`` task per shard, so
+the shards land on different execution workers and time-to-verdict shrinks
+with the number of workers. The chord's callback merges the shards' verdicts,
+in test case order, into the CodeSubmission.
+
+When grading stops on the first failure, every shard runs under an
+execution_id derived from the grading run, and the first shard with a test
+case that did not pass cancels the others (see ``execution.coalesce``):
+queued shards never start and running ones have their sandbox killed. Test
+cases of cancelled shards get the verdict ``skipped``.
+"""
+import hashlib
+import json
+import math
+import uuid
+from django.conf import settings
+from django.db.models.functions import MD5
+from assessments.models import TestCase
+from .batch import compile_error_results
+from .test_case_cache import get_test_case_cache
+
+
+def test_case_version(question_id):
+    """Identify the current content of a question's test cases, without loading them."""
+    # The database hashes the inputs and expected outputs, so only the digests come back;
+    # unlike timestamps they also catch queryset updates and edits outside Django
+    rows = TestCase.objects.filter(question_id=question_id).order_by('created_at', 'id').values_list(
+        'id', 'is_hidden', 'comparison_mode', 'abs_tolerance', 'rel_tolerance', 'checker',
+        MD5('input_data'), MD5('expected_output'),
+    )
+    digest = hashlib.sha256()
+    for row in rows:
+        digest.update(json.dumps(row, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def query_test_cases(question_id):
+    """Load the test cases of a question from the database."""
+    return [
+        {
+            'id': str(test_case.id),
+            'input_data': test_case.input_data,
+            'expected_output': test_case.expected_output,
+            'hidden': test_case.is_hidden,
+            'comparison': {
+                'mode': test_case.comparison_mode,
+                'abs_tol': test_case.abs_tolerance,
+                'rel_tol': test_case.rel_tolerance,
+                'checker': test_case.checker or None,
+            },
+        }
+        for test_case in TestCase.objects.filter(question_id=question_id).order_by('created_at', 'id')
+    ]
+
+
+def load_test_cases(question_id, version=None):
+    """
+    Return the test cases of a question in the form ``execute_code`` takes.
+
+    They come from the worker's test case cache unless they changed since
+    they were cached; the returned list is shared and must not be modified.
+    Callers that already looked up the ``test_case_version`` pass it in.
+    """
+    if not settings.EXECUTION_TEST_CASE_CACHE:
+        return query_test_cases(question_id)
+    cache = get_test_case_cache()
+    if version is None:
+        version = test_case_version(question_id)
+    test_cases = cache.get(question_id, version)
+    if test_cases is None:
+        test_cases = query_test_cases(question_id)
+        cache.put(question_id, version, test_cases)
+    return test_cases
+
+
+def shard_test_cases(test_cases, shard_size, max_shards):
+    """
+    Split test cases into contiguous shards of about the same size.
+
+    Args:
+        test_cases (list): Test cases to split
+        shard_size (int): Most test cases per shard; 0 keeps them in one shard
+        max_shards (int): Most shards; shards grow beyond ``shard_size`` to stay under it
+
+    Returns:
+        list: Lists of test cases, in order
+    """
+    if shard_size <= 0 or len(test_cases) <= shard_size:
+        return [test_cases]
+    count = min(math.ceil(len(test_cases) / shard_size), max(max_shards, 1))
+    size, extra = divmod(len(test_cases), count)
+    shards, start = [], 0
+    for index in range(count):
+        end = start + size + (1 if index < extra else 0)
+        shards.append(test_cases[start:end])
+        start = end
+    return shards
+
+
+def shard_execution_ids(grading_id, count):
+    """Derive the execution_id of each shard of a grading run."""
+    return [str(uuid.uuid5(uuid.UUID(grading_id), str(index))) for index in range(count)]
+
+
+def shard_result(result, test_cases):
+    """
+    Reduce a shard's ``execute_code`` result to what the merge needs.
+
+    Shards that were cancelled or failed before running get a result per
+    test case too, so the merged verdicts line up with the test cases.
+    """
+    test_results = result.get('test_results')
+    if not test_results:
+        if result['status'] == 'cancelled':
+            test_results = [{**entry, 'verdict': 'skipped'} for entry in compile_error_results(test_cases, '')]
+        else:
+            test_results = compile_error_results(test_cases, result.get('error', ''))
+    return {
+        'status': result['status'],
+        'execution_time': float(result.get('execution_time') or 0),
+        'cpu_time': float(result.get('cpu_time') or 0),
+        'memory_usage': result.get('memory_usage') or 0,
+        'test_results': test_results,
+    }
+
+
+def merge_shard_results(shard_results):
+    """
+    Combine the results of a grading run's shards, given in shard order.
+
+    Returns:
+        dict: Status, summed execution and CPU time, peak memory and every test case's result
+    """
+    statuses = {result['status'] for result in shard_results}
+    if 'failed' in statuses:
+        status = 'failed'
+    elif 'compile_error' in statuses:
+        # Every shard runs the same program, so one that did not compile means none did
+        status = 'compile_error'
+    else:
+        # Shards cancelled by an early stop still make a completed grading run
+        status = 'completed'
+    return {
+        'status': status,
+        'execution_time': sum(result['execution_time'] for result in shard_results),
+        'cpu_time': sum(result['cpu_time'] for result in shard_results),
+        'memory_usage': max((result['memory_usage'] for result in shard_results), default=0),
+        'test_results': [entry for result in shard_results for entry in result['test_results']],
+    }
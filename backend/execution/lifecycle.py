@@ -0,0 +1,139 @@
+"""
+Lifecycle bookkeeping for execution runs.
+
+A run goes from pending (queued) to running to a final status. The
+intermediate state and the sandbox container a run is using live in the
+Django cache (Redis when configured) for ``EXECUTION_STATE_TTL`` seconds;
+the database only sees one upsert of the run's ExecutionResult, when the
+run finishes. Every transition is also published as a progress event.
+
+A run queued for a user records them as its owner for as long, which is
+who may follow its events besides staff.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from .events import publish_event
+from .models import ExecutionResult
+
+STATUS_KEY_PREFIX = 'execution:status:'
+CONTAINER_KEY_PREFIX = 'execution:container:'
+OWNER_KEY_PREFIX = 'execution:owner:'
+PRIVATE_OUTPUT_KEY_PREFIX = 'execution:private-output:'
+
+# Written on every final save, so re-running an execution_id replaces its result
+RESULT_FIELDS = [
+    'status', 'stdout', 'stderr', 'stdout_archive', 'stderr_archive',
+    'execution_time', 'cpu_time', 'memory_usage', 'is_cached', 'updated_at',
+]
+
+# Fields of a finished run sent with its ``completed`` event
+SUMMARY_FIELDS = ['status', 'stdout', 'stderr', 'execution_time', 'cpu_time', 'memory_usage', 'is_cached']
+
+# Progress events announcing in-progress statuses
+STATUS_EVENTS = {'pending': 'queued', 'running': 'running'}
+
+
+def set_status(execution_id, status):
+    """Record the current status of a run that is still in progress."""
+    cache.set(STATUS_KEY_PREFIX + str(execution_id), status, timeout=settings.EXECUTION_STATE_TTL)
+    if status in STATUS_EVENTS:
+        publish_event(execution_id, STATUS_EVENTS[status])
+
+
+def get_status(execution_id):
+    """
+    Get the current status of a run.
+
+    Args:
+        execution_id (str): ID of the run
+
+    Returns:
+        str: Status of the run, or None if it is unknown
+    """
+    status = cache.get(STATUS_KEY_PREFIX + str(execution_id))
+    if status is None:
+        status = ExecutionResult.objects.filter(execution_id=execution_id).values_list('status', flat=True).first()
+    return status
+
+
+def get_result(execution_id):
+    """Return the saved summary of a finished run as a dict, or None."""
+    result = ExecutionResult.objects.filter(execution_id=execution_id).values(*SUMMARY_FIELDS).first()
+    if result is not None:
+        result['execution_time'] = float(result['execution_time']) if result['execution_time'] is not None else None
+        result['cpu_time'] = float(result['cpu_time']) if result['cpu_time'] is not None else None
+    return result
+
+
+def set_owner(execution_id, user_id):
+    """Record the user a run was queued for."""
+    cache.set(OWNER_KEY_PREFIX + str(execution_id), str(user_id), timeout=settings.EXECUTION_STATE_TTL)
+
+
+def get_owner(execution_id):
+    """Return the ID of the user a run was queued for, or None."""
+    return cache.get(OWNER_KEY_PREFIX + str(execution_id))
+
+
+def has_private_output(execution_id):
+    """Whether a run's saved output belongs to a hidden test case, and so stays out of its events."""
+    return bool(cache.get(PRIVATE_OUTPUT_KEY_PREFIX + str(execution_id)))
+
+
+def track_container(container_id, execution_id, language, status):
+    """Record which run a sandbox container is serving and what state it is in."""
+    cache.set(CONTAINER_KEY_PREFIX + container_id, {
+        'container_id': container_id,
+        'execution_id': str(execution_id),
+        'language': language,
+        'status': status,
+    }, timeout=settings.EXECUTION_STATE_TTL)
+
+
+def get_container(container_id):
+    """Return the tracked state of a sandbox container, or None."""
+    return cache.get(CONTAINER_KEY_PREFIX + container_id)
+
+
+def save_result(execution_id, status, stdout='', stderr='', stdout_archive=None, stderr_archive=None,
+                execution_time=None, cpu_time=None, memory_usage=None, is_cached=False, private_output=False):
+    """
+    Write the final result of a run in a single statement.
+
+    Args:
+        execution_id (str): ID of the run
+        status (str): Final status
+        stdout (str, optional): Captured standard output
+        stderr (str, optional): Captured standard error
+        stdout_archive (bytes, optional): Gzip of the full stdout
+        stderr_archive (bytes, optional): Gzip of the full stderr
+        execution_time (float, optional): Wall time in seconds
+        cpu_time (float, optional): CPU time in seconds
+        memory_usage (int, optional): Peak memory in KB
+        is_cached (bool, optional): Whether the result came from the result cache
+        private_output (bool, optional): Keep stdout and stderr out of the ``completed``
+            event, as they are a hidden test case's
+    """
+    ExecutionResult.objects.bulk_create([
+        ExecutionResult(
+            execution_id=execution_id,
+            status=status,
+            stdout=stdout,
+            stderr=stderr,
+            stdout_archive=stdout_archive,
+            stderr_archive=stderr_archive,
+            execution_time=execution_time,
+            cpu_time=cpu_time,
+            memory_usage=memory_usage,
+            is_cached=is_cached,
+        )
+    ], update_conflicts=True, unique_fields=['execution_id'], update_fields=RESULT_FIELDS)
+    if private_output:
+        cache.set(PRIVATE_OUTPUT_KEY_PREFIX + str(execution_id), True, timeout=settings.EXECUTION_STATE_TTL)
+        stdout = stderr = ''
+    set_status(execution_id, status)
+    publish_event(
+        execution_id, 'completed',
+        status=status, stdout=stdout, stderr=stderr, execution_time=execution_time,
+        cpu_time=cpu_time, memory_usage=memory_usage, is_cached=is_cached,
+    )
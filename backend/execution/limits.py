@@ -0,0 +1,152 @@
+"""
+Per-question time limits calibrated from a reference solution.
+
+Every language has one fixed ``timeout`` in LANGUAGE_CONFIGS, generous enough
+for the slowest acceptable solution to the hardest question, so a solution
+that is too slow for an easy question holds its sandbox for the full timeout
+on every test case. A coding question with a ``reference_solution`` gets its
+own limits instead:
+
+- ``calibrate_time_limits`` runs the reference solution against the
+  question's test cases ``EXECUTION_CALIBRATION_RUNS`` times and takes the
+  median of its slowest test case
+- each language's limit is that runtime times ``EXECUTION_TIME_LIMIT_MULTIPLIER``,
+  scaled by how much slower the language is than the reference's
+  (``EXECUTION_TIME_LIMIT_LANGUAGE_FACTORS``), and kept between
+  ``EXECUTION_TIME_LIMIT_MIN`` and the language's own timeout
+- a calibration is keyed by the reference solution and the test case version
+  (see ``execution.grading``), so changing either makes grading fall back to
+  the language timeout and queue a recalibration
+
+Limits bound each test case's run; compilation keeps the language's timeout.
+"""
+import hashlib
+import math
+import statistics
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .models import TimeLimitCalibration
+from .nodes import dispatch_queue
+
+CALIBRATION_KEY_PREFIX = 'execution:time-limits:'
+CALIBRATING_KEY_PREFIX = 'execution:calibrating:'
+
+# Changing how limits are derived changes every calibration key
+CALIBRATION_VERSION = '1'
+
+
+def calibration_key(reference_solution, reference_language, test_case_version):
+    """
+    Identify what a question's time limits are calibrated on.
+
+    Args:
+        reference_solution (str): Source code of the reference solution
+        reference_language (str): Its programming language
+        test_case_version (str): Result of ``test_case_version`` for the question
+
+    Returns:
+        str: Hex digest of the calibration inputs
+    """
+    digest = hashlib.sha256()
+    for part in (CALIBRATION_VERSION, reference_language, test_case_version, reference_solution):
+        data = (part or '').encode('utf-8')
+        digest.update(len(data).to_bytes(8, 'big'))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def reference_runtime(runs):
+    """
+    Measure a reference solution from its calibration runs.
+
+    Args:
+        runs (list): Per-test-case results of each run
+
+    Returns:
+        float: Median over the runs of the slowest test case's seconds
+    """
+    return statistics.median(max(entry['execution_time'] for entry in test_results) for test_results in runs)
+
+
+def calibrated_limits(runtime, reference_language, language_timeouts):
+    """
+    Derive every language's time limit from the reference solution's runtime.
+
+    Args:
+        runtime (float): Result of ``reference_runtime``
+        reference_language (str): Language of the reference solution
+        language_timeouts (dict): Language to its fixed timeout, which no limit exceeds
+
+    Returns:
+        dict: Language to its per-test-case time limit in seconds
+    """
+    factors = settings.EXECUTION_TIME_LIMIT_LANGUAGE_FACTORS
+    reference_factor = factors.get(reference_language, 1.0)
+    limits = {}
+    for language, timeout in language_timeouts.items():
+        scaled = runtime * settings.EXECUTION_TIME_LIMIT_MULTIPLIER * factors.get(language, 1.0) / reference_factor
+        # Tenths of a second, rounded up past floating point noise
+        limit = max(math.ceil(round(scaled * 10, 6)) / 10, settings.EXECUTION_TIME_LIMIT_MIN)
+        limits[language] = min(limit, timeout)
+    return limits
+
+
+def save_calibration(question_id, key, test_case_version, reference_language, status, runtime=None,
+                     time_limits=None, error=''):
+    """Store the outcome of calibrating a question's time limits."""
+    TimeLimitCalibration.objects.update_or_create(question_id=question_id, defaults={
+        'calibration_key': key,
+        'test_case_version': test_case_version,
+        'status': status,
+        'reference_language': reference_language,
+        'reference_runtime': runtime,
+        'time_limits': time_limits or {},
+        'error': error,
+    })
+    cache.delete(CALIBRATION_KEY_PREFIX + str(question_id))
+
+
+def _schedule_calibration(question_id, key, language):
+    from .tasks import calibrate_time_limits
+
+    # One calibration per change, however many submissions are graded meanwhile
+    if cache.add(CALIBRATING_KEY_PREFIX + key, 1, timeout=settings.EXECUTION_CALIBRATION_LOCK_TTL):
+        transaction.on_commit(lambda: calibrate_time_limits.apply_async(
+            (question_id,), queue=dispatch_queue(language, 'rejudge'),
+        ))
+
+
+def get_time_limit(question, language, test_case_version):
+    """
+    Return a question's calibrated time limit for a language.
+
+    A question without a current calibration gets one queued.
+
+    Args:
+        question (Question): The question being graded
+        language (str): Language of the submission
+        test_case_version (str): Result of ``test_case_version`` for the question
+
+    Returns:
+        float: Per-test-case time limit in seconds, or None to use the language's timeout
+    """
+    if not settings.EXECUTION_TIME_LIMITS or not question.reference_solution:
+        return None
+    question_id = str(question.id)
+    key = calibration_key(question.reference_solution, question.reference_language, test_case_version)
+
+    calibration = cache.get(CALIBRATION_KEY_PREFIX + question_id)
+    if calibration is None or calibration['calibration_key'] != key:
+        calibration = TimeLimitCalibration.objects.filter(question_id=question_id).values(
+            'calibration_key', 'status', 'time_limits'
+        ).first()
+        if calibration is None or calibration['calibration_key'] != key:
+            # Limits of other test cases or another reference solution may be too tight
+            _schedule_calibration(question_id, key, question.reference_language)
+            return None
+        cache.set(CALIBRATION_KEY_PREFIX + question_id, calibration, timeout=None)
+
+    if calibration['status'] != 'calibrated':
+        return None
+    return calibration['time_limits'].get(language)
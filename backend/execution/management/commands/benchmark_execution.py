@@ -0,0 +1,275 @@
+"""
+Benchmark the execution path against a fake Docker daemon.
+
+Sandboxes come from a FakeDockerClient, an in-memory stand-in for the Docker
+SDK that sleeps for configurable start, wait, logs and stats latencies and
+answers the batch runner with well-formed output files.
+"""
+import hashlib
+import io
+import json
+import tarfile
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+from unittest import mock
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from execution import tasks
+from execution.batch import CASES_DIR, RUNNER_NAME, output_dir
+from execution.benchmark import benchmark_execution, benchmark_plagiarism
+from execution.pool import SCRATCH_DIR, WORKSPACE_DIR, ContainerPool, reset_command
+from execution.sandbox import DockerSandbox, DockerSandboxBackend
+
+# Seconds the fake Docker daemon takes per operation
+DEFAULT_LATENCIES = {
+    'start': 0.5,  # Starting a container
+    'wait': 0.05,  # Running one test case
+    'compile': 1.0,  # Running a compile command
+    'logs': 0.005,  # Streaming exec output or reading an archive
+    'stats': 0.002,  # Inspecting an exec or an image
+}
+
+
+class FakeContainer:
+    """In-memory container whose workspace is a dict of file contents."""
+
+    def __init__(self, client, image):
+        self.client = client
+        self.image = image
+        self.id = uuid.uuid4().hex
+        self.files = {}
+        self.removed = False
+
+    def extract(self, directory, data):
+        """Unpack a tar archive below a directory, like ``tar -x -C``."""
+        with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+            for member in tar.getmembers():
+                if member.isfile():
+                    self.files[f"{directory.rstrip('/')}/{member.name}"] = tar.extractfile(member).read()
+
+    def archive(self, directory, name):
+        """Pack a directory into a tar archive, like ``tar -c -C``."""
+        self.client.sleep('logs')
+        path = f"{directory.rstrip('/')}/{name}"
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w') as tar:
+            for file_name, data in sorted(self.files.items()):
+                if file_name.startswith(path + '/'):
+                    info = tarfile.TarInfo(name + file_name[len(path):])
+                    info.size = len(data)
+                    tar.addfile(info, io.BytesIO(data))
+        return buffer.getvalue()
+
+    def exec_run(self, cmd, user=''):
+        if cmd[-1] == reset_command(settings.EXECUTION_SANDBOX_USER):
+            self.files = {name: data for name, data in self.files.items() if not name.startswith(SCRATCH_DIR + '/')}
+        return 0, b''
+
+    def remove(self, force=False):
+        self.removed = True
+
+    def run_command(self, command):
+        """Simulate a shell command; returns (exit code, stdout, stderr)."""
+        if RUNNER_NAME in command:
+            self._run_batch()
+        elif f"mkdir -p {tasks.BUILD_DIR}" in command:
+            self.client.sleep('compile')
+            self.files[f"{WORKSPACE_DIR}/{tasks.BUILD_DIR}/program"] = b'\x7fELF'
+        return 0, b'', b''
+
+    def _run_batch(self):
+        # Every program echoes its input, so test cases expecting their input pass
+        cases_dir = f"{WORKSPACE_DIR}/{CASES_DIR}/"
+        results_dir = output_dir(WORKSPACE_DIR)
+        count = sum(1 for name in self.files if name.startswith(cases_dir))
+        wait = self.client.latencies['wait']
+        for index in range(count):
+            started = time.time()
+            self.client.sleep('wait')
+            self.files[f"{results_dir}/{index}.out"] = self.files[f"{cases_dir}{index}.in"]
+            self.files[f"{results_dir}/{index}.err"] = b''
+            self.files[f"{results_dir}/{index}.times"] = (
+                "0m0.000s 0m0.000s\n0m0.000s 0m0.000s\n"
+                f"0m0.000s 0m0.000s\n0m{wait * 0.8:.3f}s 0m0.000s\n"
+            ).encode()
+            self.files[f"{results_dir}/{index}.meta"] = f"0 {started:.3f} {time.time():.3f} 8192\n".encode()
+
+
+class FakeContainerCollection:
+    def __init__(self, client):
+        self.client = client
+        self._containers = {}
+
+    def run(self, image, **kwargs):
+        self.client.sleep('start')
+        container = FakeContainer(self.client, image)
+        self._containers[container.id] = container
+        return container
+
+    def get(self, container_id):
+        return self._containers[container_id]
+
+
+class FakeImageCollection:
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, image):
+        self.client.sleep('stats')
+        return SimpleNamespace(id='sha256:' + hashlib.sha256(image.encode('utf-8')).hexdigest())
+
+
+class FakeUploadSocket:
+    """Attached stdin of a ``tar -x`` exec; the archive is unpacked once stdin is closed."""
+
+    def __init__(self, container, directory):
+        self.container = container
+        self.directory = directory
+        self.buffer = io.BytesIO()
+
+    def sendall(self, data):
+        self.buffer.write(data)
+
+    def shutdown(self, how):
+        self.container.extract(self.directory, self.buffer.getvalue())
+
+    def recv(self, size):
+        return b''
+
+    def close(self):
+        pass
+
+
+class FakeAPIClient:
+    """Low-level exec API used by DockerSandbox and PooledContainer."""
+
+    def __init__(self, client):
+        self.client = client
+        self._execs = {}
+        self._lock = threading.Lock()
+
+    def exec_create(self, container_id, cmd, stdin=False, user=''):
+        exec_id = uuid.uuid4().hex
+        with self._lock:
+            self._execs[exec_id] = {'container': self.client.containers.get(container_id), 'cmd': cmd}
+        return {'Id': exec_id}
+
+    def exec_start(self, exec_id, stream=True, demux=True, socket=False):
+        execution = self._execs[exec_id]
+        container, cmd = execution['container'], execution['cmd']
+        execution['exit_code'] = 0
+        if cmd[:2] == ['tar', '-x']:
+            return FakeUploadSocket(container, cmd[3])
+        if cmd[:2] == ['tar', '-c']:
+            return iter([(container.archive(cmd[3], cmd[4]), None)])
+        execution['exit_code'], stdout, stderr = container.run_command(cmd[-1])
+        self.client.sleep('logs')
+        return iter([(stdout, stderr)])
+
+    def exec_inspect(self, exec_id):
+        self.client.sleep('stats')
+        with self._lock:
+            return {'ExitCode': self._execs.pop(exec_id)['exit_code']}
+
+
+class FakeDockerClient:
+    """Stand-in for ``docker.DockerClient`` with simulated latencies."""
+
+    def __init__(self, latencies=None):
+        self.latencies = {**DEFAULT_LATENCIES, **(latencies or {})}
+        self.containers = FakeContainerCollection(self)
+        self.images = FakeImageCollection(self)
+        self.api = FakeAPIClient(self)
+
+    def sleep(self, operation):
+        delay = self.latencies[operation]
+        if delay > 0:
+            time.sleep(delay)
+
+
+class FakeDockerSandboxBackend(DockerSandboxBackend):
+    """Docker backend driving a FakeDockerClient through its own container pools."""
+
+    name = 'fake-docker'
+
+    def __init__(self, latencies=None, pool_size=4):
+        super().__init__()
+        self._client = FakeDockerClient(latencies)
+        self.pool_size = pool_size
+        self._pools = {}
+        self._pools_lock = threading.Lock()
+
+    def acquire(self, language, lang_config):
+        with self._pools_lock:
+            pool = self._pools.get(language)
+            if pool is None:
+                pool = self._pools[language] = ContainerPool(
+                    self.client, language, lang_config, min_size=0, max_size=self.pool_size
+                )
+        return DockerSandbox(pool, pool.acquire())
+
+
+def benchmark_fake_docker(workload=None, runs=100, concurrency=8, latencies=None, seed=0):
+    """Replay a workload through ``execute_code`` against a fake Docker daemon; see ``benchmark_execution``."""
+    backend = FakeDockerSandboxBackend(latencies, pool_size=concurrency)
+    with mock.patch.object(tasks, 'get_sandbox_backend', return_value=backend):
+        return benchmark_execution(workload, runs, concurrency, seed)
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a synthetic workload through execute_code and check_plagiarism with a fake "
+        "Docker daemon and report runs/sec, latency percentiles and DB queries per run. "
+        "Runs against a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=200, help="Number of execute_code runs")
+        parser.add_argument('--concurrency', type=int, default=16, help="Runs in flight at once")
+        parser.add_argument('--submissions', type=int, default=50,
+                            help="Submissions compared by check_plagiarism; 0 skips it")
+        parser.add_argument('--workload', help="JSON file overriding the default workload")
+        parser.add_argument('--latency', action='append', default=[], metavar='OPERATION=SECONDS',
+                            help=f"Fake Docker latency, one of {', '.join(DEFAULT_LATENCIES)}")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+
+    def handle(self, *args, **options):
+        workload = None
+        if options['workload']:
+            with open(options['workload']) as f:
+                workload = json.load(f)
+        latencies = {}
+        for item in options['latency']:
+            operation, _, seconds = item.partition('=')
+            if operation not in DEFAULT_LATENCIES:
+                raise CommandError(f"Unknown latency: {operation}")
+            latencies[operation] = float(seconds)
+
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            report = {
+                'execute_code': benchmark_fake_docker(
+                    workload, options['runs'], options['concurrency'], latencies, options['seed']
+                ),
+            }
+            if options['submissions']:
+                report['check_plagiarism'] = benchmark_plagiarism(
+                    workload, options['submissions'], seed=options['seed']
+                )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for name, result in report.items():
+            latency = result['latency']
+            self.stdout.write(
+                f"{name}: {result['runs']} runs ({result['failed']} failed) in {result['seconds']}s, "
+                f"{result['runs_per_second']} runs/sec, p50 {latency['p50']}s p95 {latency['p95']}s "
+                f"p99 {latency['p99']}s, {result['queries_per_run']} queries/run"
+            )
@@ -0,0 +1,31 @@
+"""
+Remove orphaned sandbox containers from this host's Docker daemon.
+"""
+import json
+from django.core.management.base import BaseCommand
+from execution.reaper import get_reaper_report, reap_orphaned_sandboxes
+
+
+class Command(BaseCommand):
+    help = (
+        "Kill and remove pooled sandbox containers whose worker is gone, and mark "
+        "the tracked state of the removed containers as removed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--report', action='store_true', help="Print this host's latest sweep counts without sweeping")
+        parser.add_argument('--json', action='store_true', help="Print the counts as JSON")
+
+    def handle(self, *args, **options):
+        report = get_reaper_report() if options['report'] else reap_orphaned_sandboxes()
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        elif report is None:
+            self.stdout.write("No sweep has run yet")
+        else:
+            self.stdout.write(
+                f"{report['checked']} checked, {report['orphaned']} orphaned, {report['killed']} killed, "
+                f"{report['removed']} removed, {report['space_reclaimed']} bytes reclaimed, "
+                f"{report['records_updated']} records closed in {report['seconds']}s"
+            )
@@ -0,0 +1,32 @@
+"""
+Pull, pin and warm up the sandbox images of every configured language.
+"""
+import json
+from django.core.management.base import BaseCommand, CommandError
+from execution.tasks import LANGUAGE_CONFIGS
+from execution.warmup import warm_up
+
+
+class Command(BaseCommand):
+    help = (
+        "Pull the sandbox image of each language, pin it to the digest it resolved to, "
+        "start its sandbox pool and run a trivial program in it. Fails unless every language is ready."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--language', action='append', choices=list(LANGUAGE_CONFIGS),
+                            help="Language to warm up (repeatable); defaults to all")
+        parser.add_argument('--no-pull', action='store_true', help="Use local images without pulling")
+        parser.add_argument('--json', action='store_true', help="Print the readiness report as JSON")
+
+    def handle(self, *args, **options):
+        readiness = warm_up(options['language'], pull=not options['no_pull'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(readiness, indent=2))
+        else:
+            for language, entry in readiness['languages'].items():
+                status = 'ready' if entry['ready'] else f"FAILED: {entry['error']}"
+                self.stdout.write(f"{language}: {entry['image']} {entry['digest'] or '-'} {entry['seconds']}s {status}")
+        if not readiness['ready']:
+            raise CommandError("Some sandbox images are not ready")
@@ -16,11 +16,17 @@ class ExecutionResult(models.Model):
         ('completed', 'Completed'),
         ('failed', 'Failed'),
         ('timeout', 'Timeout'),
+        ('cancelled', 'Cancelled'),
+        ('compile_error', 'Compile error'),
     ], default='pending')
     stdout = models.TextField(blank=True)
     stderr = models.TextField(blank=True)
+    stdout_archive = models.BinaryField(null=True, blank=True, help_text="Gzip of the full stdout when EXECUTION_OUTPUT_GZIP is on")
+    stderr_archive = models.BinaryField(null=True, blank=True, help_text="Gzip of the full stderr when EXECUTION_OUTPUT_GZIP is on")
     execution_time = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    cpu_time = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, help_text="User plus system CPU seconds")
     memory_usage = models.PositiveIntegerField(null=True, blank=True)
+    is_cached = models.BooleanField(default=False, help_text="Served from the result cache without running a sandbox")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -44,6 +50,46 @@ class PlagiarismResult(models.Model):
         return f"Plagiarism result for {self.code_submission_id} - {self.plagiarism_score}%"
 
 
+class StaticAnalysisResult(models.Model):
+    """Model to store static analysis findings for code submissions."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    code_submission_id = models.UUIDField(unique=True)
+    code_hash = models.CharField(max_length=64, db_index=True, help_text="Analysis cache key of the analysed code")
+    language = models.CharField(max_length=50)
+    lint_score = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True, help_text="pylint score out of 10")
+    lint_messages = models.JSONField(default=list)
+    security_issues = models.JSONField(default=list)
+    complexity = models.JSONField(default=dict, help_text="Cyclomatic complexity of each function")
+    max_complexity = models.PositiveIntegerField(null=True, blank=True)
+    errors = models.JSONField(default=dict, help_text="Analysis tools that failed, with their error")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Static analysis of {self.code_submission_id} - {self.lint_score}/10"
+
+
+class TimeLimitCalibration(models.Model):
+    """Model to store time limits calibrated from a question's reference solution."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    question_id = models.UUIDField(unique=True)
+    calibration_key = models.CharField(max_length=64, help_text="Hash of the reference solution and test case version it was calibrated on")
+    test_case_version = models.CharField(max_length=64)
+    status = models.CharField(max_length=20, choices=[
+        ('calibrated', 'Calibrated'),
+        ('failed', 'Failed'),
+    ])
+    reference_language = models.CharField(max_length=50)
+    reference_runtime = models.FloatField(null=True, blank=True, help_text="Seconds of the reference solution's slowest test case")
+    time_limits = models.JSONField(default=dict, help_text="Per-test-case time limit in seconds for each language")
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Time limits of {self.question_id} - {self.status}"
+
+
 class SimilarSubmission(models.Model):
     """Model to store similar submissions found during plagiarism detection."""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -78,22 +124,3 @@ class ExternalSource(models.Model):
     
     def __str__(self):
         return f"External source for {self.plagiarism_result.code_submission_id} - {self.similarity_score}%"
-
-
-class SandboxContainer(models.Model):
-    """Model to track Docker containers used for code execution."""
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    container_id = models.CharField(max_length=64)
-    execution_id = models.UUIDField()
-    language = models.CharField(max_length=50)
-    status = models.CharField(max_length=20, choices=[
-        ('created', 'Created'),
-        ('running', 'Running'),
-        ('exited', 'Exited'),
-        ('removed', 'Removed'),
-    ])
-    created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
-    
-    def __str__(self):
-        return f"Container {self.container_id} for execution {self.execution_id}" 
\ No newline at end of file
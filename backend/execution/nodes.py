@@ -0,0 +1,261 @@
+"""
+Language-sharded execution nodes.
+
+An execution node serves the languages in ``EXECUTION_NODE_LANGUAGES`` (all
+of LANGUAGE_CONFIGS when empty), so C++ and Java boxes can be scaled apart
+from Python boxes and only pull and warm their own images. With
+``EXECUTION_LANGUAGE_QUEUES``, every lane queue gets one queue per language,
+``<lane queue>.<language>``, e.g. ``execution.grading.cpp``:
+
+- a node consumes the language queues of the lanes it serves; a node serving
+  every language also consumes the plain lane queues
+- every process that runs sandboxes advertises its warm languages and its
+  capacity (sandbox sessions it runs at once and in flight) in a heartbeat
+  kept in the Django cache for ``EXECUTION_NODE_TTL`` seconds
+- runs are dispatched to the language queue of their lane while a live node
+  of that lane advertises that language, and to the plain lane queue
+  otherwise, or while every node of the language is full and a node serving
+  every language has room
+
+Runs of an organisation are also spread over ``EXECUTION_FAIR_QUEUES`` fair
+queues per queue, ``<queue>.fair<n>``, picked by a hash of the organisation,
+e.g. ``execution.grading.cpp.fair3``. Workers consume every fair queue of the
+queues they serve, and the broker hands them out in turn (kombu rotates the
+queues a worker polls), so one organisation's backlog only holds up the
+organisations hashed into the same queue. Grading and rejudge tasks of a
+code submission are routed there too (``route_fair_queue``). Each worker's
+FairScheduler then shares out its sandbox slots between the runs it took.
+"""
+import hashlib
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+from .engine import get_execution_engine
+
+logger = logging.getLogger(__name__)
+
+NODE_KEY_PREFIX = 'execution:node:'
+REGISTRY_KEY = 'execution:nodes'
+NODE_QUEUE_PREFIX = 'execution.node.'
+
+# Queue of housekeeping tasks (execution.tasks.* without a lane)
+HOUSEKEEPING_QUEUE = 'execution'
+
+# Longest wait for another process updating the registry, in seconds
+REGISTRY_LOCK_TIMEOUT = 2
+
+# Tasks grading a code submission, by the lane they run on; callers pass them organization_id
+FAIR_ROUTED_TASKS = {
+    'execution.tasks.grade_submission': 'grading',
+    'execution.tasks.rejudge_submission': 'rejudge',
+}
+
+_heartbeat_pid = None
+
+# Lanes whose queues this worker consumes; None until it subscribes, meaning every lane
+_served_lanes = None
+
+
+def node_languages():
+    """Return the languages this node serves."""
+    from .tasks import LANGUAGE_CONFIGS
+    return [language for language in settings.EXECUTION_NODE_LANGUAGES or LANGUAGE_CONFIGS if language in LANGUAGE_CONFIGS]
+
+
+def serves_language(language):
+    """Whether this node runs programs in a language."""
+    return not settings.EXECUTION_NODE_LANGUAGES or language in settings.EXECUTION_NODE_LANGUAGES
+
+
+def language_queue(lane, language):
+    return f"{settings.EXECUTION_LANES[lane]['queue']}.{language}"
+
+
+def node_queue(host=None):
+    """Return the queue of an execution host (this one by default), for work on its own Docker daemon."""
+    return f"{NODE_QUEUE_PREFIX}{host or socket.gethostname()}"
+
+
+def fair_queue(queue, organization_id):
+    """Return the fair queue of ``queue`` that an organisation's runs go to."""
+    if settings.EXECUTION_FAIR_QUEUES <= 1 or organization_id is None:
+        return queue
+    digest = hashlib.sha256(str(organization_id).encode('utf-8')).digest()
+    return f"{queue}.fair{int.from_bytes(digest[:8], 'big') % settings.EXECUTION_FAIR_QUEUES}"
+
+
+def route_fair_queue(name, args, kwargs, options, task=None, **kw):
+    """
+    Celery router sending the grading tasks of a code submission to its organisation's fair queue.
+
+    The organisation comes from the task's ``organization_id`` argument, so routing costs no
+    query; tasks sent to a queue, or without an organisation, keep their static route.
+    """
+    lane = FAIR_ROUTED_TASKS.get(name)
+    if lane is None or options.get('queue') or settings.EXECUTION_FAIR_QUEUES <= 1:
+        return None
+    organization_id = (kwargs or {}).get('organization_id')
+    if organization_id is None:
+        return None
+    return {'queue': fair_queue(settings.EXECUTION_LANES[lane]['queue'], organization_id)}
+
+
+def subscribe_language_queues(queues, consumed):
+    """
+    Make a worker consume the language queues of the lanes it serves, and the fair queues of all its queues.
+
+    Every execution worker also takes housekeeping tasks and the tasks sent to its host's node queue.
+
+    Args:
+        queues: The worker's ``app.amqp.queues``
+        consumed (list): Names of the queues the worker was started with
+    """
+    global _served_lanes
+    _served_lanes = [lane for lane, config in settings.EXECUTION_LANES.items() if config['queue'] in consumed]
+    queues.select_add(HOUSEKEEPING_QUEUE)
+    queues.select_add(node_queue())
+    if settings.EXECUTION_LANGUAGE_QUEUES:
+        for lane in _served_lanes:
+            config = settings.EXECUTION_LANES[lane]
+            for language in node_languages():
+                queues.select_add(language_queue(lane, language))
+            if settings.EXECUTION_NODE_LANGUAGES:
+                # Runs without a language queue may be in any language
+                queues.deselect(config['queue'])
+    if settings.EXECUTION_FAIR_QUEUES > 1:
+        lane_queues = {config['queue'] for config in settings.EXECUTION_LANES.values()}
+        for queue in list(queues.consume_from):
+            if queue in lane_queues or queue.rsplit('.', 1)[0] in lane_queues:
+                for bucket in range(settings.EXECUTION_FAIR_QUEUES):
+                    queues.select_add(f"{queue}.fair{bucket}")
+
+
+@contextmanager
+def _registry_lock():
+    # cache.add is atomic, so it doubles as a short-lived mutex
+    lock_key = REGISTRY_KEY + ':lock'
+    deadline = time.monotonic() + REGISTRY_LOCK_TIMEOUT
+    while not cache.add(lock_key, 1, timeout=REGISTRY_LOCK_TIMEOUT) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    try:
+        yield
+    finally:
+        cache.delete(lock_key)
+
+
+def report_capacity():
+    """
+    Advertise this process's warm languages and capacity.
+
+    Returns:
+        dict: The advertised node entry
+    """
+    from .warmup import get_readiness
+
+    node_id = f"{socket.gethostname()}:{os.getpid()}"
+    readiness = get_readiness()
+    languages = node_languages()
+    if readiness is not None:
+        # Only languages whose sandboxes warmed up; without a warm-up every served language counts
+        languages = [language for language in languages if readiness['languages'].get(language, {}).get('ready')]
+    engine = get_execution_engine().stats()
+    now = time.time()
+    entry = {
+        'node': node_id,
+        'host': socket.gethostname(),
+        'languages': languages,
+        'all_languages': not settings.EXECUTION_NODE_LANGUAGES,
+        'served_lanes': _served_lanes if _served_lanes is not None else list(settings.EXECUTION_LANES),
+        'capacity': engine['max_concurrency'],
+        'in_flight': engine['in_flight'],
+        'lanes': engine['lanes'],
+        'reported_at': now,
+    }
+    cache.set(NODE_KEY_PREFIX + node_id, entry, timeout=settings.EXECUTION_NODE_TTL)
+
+    registry = cache.get(REGISTRY_KEY) or {}
+    if registry.get(node_id, 0) < now + settings.EXECUTION_NODE_TTL / 2:
+        # Registry entries outlive heartbeats and are renewed well before they lapse,
+        # so the registry is only rewritten every few heartbeats
+        with _registry_lock():
+            registry = {
+                node: expires for node, expires in (cache.get(REGISTRY_KEY) or {}).items() if expires > now
+            }
+            registry[node_id] = now + settings.EXECUTION_NODE_TTL * 2
+            cache.set(REGISTRY_KEY, registry, timeout=None)
+    return entry
+
+
+def _heartbeat():
+    while True:
+        try:
+            report_capacity()
+        except Exception as e:
+            logger.warning(f"Error reporting execution node capacity: {e}")
+        time.sleep(settings.EXECUTION_NODE_HEARTBEAT_INTERVAL)
+
+
+def start_node_heartbeat():
+    """Advertise this process as an execution node until it exits."""
+    # Threads do not survive a fork, so every process starts its own
+    global _heartbeat_pid
+    if _heartbeat_pid == os.getpid():
+        return
+    _heartbeat_pid = os.getpid()
+    threading.Thread(target=_heartbeat, name='execution-node-heartbeat', daemon=True).start()
+
+
+def get_nodes():
+    """Return the entries of every live execution node process."""
+    registry = cache.get(REGISTRY_KEY) or {}
+    return list(cache.get_many([NODE_KEY_PREFIX + node for node in registry]).values())
+
+
+def get_language_capacity():
+    """
+    Sum up the advertised capacity per language.
+
+    Returns:
+        dict: Language to its number of ``nodes``, their ``capacity``, sessions ``in_flight`` and ``free`` slots
+    """
+    capacity = {}
+    for node in get_nodes():
+        for language in node['languages']:
+            entry = capacity.setdefault(language, {'nodes': 0, 'capacity': 0, 'in_flight': 0, 'free': 0})
+            entry['nodes'] += 1
+            entry['capacity'] += node['capacity']
+            entry['in_flight'] += node['in_flight']
+            entry['free'] += max(node['capacity'] - node['in_flight'], 0)
+    return capacity
+
+
+def dispatch_queue(language, lane, organization_id=None):
+    """
+    Pick the queue a run in a language is sent to.
+
+    Args:
+        language (str): The programming language
+        lane (str): Priority lane of the run (see EXECUTION_LANES)
+        organization_id (str, optional): Organisation of the run, which picks its fair queue
+
+    Returns:
+        str: Name of the queue
+    """
+    queue = settings.EXECUTION_LANES[lane]['queue']
+    if not settings.EXECUTION_LANGUAGE_QUEUES:
+        return fair_queue(queue, organization_id)
+    nodes = [node for node in get_nodes() if language in node['languages'] and lane in node['served_lanes']]
+    if not nodes:
+        return fair_queue(queue, organization_id)
+    dedicated = [node for node in nodes if not node['all_languages']]
+    generalists = [node for node in nodes if node['all_languages']]
+    if dedicated and generalists and not any(node['capacity'] > node['in_flight'] for node in dedicated) \
+            and any(node['capacity'] > node['in_flight'] for node in generalists):
+        # The language's own nodes are full; overflow to nodes serving every language
+        return fair_queue(queue, organization_id)
+    return fair_queue(language_queue(lane, language), organization_id)
@@ -0,0 +1,159 @@
+"""
+Bounded capture of program output for the execution service.
+
+Output is consumed as a stream of chunks in a single pass. Each stream keeps
+at most ``EXECUTION_OUTPUT_MAX_BYTES`` bytes in memory plus a count of what
+was dropped, so a program printing in a loop cannot blow up a worker, the
+result backend or the database. The full stream can optionally be kept as a
+gzip archive, compressed as it arrives.
+"""
+import io
+import tarfile
+import zlib
+
+CHUNK_SIZE = 64 * 1024
+
+TRUNCATION_MARKER = '\n... [output truncated: {omitted} more bytes]\n'
+
+# zlib window bits that produce a gzip container
+GZIP_WBITS = 31
+
+
+class CapturedOutput:
+    """The head of one output stream, its total size and optionally a gzip archive of all of it."""
+
+    def __init__(self, limit, compress=False):
+        self.limit = limit
+        self.size = 0
+        self._head = bytearray()
+        self._compressor = zlib.compressobj(wbits=GZIP_WBITS) if compress else None
+        self._archive = bytearray() if compress else None
+        # Result of comparing the whole stream with an expected output, if one was made
+        self.comparison = None
+
+    def write(self, chunk):
+        """Add a chunk of output; bytes past the limit are only counted (and compressed)."""
+        if not chunk:
+            return
+        self.size += len(chunk)
+        room = self.limit - len(self._head)
+        if room > 0:
+            self._head += chunk[:room]
+        if self._compressor is not None:
+            self._archive += self._compressor.compress(chunk)
+
+    def close(self):
+        """Finish the archive; no more chunks may be written afterwards."""
+        if self._compressor is not None:
+            self._archive += self._compressor.flush()
+            self._compressor = None
+        return self
+
+    @property
+    def truncated(self):
+        return self.size > len(self._head)
+
+    @property
+    def head(self):
+        return bytes(self._head)
+
+    def text(self):
+        """Decode the kept output, followed by a marker if anything was dropped."""
+        text = self.head.decode('utf-8', errors='replace')
+        if self.truncated:
+            text += TRUNCATION_MARKER.format(omitted=self.size - len(self._head))
+        return text
+
+    def archive(self):
+        """Return the gzip-compressed full output, or None if compression is off."""
+        return bytes(self._archive) if self._archive is not None else None
+
+
+def capture(chunks, limit, compress=False):
+    """
+    Capture an iterable of byte chunks with a size cap.
+
+    Args:
+        chunks (iterable): Byte chunks of one stream
+        limit (int): Maximum number of bytes to keep
+        compress (bool): Also keep a gzip archive of the full stream
+
+    Returns:
+        CapturedOutput: The captured stream
+    """
+    output = CapturedOutput(limit, compress)
+    for chunk in chunks:
+        output.write(chunk)
+    return output.close()
+
+
+def demux(frames, limit, compress=False):
+    """
+    Split an interleaved stdout/stderr stream in one pass.
+
+    Args:
+        frames (iterable): ``(stdout_chunk, stderr_chunk)`` tuples, either of which
+            may be None, as yielded by Docker's demultiplexed exec stream
+        limit (int): Maximum number of bytes to keep per stream
+        compress (bool): Also keep gzip archives of the full streams
+
+    Returns:
+        tuple: (stdout, stderr) CapturedOutput objects
+    """
+    stdout = CapturedOutput(limit, compress)
+    stderr = CapturedOutput(limit, compress)
+    for stdout_chunk, stderr_chunk in frames:
+        stdout.write(stdout_chunk)
+        stderr.write(stderr_chunk)
+    return stdout.close(), stderr.close()
+
+
+def iter_file(path, chunk_size=CHUNK_SIZE):
+    """Yield the content of a local file in chunks."""
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+class _ChunkReader(io.RawIOBase):
+    """Read-only file object over an iterator of byte chunks."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._pending = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending:
+            try:
+                self._pending = next(self._chunks)
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+def iter_tar_files(chunks, chunk_size=CHUNK_SIZE):
+    """
+    Walk a tar archive as it streams in, without buffering it whole.
+
+    Args:
+        chunks (iterable): Byte chunks of the archive, e.g. from ``get_archive``
+        chunk_size (int): Size of the chunks yielded per file
+
+    Yields:
+        tuple: (member name, iterator of byte chunks) for each regular file; each
+            file's chunks must be consumed before advancing to the next file
+    """
+    with tarfile.open(fileobj=io.BufferedReader(_ChunkReader(chunks)), mode='r|') as tar:
+        for member in tar:
+            if member.isfile():
+                f = tar.extractfile(member)
+                yield member.name, iter(lambda: f.read(chunk_size), b'')
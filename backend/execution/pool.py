@@ -0,0 +1,428 @@
+"""
+Warm sandbox container pool for the execution service.
+
+Pooled containers serve many runs, so they are locked down: the root
+filesystem is read-only and the candidate's files live on tmpfs mounts,
+candidate code runs as the unprivileged ``EXECUTION_SANDBOX_USER`` without
+capabilities, and process count and CPU are capped. Root keeps only the
+capabilities the batch runner needs to start programs as the sandbox user,
+read and kill them and write where they cannot; images need ``setpriv``
+(util-linux) for that. Between runs every process of the sandbox user is
+killed and the tmpfs mounts are wiped.
+"""
+import io
+import logging
+import os
+import socket
+import tarfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from .output import iter_tar_files
+
+logger = logging.getLogger(__name__)
+
+# tmpfs inside pooled containers that holds the candidate's files, next to its zygote
+SCRATCH_DIR = '/sandbox'
+WORKSPACE_DIR = SCRATCH_DIR + '/code'
+
+# Capabilities root keeps in pooled containers; see the module docstring
+ROOT_CAPABILITIES = ['SETUID', 'SETGID', 'KILL', 'DAC_OVERRIDE']
+
+# Ends every process of the sandbox user and removes everything the last run wrote. The
+# container's init and idle process run as root, which the sandbox user cannot signal, so they
+# survive; a zygote exits by itself once its directory is gone.
+RESET_TEMPLATE = (
+    "{unprivileged} sh -c 'kill -9 -1' 2>/dev/null; "
+    f'rm -rf {SCRATCH_DIR}/* {SCRATCH_DIR}/.[!.]* {SCRATCH_DIR}/..?* /tmp/* /tmp/.[!.]* /tmp/..?*'
+)
+
+
+def unprivileged_command(user):
+    """Return the prefix that runs a command from a root exec as the sandbox user, without capabilities."""
+    uid, _, gid = user.partition(':')
+    return f"setpriv --reuid={uid} --regid={gid or uid} --clear-groups"
+
+
+def reset_command(user):
+    """Return the command that clears a pooled container of ``user``'s last run."""
+    return RESET_TEMPLATE.format(unprivileged=unprivileged_command(user))
+
+
+# Bytes read at a time while waiting for an upload to finish
+UPLOAD_CHUNK_SIZE = 4096
+
+# Keeps a pooled container alive while it is idle (works on busybox and coreutils)
+IDLE_COMMAND = 'tail -f /dev/null'
+
+# Labels of pooled containers: the pool's language and the process that owns it
+POOL_LABEL = 'bluapt.pool'
+OWNER_LABEL = 'bluapt.owner'
+
+# Owners refresh this key while they are alive; see execution.reaper
+OWNER_KEY_PREFIX = 'execution:pool-owner:'
+
+
+class PoolExhausted(Exception):
+    """Raised when no pooled container becomes available in time."""
+
+
+class PooledContainer:
+    """A pre-started sandbox container owned by a ContainerPool."""
+
+    def __init__(self, container, language, user=''):
+        self.container = container
+        self.language = language
+        # Every exec runs as this user, except the batch runner's and resets
+        self.user = user
+        self.uses = 0
+        self.created_at = time.monotonic()
+
+    @property
+    def id(self):
+        return self.container.id
+
+    def put_files(self, files, mode=0o666):
+        """
+        Copy files into the container workspace.
+
+        Args:
+            files (dict): Mapping of relative file name to text content
+            mode (int): Permission bits for the copied files
+        """
+        root = os.path.relpath(WORKSPACE_DIR, SCRATCH_DIR)
+        directories = {root}
+        for name in files:
+            parts = name.split('/')[:-1]
+            for depth in range(1, len(parts) + 1):
+                directories.add(f"{root}/{'/'.join(parts[:depth])}")
+
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w') as tar:
+            for path in sorted(directories):
+                directory = tarfile.TarInfo(path)
+                directory.type = tarfile.DIRTYPE
+                directory.mode = 0o777
+                tar.addfile(directory)
+            for name, content in files.items():
+                data = content.encode('utf-8') if isinstance(content, str) else content
+                info = tarfile.TarInfo(f"{root}/{name}")
+                info.size = len(data)
+                info.mode = mode
+                tar.addfile(info, io.BytesIO(data))
+
+        # The archive API cannot write to tmpfs mounts, so tar unpacks the files from stdin
+        api = self.container.client.api
+        exec_id = api.exec_create(self.id, ['tar', '-x', '-C', SCRATCH_DIR], stdin=True, user=self.user)['Id']
+        connection = api.exec_start(exec_id, socket=True)
+        sock = getattr(connection, '_sock', connection)
+        try:
+            sock.sendall(buffer.getvalue())
+            sock.shutdown(socket.SHUT_WR)
+            # The connection closes once tar exits
+            while sock.recv(UPLOAD_CHUNK_SIZE):
+                pass
+        finally:
+            connection.close()
+        exit_code = api.exec_inspect(exec_id)['ExitCode']
+        if exit_code != 0:
+            raise RuntimeError(f"Copying files into container {self.id} failed with exit code {exit_code}")
+
+    def iter_files(self, path):
+        """
+        Stream every regular file below a directory in the container.
+
+        Args:
+            path (str): Absolute directory path inside the container
+
+        Yields:
+            tuple: (file name prefixed by the directory's base name, iterator of byte chunks)
+        """
+        # Like uploads, reads from tmpfs go through tar
+        api = self.container.client.api
+        parent, name = os.path.split(path.rstrip('/'))
+        exec_id = api.exec_create(self.id, ['tar', '-c', '-C', parent or '/', name], user=self.user)['Id']
+        stream = api.exec_start(exec_id, stream=True, demux=True)
+        yield from iter_tar_files(stdout for stdout, _ in stream if stdout)
+
+    def get_files(self, path):
+        """
+        Read every regular file below a directory in the container.
+
+        Args:
+            path (str): Absolute directory path inside the container
+
+        Returns:
+            dict: Mapping of file name (prefixed by the directory's base name) to bytes
+        """
+        return {name: b''.join(chunks) for name, chunks in self.iter_files(path)}
+
+    def reset(self):
+        """End everything a previous run left running and remove every file it wrote."""
+        exit_code, _ = self.container.exec_run(['sh', '-c', reset_command(self.user)], user='root')
+        return exit_code == 0
+
+
+class ContainerPool:
+    """
+    Pool of idle, pre-started sandbox containers for a single language.
+
+    Containers are started with an idle command and candidate code is run
+    inside them with ``exec_run``. A container is recycled once it has
+    served ``max_uses`` runs or whenever a run using it fails.
+    """
+
+    def __init__(self, client, language, lang_config, min_size=1, max_size=4,
+                 max_uses=50, acquire_timeout=30):
+        self.client = client
+        self.language = language
+        self.lang_config = lang_config
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.max_uses = max_uses
+        self.acquire_timeout = acquire_timeout
+        self._idle = deque()
+        self._in_use = 0
+        self._starting = 0
+        self._recycled = 0
+        self._condition = threading.Condition()
+
+    @property
+    def size(self):
+        return len(self._idle) + self._in_use + self._starting
+
+    def _start_container(self):
+        from django.conf import settings
+
+        container = self.client.containers.run(
+            image=self.lang_config['image'],
+            command=IDLE_COMMAND,
+            # Init reaps the processes each reset kills. It and the idle process run as
+            # root; candidate code is exec'd as the sandbox user
+            init=True,
+            user='root',
+            cap_drop=['ALL'],
+            cap_add=ROOT_CAPABILITIES,
+            security_opt=['no-new-privileges'],
+            read_only=True,
+            tmpfs={
+                SCRATCH_DIR: f"rw,exec,nosuid,nodev,size={settings.EXECUTION_SANDBOX_SCRATCH_SIZE},mode=1777",
+                '/tmp': f"rw,noexec,nosuid,nodev,size={settings.EXECUTION_SANDBOX_TMP_SIZE},mode=1777",
+            },
+            mem_limit=self.lang_config['memory_limit'],
+            pids_limit=settings.EXECUTION_SANDBOX_PIDS_LIMIT,
+            nano_cpus=int(settings.EXECUTION_SANDBOX_CPUS * 1e9),
+            network_mode='none',
+            detach=True,
+            labels={POOL_LABEL: self.language, OWNER_LABEL: pool_owner()},
+        )
+        return PooledContainer(container, self.language, settings.EXECUTION_SANDBOX_USER)
+
+    def _destroy(self, pooled):
+        try:
+            pooled.container.remove(force=True)
+        except Exception as e:
+            logger.warning(f"Error removing pooled container {pooled.id}: {e}")
+
+    def fill(self):
+        """Start containers until the pool holds at least ``min_size``."""
+        while True:
+            with self._condition:
+                if self.size >= self.min_size:
+                    return
+                self._starting += 1
+            try:
+                pooled = self._start_container()
+            except Exception as e:
+                logger.exception(f"Error starting pooled {self.language} container: {e}")
+                with self._condition:
+                    self._starting -= 1
+                return
+            with self._condition:
+                self._starting -= 1
+                self._idle.append(pooled)
+                self._condition.notify()
+
+    def acquire(self, timeout=None):
+        """
+        Take an idle container from the pool, starting one if there is room.
+
+        Args:
+            timeout (float, optional): Seconds to wait for a free container
+
+        Returns:
+            PooledContainer: The reserved container
+        """
+        if timeout is None:
+            timeout = self.acquire_timeout
+        deadline = time.monotonic() + timeout
+
+        with self._condition:
+            while True:
+                if self._idle:
+                    self._in_use += 1
+                    return self._idle.popleft()
+                if self.size < self.max_size:
+                    self._starting += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolExhausted(f"No {self.language} sandbox available after {timeout}s")
+                self._condition.wait(remaining)
+
+        try:
+            pooled = self._start_container()
+        except Exception:
+            with self._condition:
+                self._starting -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._starting -= 1
+            self._in_use += 1
+        return pooled
+
+    def release(self, pooled, healthy=True):
+        """
+        Return a container to the pool, recycling it when it is worn out or broken.
+
+        Args:
+            pooled (PooledContainer): Container obtained from ``acquire``
+            healthy (bool): False if the run using the container failed
+
+        Returns:
+            bool: True if the container was recycled instead of reused
+        """
+        pooled.uses += 1
+        recycle = not healthy or pooled.uses >= self.max_uses
+        if not recycle:
+            try:
+                recycle = not pooled.reset()
+            except Exception as e:
+                logger.warning(f"Error resetting pooled container {pooled.id}: {e}")
+                recycle = True
+
+        with self._condition:
+            self._in_use -= 1
+            if recycle:
+                self._recycled += 1
+            else:
+                self._idle.append(pooled)
+            self._condition.notify()
+
+        if recycle:
+            self._destroy(pooled)
+            threading.Thread(target=self.fill, daemon=True).start()
+        return recycle
+
+    @contextmanager
+    def container(self, timeout=None):
+        """Context manager that acquires a container and releases it afterwards."""
+        pooled = self.acquire(timeout)
+        healthy = False
+        try:
+            yield pooled
+            healthy = True
+        finally:
+            self.release(pooled, healthy=healthy)
+
+    def drain(self):
+        """Remove every idle container, e.g. on worker shutdown."""
+        with self._condition:
+            idle = list(self._idle)
+            self._idle.clear()
+        for pooled in idle:
+            self._destroy(pooled)
+
+    def stats(self):
+        """
+        Report how full the pool is.
+
+        Returns:
+            dict: Pool occupancy figures
+        """
+        with self._condition:
+            idle = len(self._idle)
+            in_use = self._in_use
+            size = self.size
+        return {
+            'language': self.language,
+            'idle': idle,
+            'in_use': in_use,
+            'size': size,
+            'min_size': self.min_size,
+            'max_size': self.max_size,
+            'recycled': self._recycled,
+            'utilization': in_use / self.max_size,
+        }
+
+
+# Pools are per worker process; Celery prefork children each get their own.
+_pools = {}
+_pools_lock = threading.Lock()
+_heartbeat_pid = None
+
+
+def pool_owner():
+    """Name the current process as the owner of the containers it starts."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _heartbeat(owner):
+    from django.conf import settings
+    from django.core.cache import cache
+
+    while True:
+        try:
+            cache.set(OWNER_KEY_PREFIX + owner, time.time(), timeout=settings.EXECUTION_POOL_OWNER_TTL)
+        except Exception as e:
+            logger.warning(f"Error refreshing sandbox pool heartbeat of {owner}: {e}")
+        time.sleep(settings.EXECUTION_POOL_HEARTBEAT_INTERVAL)
+
+
+def _start_heartbeat():
+    # Threads do not survive a fork, so every process starts its own
+    global _heartbeat_pid
+    if _heartbeat_pid == os.getpid():
+        return
+    _heartbeat_pid = os.getpid()
+    threading.Thread(target=_heartbeat, args=(pool_owner(),), name='sandbox-pool-heartbeat', daemon=True).start()
+
+
+def get_container_pool(client, language, lang_config):
+    """
+    Get the container pool for a language, creating it on first use.
+
+    Args:
+        client: Docker client used to start containers
+        language (str): The programming language
+        lang_config (dict): Entry from ``LANGUAGE_CONFIGS``
+
+    Returns:
+        ContainerPool: The pool for ``language``
+    """
+    from django.conf import settings
+
+    with _pools_lock:
+        pool = _pools.get(language)
+        if pool is None:
+            pool = ContainerPool(
+                client,
+                language,
+                lang_config,
+                min_size=settings.EXECUTION_POOL_MIN_SIZE,
+                max_size=settings.EXECUTION_POOL_MAX_SIZE,
+                max_uses=settings.EXECUTION_POOL_MAX_USES,
+                acquire_timeout=settings.EXECUTION_POOL_ACQUIRE_TIMEOUT,
+            )
+            _pools[language] = pool
+            _start_heartbeat()
+    return pool
+
+
+def get_pool_stats():
+    """Return occupancy figures for every pool in this worker process."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.stats() for pool in pools]
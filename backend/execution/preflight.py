@@ -0,0 +1,131 @@
+"""
+Pre-flight syntax and compile checks for the execution service.
+
+Many runs fail to parse, and each still costs a sandbox. Before one is
+acquired, a program is checked in the worker where that is cheap:
+
+- Python is compiled in-process with ``compile()``, which parses without
+  running anything
+- JavaScript is parsed with ``node --check`` when node is installed on the
+  worker (``EXECUTION_PREFLIGHT_NODE``)
+- Compiled languages are looked up in the compile cache, which remembers
+  programs that already failed to compile with the same toolchain
+
+A check only ever rejects a program its toolchain would reject too; when in
+doubt (no parser available, the check itself failing) the program goes on to
+the sandbox as before.
+"""
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import traceback
+import warnings
+from django.conf import settings
+from .compile_cache import compile_cache_key, get_compile_cache
+
+logger = logging.getLogger(__name__)
+
+# `node --check` reports "<file>:<line>" followed by the source line, a caret and the error
+NODE_LOCATION = re.compile(r'^(?P<file>.+):(?P<line>\d+)$')
+
+_checkers = {}
+
+
+def _syntax_error(stage, message, output, line=None, column=None):
+    return {'stage': stage, 'message': message, 'line': line, 'column': column, 'output': output}
+
+
+def register_preflight(language):
+    """Register the in-worker syntax check of a language."""
+    def decorator(check):
+        _checkers[language] = check
+        return check
+    return decorator
+
+
+@register_preflight('python')
+def check_python(code, source):
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            compile(code, source, 'exec', dont_inherit=True)
+    except SyntaxError as e:
+        return _syntax_error(
+            'syntax', f"{type(e).__name__}: {e.msg}", ''.join(traceback.format_exception_only(type(e), e)),
+            line=e.lineno, column=e.offset,
+        )
+    except ValueError as e:
+        # Source code containing null bytes
+        return _syntax_error('syntax', f"SyntaxError: {e}", f"SyntaxError: {e}\n")
+    return None
+
+
+@register_preflight('javascript')
+def check_javascript(code, source):
+    node = settings.EXECUTION_PREFLIGHT_NODE and shutil.which(settings.EXECUTION_PREFLIGHT_NODE)
+    if not node:
+        return None
+    with tempfile.TemporaryDirectory(prefix='bluapt-preflight-') as directory:
+        path = os.path.join(directory, source)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(code)
+        # Only parses the file; nothing in it runs
+        process = subprocess.run(
+            [node, '--check', path], capture_output=True, text=True, errors='replace',
+            timeout=settings.EXECUTION_PREFLIGHT_TIMEOUT,
+        )
+    if process.returncode == 0:
+        return None
+
+    lines = process.stderr.replace(path, source).strip().splitlines()
+    errors = [index for index, line in enumerate(lines) if line.startswith('SyntaxError')]
+    if not errors:
+        # Not a syntax error, e.g. node failing for reasons of its own
+        return None
+    # Keep the location, source excerpt and message, not node's own stack
+    output = '\n'.join(lines[:errors[0] + 1]) + '\n'
+    location = NODE_LOCATION.match(lines[0])
+    return _syntax_error(
+        'syntax', lines[errors[0]], output, line=int(location.group('line')) if location else None,
+    )
+
+
+def check_compile_cache(backend, language, lang_config, code, program):
+    """Return the remembered compiler output if this exact build failed before."""
+    compile_command = lang_config['compile_command'].format(**program)
+    key = compile_cache_key(language, code, compile_command, backend.runtime_digest(lang_config))
+    output = get_compile_cache().get_error(key)
+    if output is None:
+        return None
+    return _syntax_error('compile', output.strip().splitlines()[0] if output.strip() else 'Compilation failed', output)
+
+
+def preflight_check(backend, language, lang_config, code, program):
+    """
+    Check that a program parses or compiles without acquiring a sandbox.
+
+    Args:
+        backend (SandboxBackend): Backend the program would run on
+        language (str): The programming language
+        lang_config (dict): Entry from LANGUAGE_CONFIGS
+        code (str): The source code
+        program (dict): Result of get_program_files
+
+    Returns:
+        dict: ``stage`` (syntax or compile), ``message``, ``line``, ``column`` and
+            the full compiler-style ``output`` if the program is rejected, otherwise None
+    """
+    if not settings.EXECUTION_PREFLIGHT:
+        return None
+    try:
+        if lang_config.get('compile_command'):
+            return check_compile_cache(backend, language, lang_config, code, program)
+        if language in _checkers:
+            return _checkers[language](code, program['source'])
+    except Exception as e:
+        # A failing check never blocks a run; the sandbox has the final say
+        logger.warning(f"Error in pre-flight check for {language}: {e}")
+    return None
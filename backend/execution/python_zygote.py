@@ -0,0 +1,303 @@
+"""
+Python zygote for sandboxed runs.
+
+Started once inside a sandbox, this process imports the standard library
+modules candidate programs commonly use and then forks a fresh child for
+every run it is asked for, so a run skips interpreter startup. The zygote
+itself never executes candidate code: every child starts from the same
+pristine state, runs one program and exits.
+
+Usage: python python_zygote.py <directory> <address space limit in bytes, 0 for none> <uid:gid, - for none>
+
+The zygote reads requests, one per line, from the FIFO ``<directory>/requests``:
+
+    <client pid> <program> <pid file> <timeout> <status FIFO>
+
+The child takes over the client's stdin, stdout and stderr (duplicated by
+the client to its fds 4, 5 and 6), writes its pid to the pid file, applies
+rlimits, switches to the given user, drops every capability and runs the
+program as ``__main__``. When it exits, or is killed after ``timeout``
+seconds, the zygote writes the child's CPU seconds next to the pid file
+(``<name>.cpu`` for ``<name>.pid``) and its exit code to the status FIFO.
+Exit codes follow the shell: 124 for a timeout and 128 + N for signal N.
+
+This file runs inside the sandbox image, so it only uses the standard
+library and must stay compatible with the image's Python version.
+"""
+import gc
+import os
+import resource
+import select
+import signal
+import sys
+import time
+import traceback
+import types
+
+# Imported once in the zygote and shared by every child
+PRELOAD_MODULES = (
+    'abc', 'array', 'bisect', 'collections', 'copy', 'dataclasses', 'datetime', 'decimal',
+    'fractions', 'functools', 'heapq', 'io', 'itertools', 'json', 'math', 'operator',
+    'random', 're', 'statistics', 'string', 'textwrap', 'typing',
+)
+
+TIMEOUT_EXIT_CODE = 124
+
+# Client fds holding its stdin, stdout and stderr
+CLIENT_STREAMS = ((4, 0, os.O_RDONLY), (5, 1, os.O_WRONLY | os.O_APPEND), (6, 2, os.O_WRONLY | os.O_APPEND))
+
+# prctl(2) options and the capset(2) header version used to drop capabilities
+PR_CAPBSET_DROP = 24
+PR_SET_NO_NEW_PRIVS = 38
+CAPABILITY_VERSION_3 = 0x20080522
+
+# Seconds between checks that the sandbox still holds the zygote's requests FIFO
+IDLE_CHECK_INTERVAL = 1.0
+
+
+def preload():
+    for name in PRELOAD_MODULES:
+        try:
+            __import__(name)
+        except ImportError:
+            pass
+    # Keep the preloaded objects out of the children's garbage collections,
+    # so their pages stay shared with the zygote
+    gc.collect()
+    gc.freeze()
+
+
+def exit_code(status):
+    if os.WIFSIGNALED(status):
+        return 128 + os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def take_over_streams(client_pid):
+    """Point stdin, stdout and stderr at the client's."""
+    for source, target, flags in CLIENT_STREAMS:
+        fd = os.open(f'/proc/{client_pid}/fd/{source}', flags)
+        os.dup2(fd, target)
+        os.close(fd)
+    os.closerange(3, resource.getrlimit(resource.RLIMIT_NOFILE)[0])
+    sys.stdin = open(0, 'r', closefd=False)
+    sys.stdout = open(1, 'w', closefd=False)
+    sys.stderr = open(2, 'w', buffering=1, closefd=False)
+
+
+def drop_capabilities():
+    """Clear the bounding, permitted, effective and inheritable capability sets."""
+    import ctypes
+
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.prctl(PR_SET_NO_NEW_PRIVS, 1, 0, 0, 0) != 0:
+        raise OSError(ctypes.get_errno(), 'prctl(PR_SET_NO_NEW_PRIVS) failed')
+    capability = 0
+    # Fails with EINVAL past the kernel's last capability
+    while libc.prctl(PR_CAPBSET_DROP, capability, 0, 0, 0) == 0:
+        capability += 1
+    header = (ctypes.c_uint32 * 2)(CAPABILITY_VERSION_3, 0)
+    data = (ctypes.c_uint32 * 6)()
+    if libc.capset(header, data) != 0:
+        raise OSError(ctypes.get_errno(), 'capset failed')
+
+
+def drop_privileges(user):
+    if user != '-' and os.getuid() == 0:
+        uid, _, gid = user.partition(':')
+        try:
+            os.setgroups([])
+            os.setgid(int(gid or uid))
+            os.setuid(int(uid))
+        except OSError:
+            # User namespaces that only map root cannot switch users
+            pass
+    drop_capabilities()
+
+
+def run_program(program):
+    """Run a program as ``__main__`` the way ``python program`` would and return its exit code."""
+    workspace = os.path.dirname(program)
+    os.chdir(workspace)
+    os.environ['HOME'] = workspace
+    sys.argv = [program]
+    sys.path[0] = workspace
+
+    # Reseed modules that picked up state in the zygote
+    import random
+    random.seed()
+
+    main = types.ModuleType('__main__')
+    main.__file__ = program
+    main.__builtins__ = __builtins__
+    sys.modules['__main__'] = main
+    try:
+        with open(program, 'rb') as f:
+            code = compile(f.read(), program, 'exec')
+        exec(code, main.__dict__)
+        status = 0
+    except SystemExit as e:
+        if e.code is None:
+            status = 0
+        elif isinstance(e.code, int):
+            status = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            status = 1
+    except BaseException as e:
+        # Hide the zygote's own frame, as the interpreter would
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        status = 1
+
+    if 'threading' in sys.modules:
+        sys.modules['threading']._shutdown()
+    import atexit
+    atexit._run_exitfuncs()
+    for stream in (sys.stdout, sys.stderr):
+        try:
+            stream.flush()
+        except Exception:
+            pass
+    return status & 0xFF
+
+
+def child(client_pid, program, pid_file, timeout, address_space, user):
+    """Body of a forked child; never returns."""
+    status = 126
+    try:
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        os.setsid()
+        with open(pid_file, 'w') as f:
+            f.write(f'{os.getpid()}\n')
+        take_over_streams(client_pid)
+        cpu_limit = int(timeout) + 1
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_limit, cpu_limit))
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+        if address_space:
+            resource.setrlimit(resource.RLIMIT_AS, (address_space, address_space))
+        drop_privileges(user)
+        status = run_program(program)
+    except BaseException:
+        try:
+            traceback.print_exc()
+            sys.stderr.flush()
+        except BaseException:
+            pass
+    os._exit(status)
+
+
+def report(pid_file, status_path, code, cpu):
+    try:
+        with open(os.path.splitext(pid_file)[0] + '.cpu', 'w') as f:
+            f.write(f'{cpu:.3f}\n')
+    except OSError:
+        pass
+    try:
+        fd = os.open(status_path, os.O_WRONLY | os.O_NONBLOCK)
+    except OSError:
+        # The client is gone, e.g. killed by the runner's own timeout,
+        # and left its FIFO behind
+        try:
+            os.unlink(status_path)
+        except OSError:
+            pass
+        return
+    try:
+        os.write(fd, f'{code}\n'.encode())
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def serve(directory, address_space, user):
+    requests_path = os.path.join(directory, 'requests')
+    os.mkfifo(requests_path, 0o600)
+    # Held open for writing too, so the FIFO never reports end of file
+    requests = os.open(requests_path, os.O_RDWR | os.O_NONBLOCK)
+    requests_inode = os.fstat(requests).st_ino
+
+    wake_read, wake_write = os.pipe()
+    os.set_blocking(wake_read, False)
+    os.set_blocking(wake_write, False)
+    signal.set_wakeup_fd(wake_write)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+
+    with open(os.path.join(directory, 'pid'), 'w') as f:
+        f.write(f'{os.getpid()}\n')
+    open(os.path.join(directory, 'ready'), 'w').close()
+
+    running = {}  # pid -> [deadline, pid file, status FIFO, timed out]
+    pending = b''
+    while True:
+        wait = IDLE_CHECK_INTERVAL
+        if running:
+            wait = min(wait, max(min(entry[0] for entry in running.values()) - time.monotonic(), 0))
+        readable, _, _ = select.select([requests, wake_read], [], [], wait)
+
+        if wake_read in readable:
+            while True:
+                try:
+                    if not os.read(wake_read, 4096):
+                        break
+                except BlockingIOError:
+                    break
+
+        if requests in readable:
+            try:
+                pending += os.read(requests, 65536)
+            except BlockingIOError:
+                pass
+            *lines, pending = pending.split(b'\n')
+            for line in lines:
+                try:
+                    client_pid, program, pid_file, timeout, status_path = line.decode().split()
+                    client_pid, timeout = int(client_pid), float(timeout)
+                except ValueError:
+                    continue
+                sys.stdout.flush()
+                sys.stderr.flush()
+                pid = os.fork()
+                if pid == 0:
+                    child(client_pid, program, pid_file, timeout, address_space, user)
+                running[pid] = [time.monotonic() + timeout, pid_file, status_path, False]
+
+        while running:
+            try:
+                pid, status, usage = os.wait4(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            deadline, pid_file, status_path, timed_out = running.pop(pid)
+            try:
+                # Take down anything the run left behind in its session
+                os.killpg(pid, signal.SIGKILL)
+            except OSError:
+                pass
+            code = TIMEOUT_EXIT_CODE if timed_out else exit_code(status)
+            report(pid_file, status_path, code, usage.ru_utime + usage.ru_stime)
+
+        now = time.monotonic()
+        for pid, entry in running.items():
+            if not entry[3] and now >= entry[0]:
+                entry[0], entry[3] = float('inf'), True
+                try:
+                    os.killpg(pid, signal.SIGKILL)
+                except OSError:
+                    pass
+
+        if not running:
+            try:
+                serving = os.stat(requests_path).st_ino == requests_inode
+            except OSError:
+                serving = False
+            if not serving:
+                # The sandbox was reset or torn down, perhaps with another zygote started since
+                return
+
+
+if __name__ == '__main__':
+    preload()
+    serve(sys.argv[1], int(sys.argv[2]), sys.argv[3])
@@ -0,0 +1,157 @@
+"""
+Reaper for orphaned sandbox containers.
+
+Pooled containers are removed by the process that owns their pool, so a
+worker that dies (OOM kill, SIGKILL, lost node) leaves its containers
+running. Every owner labels the containers it starts with its name and
+keeps a heartbeat key alive in the Django cache while it runs; a sweep:
+
+- lists the daemon's pooled containers in one call
+- treats a container as orphaned once its owner's heartbeat is gone and it
+  is older than ``EXECUTION_REAPER_GRACE`` seconds
+- kills the running orphans concurrently and removes every stopped pooled
+  container with a single prune
+- marks the tracked state (``lifecycle.track_container``) of the containers
+  it removed as removed
+
+A sweep cleans up the Docker daemon of the worker that runs it, and only
+touches the records of that daemon's containers. The periodic
+``reap_sandboxes`` task therefore sends one sweep to the node queue of every
+live execution host (``nodes.node_queue``). Its counts are returned and kept
+in the cache for ``get_reaper_report``.
+"""
+import logging
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from .lifecycle import CONTAINER_KEY_PREFIX
+from .pool import OWNER_KEY_PREFIX, OWNER_LABEL, POOL_LABEL
+from .sandbox import get_sandbox_backend
+
+logger = logging.getLogger(__name__)
+
+REPORT_KEY_PREFIX = 'execution:reaper:last:'
+
+
+def find_orphans(containers, now=None):
+    """
+    Pick the containers whose owning process is gone.
+
+    Args:
+        containers (list): Container summaries from the Docker API's container list
+        now (float, optional): Current UNIX time
+
+    Returns:
+        list: The orphaned summaries
+    """
+    now = time.time() if now is None else now
+    owners = {(container.get('Labels') or {}).get(OWNER_LABEL) for container in containers}
+    owners.discard(None)
+    alive = cache.get_many([OWNER_KEY_PREFIX + owner for owner in owners])
+
+    orphans = []
+    for container in containers:
+        owner = (container.get('Labels') or {}).get(OWNER_LABEL)
+        if owner is not None and OWNER_KEY_PREFIX + owner in alive:
+            continue
+        # Young containers may belong to a process whose first heartbeat is still on its way
+        if now - container.get('Created', now) >= settings.EXECUTION_REAPER_GRACE:
+            orphans.append(container)
+    return orphans
+
+
+def _kill(api, container_id):
+    try:
+        api.kill(container_id)
+        return True
+    except Exception as e:
+        # Usually the container stopped on its own meanwhile
+        logger.warning(f"Error killing orphaned container {container_id}: {e}")
+        return False
+
+
+def reap_containers(api):
+    """
+    Kill and remove the orphaned pooled containers of a Docker daemon.
+
+    Args:
+        api: Low-level Docker API client
+
+    Returns:
+        tuple: (report counts, IDs of the containers that are gone)
+    """
+    containers = api.containers(all=True, filters={'label': POOL_LABEL})
+    orphans = find_orphans(containers)
+    orphan_ids = {container['Id'] for container in orphans}
+    running = [container['Id'] for container in orphans if container.get('State') == 'running']
+
+    killed = 0
+    if running:
+        with ThreadPoolExecutor(max_workers=min(settings.EXECUTION_REAPER_CONCURRENCY, len(running))) as executor:
+            killed = sum(executor.map(lambda container_id: _kill(api, container_id), running))
+
+    # One prune removes the killed orphans along with any pooled container that died on its own
+    pruned = api.prune_containers(filters={'label': POOL_LABEL})
+    removed = set(pruned.get('ContainersDeleted') or [])
+    return {
+        'checked': len(containers),
+        'orphaned': len(orphans),
+        'killed': killed,
+        'removed': len(removed),
+        'space_reclaimed': pruned.get('SpaceReclaimed') or 0,
+    }, removed | orphan_ids
+
+
+def reconcile_records(removed):
+    """
+    Mark the tracked state of removed containers as removed.
+
+    Args:
+        removed (set): IDs of this daemon's containers that are gone
+
+    Returns:
+        int: Number of records updated
+    """
+    keys = [CONTAINER_KEY_PREFIX + container_id for container_id in removed]
+    closed = {
+        key: dict(record, status='removed')
+        for key, record in cache.get_many(keys).items() if record['status'] != 'removed'
+    }
+    if closed:
+        cache.set_many(closed, timeout=settings.EXECUTION_STATE_TTL)
+    return len(closed)
+
+
+def reap_orphaned_sandboxes():
+    """
+    Sweep this worker's Docker daemon and its containers' records for orphans.
+
+    Returns:
+        dict: Containers ``checked``, ``orphaned``, ``killed`` and ``removed``, bytes of
+            ``space_reclaimed``, ``records_updated`` and the sweep's ``seconds``
+    """
+    started = time.monotonic()
+    backend = get_sandbox_backend()
+    report = {'checked': 0, 'orphaned': 0, 'killed': 0, 'removed': 0, 'space_reclaimed': 0}
+    removed = set()
+    if backend.name == 'docker':
+        report, removed = reap_containers(backend.client.api)
+    report['records_updated'] = reconcile_records(removed)
+    report['seconds'] = round(time.monotonic() - started, 3)
+    report['reaped_at'] = timezone.now().isoformat()
+
+    if report['orphaned'] or report['records_updated']:
+        logger.warning(
+            f"Reaped {report['orphaned']} orphaned sandbox containers "
+            f"({report['killed']} killed, {report['removed']} removed) and {report['records_updated']} records"
+        )
+    cache.set(REPORT_KEY_PREFIX + socket.gethostname(), report, timeout=None)
+    return report
+
+
+def get_reaper_report(host=None):
+    """Return the counts of the latest sweep on a host (this one by default), or None if there was none."""
+    return cache.get(REPORT_KEY_PREFIX + (host or socket.gethostname()))
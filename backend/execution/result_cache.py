@@ -0,0 +1,72 @@
+"""
+Memoization of deterministic execution results.
+
+Identical runs (same code, language, input and resource limits) are served
+from the Django cache instead of a sandbox for ``EXECUTION_RESULT_CACHE_TTL``
+seconds.
+"""
+import hashlib
+import json
+from django.conf import settings
+from django.core.cache import cache
+
+CACHE_KEY_PREFIX = 'execution:result:'
+
+# Only outcomes that depend on the program alone are worth replaying; compile errors are
+# already answered without a sandbox by the pre-flight check and the compile cache
+CACHEABLE_STATUSES = ('completed',)
+
+# Test case verdicts that depend on the program alone; timeouts and errors may come from
+# host load or the sandbox, e.g. a runner that left no measurements
+CACHEABLE_VERDICTS = ('passed', 'failed', 'completed')
+
+
+def execution_cache_key(code, language, stdin=None, test_cases=None, timeout=None, memory_limit=None):
+    """
+    Build the cache key for a run.
+
+    Args:
+        code (str): The code to execute
+        language (str): The programming language
+        stdin (str, optional): Standard input for a single run
+        test_cases (list, optional): Test cases, whose inputs and expected outputs shape the result
+        timeout (int, optional): Timeout in seconds
+        memory_limit (str, optional): Sandbox memory limit
+
+    Returns:
+        str: Cache key
+    """
+    payload = json.dumps({
+        'code': code,
+        'language': language,
+        'stdin': stdin,
+        'test_cases': [
+            [test_case.get('input_data'), test_case.get('expected_output'), test_case.get('comparison')]
+            for test_case in test_cases or []
+        ],
+        'timeout': timeout,
+        'memory_limit': memory_limit,
+    }, sort_keys=True)
+    return CACHE_KEY_PREFIX + hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get_cached_result(key):
+    """Return the stored result for ``key``, or None."""
+    return cache.get(key)
+
+
+def store_result(key, result):
+    """
+    Remember a finished run's result if it is deterministic enough to replay.
+
+    Args:
+        key (str): Key from ``execution_cache_key``
+        result (dict): Result returned by ``execute_code``
+    """
+    if settings.EXECUTION_RESULT_CACHE_TTL <= 0 or result.get('status') not in CACHEABLE_STATUSES:
+        return
+    if any(test_result['verdict'] not in CACHEABLE_VERDICTS or test_result.get('exit_code') is None
+           for test_result in result.get('test_results') or []):
+        return
+    stored = {k: v for k, v in result.items() if k not in ('execution_id', 'cached')}
+    cache.set(key, stored, timeout=settings.EXECUTION_RESULT_CACHE_TTL)
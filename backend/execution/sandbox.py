@@ -0,0 +1,620 @@
+"""
+Sandbox backends for the execution service.
+
+A backend hands out ``Sandbox`` objects: an isolated workspace that candidate
+files are copied into and shell commands are run in. ``execute_code`` only
+talks to this interface, so Docker and the local process sandbox are
+interchangeable via ``EXECUTION_SANDBOX_BACKEND``.
+"""
+import asyncio
+import functools
+import math
+import os
+import resource
+import shlex
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import logging
+from django.conf import settings
+from .pool import WORKSPACE_DIR, get_container_pool, unprivileged_command
+from .output import capture, demux, iter_file
+
+logger = logging.getLogger(__name__)
+
+MEMORY_UNITS = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+
+def parse_memory_limit(value):
+    """Convert a Docker-style memory limit such as '128m' to bytes."""
+    value = str(value).strip().lower()
+    if value and value[-1] in MEMORY_UNITS:
+        return int(float(value[:-1]) * MEMORY_UNITS[value[-1]])
+    return int(value)
+
+
+class Sandbox:
+    """An isolated workspace acquired from a SandboxBackend."""
+
+    id = None
+    workspace = None
+    # Whether the sandbox (and processes started in it) outlives a single run
+    reusable = False
+    # uid:gid that unprivileged commands run as, if the sandbox switches users at all
+    user = ''
+
+    def put_files(self, files, mode=0o666):
+        """Copy a mapping of workspace-relative file names to content into the sandbox."""
+        raise NotImplementedError
+
+    def exec(self, command, timeout=None, wall_timeout=None, privileged=False):
+        """
+        Run a shell command inside the workspace.
+
+        Args:
+            command (str): Command line for ``sh -c``
+            timeout (int, optional): CPU time limit per process in seconds
+            wall_timeout (int, optional): Wall-clock guard for the whole command
+            privileged (bool): Run with privileges that commands started through
+                ``unprivileged`` lack, e.g. to keep measurements out of their reach
+
+        Returns:
+            tuple: (exit_code, stdout, stderr) with size-capped CapturedOutput streams
+        """
+        raise NotImplementedError
+
+    async def aexec(self, command, timeout=None, wall_timeout=None, privileged=False):
+        """Coroutine version of ``exec``; runs the blocking call on the event loop's thread pool."""
+        return await asyncio.to_thread(
+            self.exec, command, timeout=timeout, wall_timeout=wall_timeout, privileged=privileged,
+        )
+
+    def unprivileged(self, protected=()):
+        """
+        Return a command prefix that drops a privileged exec's privileges.
+
+        Args:
+            protected (iterable): Directories the privileged exec created that the command must not write
+
+        Returns:
+            str: Shell words to put in front of the command, empty if the sandbox cannot drop privileges
+        """
+        return ''
+
+    def iter_files(self, path):
+        """
+        Stream every file below a directory as (name, byte chunks).
+
+        Args:
+            path (str): Workspace-relative directory, or an absolute one inside the sandbox
+
+        Names start with the directory's base name, e.g. ``out/0.out``.
+        """
+        raise NotImplementedError
+
+    def get_files(self, path):
+        """Read every file below a directory, keyed by name as in ``iter_files``."""
+        return {name: b''.join(chunks) for name, chunks in self.iter_files(path)}
+
+    def kill(self):
+        """Stop everything running in the sandbox at once, e.g. when its run is cancelled."""
+        raise NotImplementedError
+
+    def close(self, healthy=True):
+        """
+        Give the sandbox back to its backend.
+
+        Returns:
+            bool: True if the sandbox was destroyed rather than kept for reuse
+        """
+        raise NotImplementedError
+
+
+class SandboxBackend:
+    """Interface for sandbox implementations."""
+
+    name = None
+
+    def acquire(self, language, lang_config):
+        """Return a ready Sandbox for ``language``."""
+        raise NotImplementedError
+
+    def runtime_digest(self, lang_config):
+        """Identify the toolchain a language runs with, for keying build caches."""
+        return lang_config['image']
+
+    def prepare(self, lang_config, pull=True):
+        """Make a language's toolchain available and return the digest runs will use."""
+        return self.runtime_digest(lang_config)
+
+    def warm(self, language, lang_config):
+        """Pre-start the sandboxes the backend keeps ready for ``language``."""
+
+
+class DockerSandbox(Sandbox):
+    """
+    Sandbox backed by a warm container from a ContainerPool.
+
+    Every exec is bounded by its wall timeout: the container ends the command,
+    and the container itself is killed if the exec is still running
+    ``EXECUTION_SANDBOX_KILL_GRACE`` seconds later.
+    """
+
+    workspace = WORKSPACE_DIR
+    reusable = True
+
+    def __init__(self, pool, pooled):
+        self.pool = pool
+        self.pooled = pooled
+        self.id = pooled.id
+        self.user = pooled.user
+
+    def put_files(self, files, mode=0o666):
+        self.pooled.put_files(files, mode=mode)
+
+    def _wall_timeout(self, timeout, wall_timeout):
+        if wall_timeout is None:
+            wall_timeout = timeout if timeout is not None else self.pool.lang_config['timeout']
+        return wall_timeout
+
+    def _start_exec(self, command, wall_timeout, privileged):
+        # `timeout` ends the command in the container; killing the container is the
+        # last resort for a command or daemon that does not return after that
+        api = self.pooled.container.client.api
+        user = 'root' if privileged else self.pooled.user
+        command = f"timeout -s KILL {math.ceil(wall_timeout)} sh -c {shlex.quote(command)}"
+        return api, api.exec_create(self.pooled.container.id, ['sh', '-c', command], user=user)['Id']
+
+    def _finish_exec(self, api, exec_id):
+        stdout, stderr = demux(
+            api.exec_start(exec_id, stream=True, demux=True),
+            settings.EXECUTION_OUTPUT_MAX_BYTES,
+        )
+        exit_code = api.exec_inspect(exec_id)['ExitCode']
+        # An exec cut short by killing its container has no exit code
+        return 137 if exit_code is None else exit_code, stdout, stderr
+
+    def exec(self, command, timeout=None, wall_timeout=None, privileged=False):
+        # Privileged execs run as root with the few capabilities the container keeps
+        wall_timeout = self._wall_timeout(timeout, wall_timeout)
+        api, exec_id = self._start_exec(command, wall_timeout, privileged)
+        timer = threading.Timer(wall_timeout + settings.EXECUTION_SANDBOX_KILL_GRACE, self.kill)
+        timer.start()
+        try:
+            return self._finish_exec(api, exec_id)
+        finally:
+            timer.cancel()
+
+    async def aexec(self, command, timeout=None, wall_timeout=None, privileged=False):
+        # The Docker SDK blocks, so each exec holds one of the engine's
+        # EXECUTION_ENGINE_MAX_THREADS threads until it returns
+        wall_timeout = self._wall_timeout(timeout, wall_timeout)
+        api, exec_id = await asyncio.to_thread(self._start_exec, command, wall_timeout, privileged)
+        result = asyncio.ensure_future(asyncio.to_thread(self._finish_exec, api, exec_id))
+        try:
+            return await asyncio.wait_for(asyncio.shield(result), wall_timeout + settings.EXECUTION_SANDBOX_KILL_GRACE)
+        except asyncio.TimeoutError:
+            await asyncio.to_thread(self.kill)
+            return await result
+
+    def unprivileged(self, protected=()):
+        # Root's files are out of the sandbox user's reach already
+        return unprivileged_command(self.pooled.user)
+
+    def iter_files(self, path):
+        return self.pooled.iter_files(path if path.startswith('/') else f"{self.workspace}/{path}")
+
+    def kill(self):
+        # Ends any exec in flight; the container is recycled when it is closed as unhealthy
+        try:
+            self.pooled.container.kill()
+        except Exception as e:
+            logger.warning(f"Error killing container {self.id}: {e}")
+
+    def close(self, healthy=True):
+        return self.pool.release(self.pooled, healthy=healthy)
+
+
+class DockerSandboxBackend(SandboxBackend):
+    """Runs code in pooled Docker containers."""
+
+    name = 'docker'
+
+    def __init__(self):
+        self._client = None
+        self._image_digests = {}
+
+    @property
+    def client(self):
+        if self._client is None:
+            import docker
+            self._client = docker.from_env()
+        return self._client
+
+    def _pinned(self, lang_config):
+        # Once an image has been resolved, containers start from that exact image
+        image = self._image_digests.get(lang_config['image'])
+        return {**lang_config, 'image': image} if image else lang_config
+
+    def acquire(self, language, lang_config):
+        pool = get_container_pool(self.client, language, self._pinned(lang_config))
+        return DockerSandbox(pool, pool.acquire())
+
+    def prepare(self, lang_config, pull=True):
+        image = lang_config['image']
+        resolved = self.client.images.pull(image) if pull else self.client.images.get(image)
+        self._image_digests[image] = resolved.id
+        return resolved.id
+
+    def warm(self, language, lang_config):
+        get_container_pool(self.client, language, self._pinned(lang_config)).fill()
+
+    def runtime_digest(self, lang_config):
+        image = lang_config['image']
+        if image not in self._image_digests:
+            self._image_digests[image] = self.client.images.get(image).id
+        return self._image_digests[image]
+
+
+def _apply_limits(limits):
+    """Apply rlimits in the child process before it execs the command."""
+    for limit, value in limits:
+        resource.setrlimit(limit, (value, value))
+
+
+def _kill_group(pid):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+class SandboxUnavailable(RuntimeError):
+    """Raised when a backend cannot isolate candidate code on this host."""
+
+
+# Where the jail's own tools are looked up on the host
+SYSTEM_PATH = '/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin'
+
+# Runs inside fresh user, mount, network and PID namespaces. Builds a private root on tmpfs
+# from read-only bind mounts of the runtime, the sandbox's scratch directory and a tmpfs /tmp,
+# then runs the command chrooted into it, unless it is privileged without any capabilities,
+# so it can neither undo the mounts nor chroot back out.
+# Arguments: root, scratch directory, workspace, /tmp size, PATH, privileged (1 or 0), command, runtime paths
+JAIL_SCRIPT = r"""set -e
+root=$1 scratch=$2 workspace=$3 tmp_size=$4 search_path=$5 privileged=$6 command=$7
+shift 7
+mount -t tmpfs -o mode=755 tmpfs "$root"
+for path in "$@"; do
+  [ -e "$path" ] || [ -L "$path" ] || continue
+  mkdir -p "$root$(dirname "$path")"
+  if [ -L "$path" ]; then
+    ln -s "$(readlink "$path")" "$root$path"
+    continue
+  fi
+  if [ -d "$path" ]; then mkdir -p "$root$path"; else : > "$root$path"; fi
+  mount --rbind "$path" "$root$path"
+  mount -o remount,bind,ro "$root$path"
+done
+mkdir -p "$root$scratch" "$root/tmp" "$root/dev" "$root/proc"
+mount --bind "$scratch" "$root$scratch"
+mount -t tmpfs -o "mode=1777,size=$tmp_size" tmpfs "$root/tmp"
+for device in null zero random urandom; do
+  : > "$root/dev/$device"
+  mount --bind "/dev/$device" "$root/dev/$device"
+done
+ln -s /proc/self/fd "$root/dev/fd"
+mount -t proc proc "$root/proc"
+mount -o remount,ro "$root"
+drop="{setpriv} --no-new-privs --bounding-set=-all --inh-caps=-all"
+[ "$privileged" = 1 ] && drop=
+PATH=$search_path exec {chroot} "$root" $drop \
+  /bin/sh -c 'cd "$1" && exec /bin/sh -c "$2"' sh "$workspace" "$command"
+"""
+
+# Prefix inside the jail that drops a privileged command's capabilities, after making the
+# directories it names read-only in a mount namespace of its own:
+# sh -c UNPRIVILEGED_SCRIPT sh <directory>... -- <command>
+UNPRIVILEGED_SCRIPT = (
+    'while [ "$1" != -- ]; do mount --bind "$1" "$1" && mount -o remount,bind,ro "$1" || exit 126; shift; done; '
+    'shift; exec setpriv --no-new-privs --bounding-set=-all --inh-caps=-all "$@"'
+)
+
+
+def _host_binary(name):
+    """Find a command on PATH, preferring real executables over wrapper scripts such as version manager shims."""
+    found = None
+    for directory in os.environ.get('PATH', os.defpath).split(os.pathsep):
+        path = os.path.join(directory, name)
+        if not (os.path.isfile(path) and os.access(path, os.X_OK)):
+            continue
+        with open(path, 'rb') as f:
+            if f.read(4) == b'\x7fELF':
+                return path
+        found = found or path
+    return found
+
+
+def _is_under(path, parents):
+    return any(path == parent or path.startswith(parent.rstrip('/') + '/') for parent in parents)
+
+
+class LocalSandbox(Sandbox):
+    """Sandbox that runs commands as rlimited child processes in a scratch directory."""
+
+    def __init__(self, backend, lang_config):
+        self.backend = backend
+        self.lang_config = lang_config
+        self.root = tempfile.mkdtemp(prefix='bluapt-', dir=backend.scratch_dir)
+        self.workspace = os.path.join(self.root, 'code')
+        os.mkdir(self.workspace)
+        # Mount point of the private root the commands see
+        self.jail_root = os.path.join(self.root, 'jail')
+        os.mkdir(self.jail_root)
+        self.id = os.path.basename(self.root)
+        # Process groups of the commands running right now
+        self._running = set()
+
+    def _path(self, name):
+        path = os.path.normpath(os.path.join(self.workspace, name))
+        if not path.startswith(self.workspace + os.sep):
+            raise ValueError(f"Path escapes the sandbox workspace: {name}")
+        return path
+
+    def put_files(self, files, mode=0o666):
+        for name, content in files.items():
+            path = self._path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            data = content.encode('utf-8') if isinstance(content, str) else content
+            with open(path, 'wb') as f:
+                f.write(data)
+            os.chmod(path, mode)
+
+    def _limits(self, timeout):
+        memory_limit = self.lang_config.get('address_space_limit', self.lang_config['memory_limit'])
+        return [
+            (resource.RLIMIT_CPU, int(timeout) + 1),
+            (resource.RLIMIT_AS, parse_memory_limit(memory_limit)),
+            (resource.RLIMIT_NPROC, settings.EXECUTION_LOCAL_MAX_PROCESSES),
+            (resource.RLIMIT_FSIZE, settings.EXECUTION_LOCAL_MAX_FILE_SIZE),
+            (resource.RLIMIT_CORE, 0),
+        ]
+
+    def _timeouts(self, timeout, wall_timeout):
+        if timeout is None:
+            timeout = self.lang_config['timeout']
+        if wall_timeout is None:
+            wall_timeout = timeout
+        # Guard against commands that ignore their own `timeout` wrapper
+        return timeout, wall_timeout + settings.EXECUTION_LOCAL_KILL_GRACE
+
+    def _popen_args(self, command, timeout, privileged=False):
+        """Return the argv and Popen keyword arguments for running ``command``."""
+        env = {
+            'PATH': os.environ.get('PATH', '/usr/local/bin:/usr/bin:/bin'),
+            'HOME': self.workspace,
+            'LANG': 'C.UTF-8',
+        }
+        if self.backend.jail:
+            search_path, runtime_paths = self.backend.runtime(self.lang_config)
+            argv = self.backend.jail + [
+                self.jail_root, self.root, self.workspace, settings.EXECUTION_LOCAL_TMP_SIZE, search_path,
+                '1' if privileged else '0', command, *runtime_paths,
+            ]
+        else:
+            argv = self.backend.wrapper + ['sh', '-c', command]
+        return argv, {
+            'cwd': self.workspace,
+            'env': env,
+            'stdin': subprocess.DEVNULL,
+            'preexec_fn': functools.partial(_apply_limits, self._limits(timeout)),
+            'start_new_session': True,
+        }
+
+    def _output_files(self):
+        return os.path.join(self.root, 'stdout'), os.path.join(self.root, 'stderr')
+
+    def _result(self, exit_code):
+        if exit_code < 0:
+            exit_code = 128 - exit_code  # Report signals like a shell does
+        stdout_path, stderr_path = self._output_files()
+        stdout = capture(iter_file(stdout_path), settings.EXECUTION_OUTPUT_MAX_BYTES)
+        stderr = capture(iter_file(stderr_path), settings.EXECUTION_OUTPUT_MAX_BYTES)
+        return exit_code, stdout, stderr
+
+    def exec(self, command, timeout=None, wall_timeout=None, privileged=False):
+        timeout, kill_after = self._timeouts(timeout, wall_timeout)
+        argv, kwargs = self._popen_args(command, timeout, privileged)
+        stdout_path, stderr_path = self._output_files()
+
+        with open(stdout_path, 'wb') as stdout, open(stderr_path, 'wb') as stderr:
+            process = subprocess.Popen(argv, stdout=stdout, stderr=stderr, **kwargs)
+
+        self._running.add(process.pid)
+        timer = threading.Timer(kill_after, _kill_group, [process.pid])
+        timer.start()
+        try:
+            exit_code = process.wait()
+        finally:
+            timer.cancel()
+            self._running.discard(process.pid)
+        return self._result(exit_code)
+
+    async def aexec(self, command, timeout=None, wall_timeout=None, privileged=False):
+        timeout, kill_after = self._timeouts(timeout, wall_timeout)
+        argv, kwargs = self._popen_args(command, timeout, privileged)
+        stdout_path, stderr_path = self._output_files()
+
+        with open(stdout_path, 'wb') as stdout, open(stderr_path, 'wb') as stderr:
+            process = await asyncio.create_subprocess_exec(*argv, stdout=stdout, stderr=stderr, **kwargs)
+
+        self._running.add(process.pid)
+        try:
+            exit_code = await asyncio.wait_for(process.wait(), kill_after)
+        except asyncio.TimeoutError:
+            _kill_group(process.pid)
+            exit_code = await process.wait()
+        finally:
+            self._running.discard(process.pid)
+        return await asyncio.to_thread(self._result, exit_code)
+
+    def unprivileged(self, protected=()):
+        # Everything in the jail runs as the same user, so only dropping the capabilities
+        # that privileged execs keep and a read-only view of their directories tell them apart
+        if not self.backend.jail:
+            return ''
+        return shlex.join(['unshare', '--mount', 'sh', '-c', UNPRIVILEGED_SCRIPT, 'sh', *protected, '--'])
+
+    def iter_files(self, path):
+        if os.path.isabs(path):
+            path = os.path.normpath(path)
+            if not path.startswith(self.root + os.sep):
+                raise ValueError(f"Path is outside the sandbox: {path}")
+        else:
+            path = self._path(path)
+        for directory, _, names in os.walk(path):
+            for name in names:
+                full_path = os.path.join(directory, name)
+                yield os.path.relpath(full_path, os.path.dirname(path)), iter_file(full_path)
+
+    def kill(self):
+        for pid in list(self._running):
+            _kill_group(pid)
+
+    def close(self, healthy=True):
+        shutil.rmtree(self.root, ignore_errors=True)
+        return True
+
+
+class LocalSandboxBackend(SandboxBackend):
+    """
+    Runs code as local child processes without a Docker daemon.
+
+    Each run gets a scratch directory (on tmpfs when available) and rlimits on
+    CPU time, address space, process count and file size. It runs either in
+    ``EXECUTION_LOCAL_WRAPPER`` (e.g. an nsjail or bwrap command line with a
+    seccomp policy) or, by default, in fresh user, mount, network and PID
+    namespaces chrooted into a private root: read-only mounts of
+    ``EXECUTION_LOCAL_RUNTIME_PATHS`` and of the language's toolchain, the
+    sandbox's own scratch directory and a tmpfs ``/tmp``. Nothing else on the host, such as
+    the settings, the test case cache or the compile cache, is visible.
+
+    Without namespace support the backend refuses to run code, unless
+    ``EXECUTION_LOCAL_ALLOW_UNISOLATED`` is set for development and CI.
+    Only the private root keeps programs away from the batch runner's
+    measurements; under a wrapper, or unisolated, they share its privileges.
+    """
+
+    name = 'local'
+
+    def __init__(self):
+        scratch_dir = settings.EXECUTION_LOCAL_SCRATCH_DIR
+        if scratch_dir and not os.access(scratch_dir, os.W_OK):
+            scratch_dir = None
+        self.scratch_dir = scratch_dir
+        self.wrapper = shlex.split(settings.EXECUTION_LOCAL_WRAPPER)
+        self.jail = None if self.wrapper else self._detect_jail()
+        self._runtimes = {}
+        self._runtimes_lock = threading.Lock()
+
+    def _detect_jail(self):
+        tools = {name: shutil.which(name, path=SYSTEM_PATH) for name in ('unshare', 'chroot', 'setpriv')}
+        if not all(tools.values()):
+            logger.error(f"Local sandbox needs {', '.join(tools)}; missing {', '.join(n for n, p in tools.items() if not p)}")
+            return None
+        script = JAIL_SCRIPT.replace('{chroot}', tools['chroot']).replace('{setpriv}', tools['setpriv'])
+        jail = [tools['unshare'], '--user', '--map-root-user', '--mount', '--net', '--pid', '--fork', 'sh', '-c', script, 'jail']
+
+        root = tempfile.mkdtemp(prefix='bluapt-probe-', dir=self.scratch_dir)
+        try:
+            os.mkdir(os.path.join(root, 'code'))
+            os.mkdir(os.path.join(root, 'jail'))
+            probe = subprocess.run(jail + [
+                os.path.join(root, 'jail'), root, os.path.join(root, 'code'), '1m', SYSTEM_PATH, '0', 'true',
+                *settings.EXECUTION_LOCAL_RUNTIME_PATHS,
+            ], capture_output=True)
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+        if probe.returncode != 0:
+            logger.error(f"Local sandbox cannot build its private root: {probe.stderr.decode('utf-8', 'replace').strip()}")
+            return None
+        return jail
+
+    def runtime(self, lang_config):
+        """
+        Work out what a language's toolchain needs inside the private root.
+
+        Toolchains outside ``EXECUTION_LOCAL_RUNTIME_PATHS``, e.g. a Python in
+        /opt or a home directory, get their install prefix mounted as well.
+
+        Returns:
+            tuple: PATH inside the sandbox and the host paths mounted read-only
+        """
+        commands = tuple(
+            shlex.split(lang_config[key])[0] for key in ('compile_command', 'command') if lang_config.get(key)
+        )
+        with self._runtimes_lock:
+            if commands not in self._runtimes:
+                search_path = []
+                runtime_paths = list(settings.EXECUTION_LOCAL_RUNTIME_PATHS)
+                for command in commands:
+                    path = _host_binary(command) if '/' not in command else None
+                    if path is None:
+                        continue
+                    for directory in (os.path.dirname(path), os.path.dirname(os.path.realpath(path))):
+                        prefix = os.path.dirname(directory)
+                        if prefix != '/' and not _is_under(directory, runtime_paths):
+                            runtime_paths.append(prefix)
+                    if os.path.dirname(path) not in search_path:
+                        search_path.append(os.path.dirname(path))
+                search_path += [directory for directory in ('/usr/local/bin', '/usr/bin', '/bin') if directory not in search_path]
+                self._runtimes[commands] = (':'.join(search_path), runtime_paths)
+            return self._runtimes[commands]
+
+    def acquire(self, language, lang_config):
+        if not self.wrapper and not self.jail and not settings.EXECUTION_LOCAL_ALLOW_UNISOLATED:
+            raise SandboxUnavailable(
+                "Local sandbox cannot isolate code on this host; set EXECUTION_LOCAL_ALLOW_UNISOLATED to run it anyway"
+            )
+        return LocalSandbox(self, lang_config)
+
+    def runtime_digest(self, lang_config):
+        # The host toolchain: resolved compiler binary and its modification time
+        compiler = shlex.split(lang_config.get('compile_command') or lang_config['command'])[0]
+        path = shutil.which(compiler)
+        if path is None:
+            return f"local:{compiler}"
+        path = os.path.realpath(path)
+        return f"local:{path}:{os.stat(path).st_mtime_ns}"
+
+
+SANDBOX_BACKENDS = {
+    DockerSandboxBackend.name: DockerSandboxBackend,
+    LocalSandboxBackend.name: LocalSandboxBackend,
+}
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_sandbox_backend(name=None):
+    """
+    Get a sandbox backend instance, creating it on first use.
+
+    Args:
+        name (str, optional): Backend name; defaults to EXECUTION_SANDBOX_BACKEND
+
+    Returns:
+        SandboxBackend: The backend
+    """
+    name = name or settings.EXECUTION_SANDBOX_BACKEND
+    with _backends_lock:
+        backend = _backends.get(name)
+        if backend is None:
+            if name not in SANDBOX_BACKENDS:
+                raise ValueError(f"Unknown sandbox backend: {name}")
+            backend = SANDBOX_BACKENDS[name]()
+            _backends[name] = backend
+    return backend
@@ -2,59 +2,350 @@
 Celery tasks for the execution service.
 """
 import uuid
-import os
-import tempfile
-import docker
+import asyncio
+import re
+import shlex
 import logging
-import resource
 import difflib
-import requests
-from Levenshtein import distance
-from celery import shared_task
+from celery import chord, group, shared_task
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
-from .models import ExecutionResult, PlagiarismResult, SimilarSubmission, ExternalSource, SandboxContainer
-from assessments.models import CodeSubmission, TestCase
+from .models import PlagiarismResult, SimilarSubmission, ExternalSource
+from .sandbox import get_sandbox_backend
+from .engine import get_execution_engine
+from .analysis import analyze_submissions
+from .batch import (
+    RUNNER_NAME, RunnerFailed,
+    build_batch_files, build_batch_script, collect_batch_outputs, case_outputs,
+    output_dir, parse_batch_results, compile_error_results
+)
+from .compile_cache import COMPILE_ERROR_NAME, compile_cache_key, get_compile_cache
+from .result_cache import execution_cache_key, get_cached_result, store_result
+from .lifecycle import set_owner, set_status, save_result, track_container
+from .events import publish_event, test_case_event
+from .grading import (
+    load_test_cases, merge_shard_results, shard_execution_ids, shard_result, shard_test_cases, test_case_version,
+)
+from .limits import calibrated_limits, calibration_key, get_time_limit, reference_runtime, save_calibration
+from .nodes import dispatch_queue, get_nodes, node_queue, serves_language
+from .preflight import preflight_check
+from .reaper import reap_orphaned_sandboxes
+from .coalesce import RunCancelled, cancel_run, claim_slot, is_cancelled, run_cancellable, run_fingerprint
+from .zygote import build_zygote_files, build_zygote_setup, get_zygote_command, uses_zygote
+from assessments.models import CandidateTest, CodeSubmission, Question
 
 logger = logging.getLogger(__name__)
 
-# Docker client
-docker_client = docker.from_env()
-
 # Language configurations
 LANGUAGE_CONFIGS = {
     'python': {
         'image': 'python:3.9-slim',
         'extension': 'py',
         'command': 'python',
+        'runner': 'zygote',  # Fork runs from a warm interpreter instead of starting one each time
         'timeout': 10,
         'memory_limit': '128m',
     },
     'javascript': {
-        'image': 'node:14-alpine',
+        'image': 'node:14-slim',  # Debian-based: sandboxes need util-linux setpriv
         'extension': 'js',
         'command': 'node',
         'timeout': 10,
         'memory_limit': '128m',
+        'address_space_limit': '4g',  # V8 reserves far more address space than it uses
     },
     'java': {
-        'image': 'openjdk:11-jre-slim',
+        'image': 'openjdk:11-jdk-slim',
         'extension': 'java',
-        'command': 'java',
+        'source_file': '{main}.java',
+        'compile_command': 'javac -d build {source}',
+        'command': 'java -cp build {main}',
         'timeout': 15,
         'memory_limit': '256m',
+        'address_space_limit': '4g',  # The JVM reserves far more address space than it uses
     },
     'cpp': {
         'image': 'gcc:latest',
         'extension': 'cpp',
-        'command': 'g++ -o program program.cpp && ./program',
+        'compile_command': 'g++ -o build/program {source}',
+        'command': './build/program',
         'timeout': 10,
         'memory_limit': '128m',
     },
 }
 
+
+# Compiled languages write their artifacts here, relative to the sandbox workspace
+BUILD_DIR = 'build'
+
+JAVA_MAIN_CLASS = re.compile(r'public\s+(?:final\s+|abstract\s+)*class\s+(\w+)')
+
+
+def get_program_files(code, lang_config):
+    """
+    Work out the source file name and entry point for a program.
+    
+    Args:
+        code (str): The source code
+        lang_config (dict): Entry from LANGUAGE_CONFIGS
+        
+    Returns:
+        dict: ``source`` file name and ``main`` class for the command templates
+    """
+    match = JAVA_MAIN_CLASS.search(code)
+    main = match.group(1) if match else 'Main'
+    source = lang_config.get('source_file', 'program.{extension}').format(
+        extension=lang_config['extension'],
+        main=main,
+    )
+    return {'source': source, 'main': main}
+
+
+def get_program_command(lang_config, workspace, program):
+    """Return the command that runs the candidate's (compiled) program."""
+    if lang_config.get('compile_command'):
+        return lang_config['command'].format(**program)
+    return f"{lang_config['command']} {workspace}/{program['source']}"
+
+
+async def compile_program(backend, sandbox, language, lang_config, code, program, timeout):
+    """
+    Compile a program in a sandbox, reusing cached build artifacts when possible.
+    
+    Args:
+        backend (SandboxBackend): Backend the sandbox came from
+        sandbox (Sandbox): Sandbox holding the source file
+        language (str): The programming language
+        lang_config (dict): Entry from LANGUAGE_CONFIGS
+        code (str): The source code
+        program (dict): Result of get_program_files
+        timeout (int): Compilation timeout in seconds
+        
+    Returns:
+        str: Compiler output if compilation failed, otherwise None
+    """
+    compile_cache = get_compile_cache()
+    compile_command = lang_config['compile_command'].format(**program)
+    runtime_digest = await asyncio.to_thread(backend.runtime_digest, lang_config)
+    key = compile_cache_key(language, code, compile_command, runtime_digest)
+    
+    artifacts = await asyncio.to_thread(compile_cache.get, key)
+    if artifacts is not None:
+        if COMPILE_ERROR_NAME in artifacts:
+            return artifacts[COMPILE_ERROR_NAME].decode('utf-8', errors='replace')
+        await asyncio.to_thread(sandbox.put_files, artifacts, mode=0o755)
+        return None
+    
+    exit_code, _, stderr = await sandbox.aexec(
+        f"cd {sandbox.workspace} && mkdir -p {BUILD_DIR} && timeout {timeout} sh -c {shlex.quote(compile_command)}",
+        timeout=timeout,
+    )
+    if exit_code != 0:
+        compile_error = stderr.text() or f"Compilation failed with exit code {exit_code}"
+        # Codes from 124 up mean `timeout`, the shell or a signal stopped the
+        # compiler; anything else is the compiler rejecting the program, which
+        # is remembered so pre-flight checks turn it away without a sandbox
+        if exit_code < 124:
+            await asyncio.to_thread(compile_cache.put_error, key, compile_error)
+        return compile_error
+    
+    await asyncio.to_thread(lambda: compile_cache.put(key, sandbox.get_files(BUILD_DIR)))
+    return None
+
+
+async def run_test_case_batch(sandbox, lang_config, program, test_cases, timeout, parallel=False):
+    """
+    Run every test case against the program already copied into a sandbox.
+    
+    Args:
+        sandbox (Sandbox): Sandbox holding the candidate's program
+        lang_config (dict): Entry from LANGUAGE_CONFIGS
+        program (dict): Result of get_program_files
+        test_cases (list): Test case dicts with input_data and expected_output
+        timeout (int): Per-test-case timeout in seconds
+        parallel (bool): Run test cases concurrently inside the sandbox
+        
+    Returns:
+        tuple: (per-test-case verdicts, wall time, CPU time and peak memory;
+            captured runner output files)
+    
+    Raises:
+        RunnerFailed: If the runner did not finish
+    """
+    files = build_batch_files(test_cases)
+    setup = ''
+    results_dir = output_dir(sandbox.workspace)
+    if uses_zygote(lang_config, sandbox):
+        files.update(build_zygote_files())
+        setup = build_zygote_setup(sandbox.workspace, lang_config, sandbox.user)
+        program_command = get_zygote_command(sandbox.workspace, program['source'], timeout)
+        # The client talks to the privileged zygote, which drops privileges in each child
+        unprivileged = ''
+    else:
+        program_command = get_program_command(lang_config, sandbox.workspace, program)
+        unprivileged = sandbox.unprivileged([results_dir])
+    script = build_batch_script(
+        sandbox.workspace,
+        program_command,
+        len(test_cases),
+        timeout,
+        parallelism=settings.EXECUTION_BATCH_PARALLELISM if parallel else 1,
+        setup=setup,
+        unprivileged=unprivileged,
+    )
+    await asyncio.to_thread(sandbox.put_files, files)
+    
+    # Setup such as starting a zygote gets the language's own timeout on top of the test cases.
+    # The script is passed inline: the privileged runner never reads files the candidate can write
+    exit_code, _, stderr = await sandbox.aexec(
+        f"sh -c {shlex.quote(script)} {RUNNER_NAME}", timeout=timeout,
+        wall_timeout=timeout * len(test_cases) + lang_config['timeout'], privileged=True,
+    )
+    if exit_code != 0:
+        # The runner was killed or crashed: missing measurements would read as verdicts
+        raise RunnerFailed(f"Test runner exited with code {exit_code}: {stderr.text()}".rstrip(': '))
+    outputs = await asyncio.to_thread(
+        lambda: collect_batch_outputs(
+            sandbox.iter_files(results_dir),
+            settings.EXECUTION_OUTPUT_MAX_BYTES,
+            compress=settings.EXECUTION_OUTPUT_GZIP,
+            test_cases=test_cases,
+        )
+    )
+    return parse_batch_results(outputs, test_cases), outputs
+
+
+async def run_session(backend, sandbox, language, lang_config, code, test_cases, stdin, timeout, parallel=False):
+    """
+    Copy, compile and run a program in an acquired sandbox.
+    
+    Args:
+        backend (SandboxBackend): Backend the sandbox came from
+        sandbox (Sandbox): Sandbox to run in
+        language (str): The programming language
+        lang_config (dict): Entry from LANGUAGE_CONFIGS
+        code (str): The source code
+        test_cases (list): Test cases to run, or None for a single run
+        stdin (str): Standard input for a single run
+        timeout (int): Timeout in seconds
+        parallel (bool): Run test cases concurrently inside the sandbox
+        
+    Returns:
+        dict: Status, output, resource usage, per-test-case results and the
+            captured runner output files
+    """
+    # Copy code into the sandbox
+    program = get_program_files(code, lang_config)
+    await asyncio.to_thread(sandbox.put_files, {program['source']: code})
+    
+    # Build compiled languages once, or reuse a cached build
+    compile_error = None
+    if lang_config.get('compile_command'):
+        # Calibrated time limits bound the program, not the compiler
+        compile_timeout = max(timeout, lang_config['timeout'])
+        compile_error = await compile_program(backend, sandbox, language, lang_config, code, program, compile_timeout)
+    
+    if compile_error is not None:
+        return compile_error_run(test_cases, compile_error)
+    
+    if test_cases:
+        # Run all test cases in this one sandbox
+        test_results, outputs = await run_test_case_batch(
+            sandbox, lang_config, program, test_cases, timeout, parallel
+        )
+        return {
+            'status': 'completed',
+            'stdout': test_results[0]['stdout'],
+            'stderr': test_results[0]['stderr'],
+            'execution_time': sum(result['execution_time'] for result in test_results),
+            'cpu_time': sum(result['cpu_time'] for result in test_results),
+            'memory_usage': max(result['memory_usage'] for result in test_results),
+            'test_results': test_results,
+            'outputs': outputs,
+        }
+    
+    # Run the program once through the measuring runner
+    runs, outputs = await run_test_case_batch(sandbox, lang_config, program, [{'input_data': stdin or ''}], timeout)
+    run = runs[0]
+    return {
+        'status': 'timeout' if run['verdict'] == 'timeout' else 'completed',
+        'stdout': run['stdout'],
+        'stderr': run['stderr'],
+        'execution_time': run['execution_time'],
+        'cpu_time': run['cpu_time'],
+        'memory_usage': run['memory_usage'],
+        'test_results': [],
+        'outputs': outputs,
+    }
+
+
+def compile_error_run(test_cases, compile_error):
+    """Build the result of a run whose program did not compile."""
+    return {
+        'status': 'compile_error',
+        'stdout': '',
+        'stderr': compile_error,
+        'execution_time': 0,
+        'cpu_time': 0,
+        'memory_usage': 0,
+        'test_results': compile_error_results(test_cases or [], compile_error),
+        'outputs': {},
+    }
+
+
+def publish_test_results(execution_id, test_results, test_cases):
+    """Publish a progress event for every finished test case of a run."""
+    for index, (test_result, test_case) in enumerate(zip(test_results, test_cases)):
+        publish_event(execution_id, 'test_case', index=index, total=len(test_results),
+                      **test_case_event(test_result, hidden=test_case.get('hidden', False)))
+
+
+def queue_execution(code, language, candidate_test_id=None, question_id=None, user_id=None, **kwargs):
+    """
+    Queue ``execute_code`` for a run whose progress clients follow as events.
+    
+    A run for a candidate test and question shares an identical run of the
+    same pair that is still queued, running or finished, and cancels any
+    other run of that pair.
+    
+    Args:
+        code (str): The code to execute
+        language (str): The programming language
+        candidate_test_id (str, optional): Candidate test the run belongs to
+        question_id (str, optional): Question the run belongs to
+        user_id (str, optional): User who may follow the run's events; defaults to
+            the candidate of ``candidate_test_id``
+        **kwargs: Further ``execute_code`` arguments
+        
+    Returns:
+        str: The run's execution_id, which keys its event stream
+    """
+    execution_id = str(uuid.uuid4())
+    if candidate_test_id is not None and question_id is not None:
+        fingerprint = run_fingerprint(code, language, **kwargs)
+        execution_id, is_new, superseded = claim_slot(candidate_test_id, question_id, fingerprint, execution_id)
+        if not is_new:
+            return execution_id
+        if superseded is not None:
+            cancel_run(superseded)
+    if user_id is None and candidate_test_id is not None:
+        user_id = CandidateTest.objects.filter(id=candidate_test_id).values_list(
+            'candidate_assessment__candidate_id', flat=True
+        ).first()
+    if user_id is not None:
+        set_owner(execution_id, user_id)
+    set_status(execution_id, 'pending')
+    execute_code.apply_async(
+        (code, language), {'execution_id': execution_id, **kwargs},
+        queue=dispatch_queue(language, kwargs.get('lane', 'interactive'), kwargs.get('organization_id')),
+    )
+    return execution_id
+
+
 @shared_task
-def execute_code(code, language, execution_id=None, test_cases=None, timeout=None):
+def execute_code(code, language, execution_id=None, test_cases=None, timeout=None, parallel=False,
+                 stdin=None, bypass_cache=False, lane='interactive', organization_id=None, cancellable=None):
     """
     Execute code in a sandboxed environment.
     
@@ -64,6 +355,13 @@ def execute_code(code, language, execution_id=None, test_cases=None, timeout=Non
         execution_id (str, optional): Unique ID for this execution
         test_cases (list, optional): List of test cases to run
         timeout (int, optional): Timeout in seconds
+        parallel (bool, optional): Run test cases concurrently in the sandbox
+        stdin (str, optional): Standard input for a single run
+        bypass_cache (bool, optional): Always run in a sandbox, ignoring memoized results
+        lane (str, optional): Priority lane (see EXECUTION_LANES) whose sandbox budget the run uses
+        organization_id (str, optional): Organisation whose fair share of sandboxes the run uses
+        cancellable (bool, optional): Watch for the run being cancelled while it is in its sandbox;
+            defaults to interactive runs, the ones newer runs supersede
         
     Returns:
         dict: Execution results
@@ -71,21 +369,20 @@ def execute_code(code, language, execution_id=None, test_cases=None, timeout=Non
     if execution_id is None:
         execution_id = str(uuid.uuid4())
     
-    # Create or get execution result
-    execution_result, _ = ExecutionResult.objects.get_or_create(
-        execution_id=execution_id,
-        defaults={'status': 'pending'}
-    )
+    if cancellable is None:
+        cancellable = lane == 'interactive'
+    
+    # A run superseded while it was queued never starts
+    if is_cancelled(execution_id):
+        save_result(execution_id, 'cancelled')
+        return {'status': 'cancelled', 'execution_id': execution_id}
     
-    # Update status to running
-    execution_result.status = 'running'
-    execution_result.save()
+    # Progress is only tracked in the cache; the database is written once, when the run ends
+    set_status(execution_id, 'running')
     
     # Get language configuration
     if language not in LANGUAGE_CONFIGS:
-        execution_result.status = 'failed'
-        execution_result.stderr = f"Unsupported language: {language}"
-        execution_result.save()
+        save_result(execution_id, 'failed', stderr=f"Unsupported language: {language}")
         return {'status': 'failed', 'error': f"Unsupported language: {language}"}
     
     lang_config = LANGUAGE_CONFIGS[language]
@@ -94,91 +391,442 @@ def execute_code(code, language, execution_id=None, test_cases=None, timeout=Non
     if timeout is None:
         timeout = lang_config['timeout']
     
+    # A run's own output is its first test case's, which candidates may not get to see
+    private_output = bool(test_cases) and test_cases[0].get('hidden', False)
+    
+    # Serve identical runs from the result cache
+    cache_key = execution_cache_key(code, language, stdin, test_cases, timeout, lang_config['memory_limit'])
+    cached_result = None if bypass_cache else get_cached_result(cache_key)
+    if cached_result is not None:
+        publish_test_results(execution_id, cached_result['test_results'], test_cases or [])
+        save_result(
+            execution_id,
+            cached_result['status'],
+            stdout=cached_result['stdout'],
+            stderr=cached_result['stderr'],
+            execution_time=cached_result['execution_time'],
+            cpu_time=cached_result.get('cpu_time'),
+            memory_usage=cached_result['memory_usage'],
+            is_cached=True,
+            private_output=private_output,
+        )
+        return {**cached_result, 'execution_id': execution_id, 'cached': True}
+    
     try:
-        # Create temporary directory for code
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # Write code to file
-            file_path = os.path.join(temp_dir, f"program.{lang_config['extension']}")
-            with open(file_path, 'w') as f:
-                f.write(code)
-            
-            # Prepare container
-            container = docker_client.containers.run(
-                image=lang_config['image'],
-                command=f"{lang_config['command']} /code/program.{lang_config['extension']}",
-                volumes={temp_dir: {'bind': '/code', 'mode': 'ro'}},
-                mem_limit=lang_config['memory_limit'],
-                network_mode='none',
-                detach=True,
-                stdout=True,
-                stderr=True,
-            )
-            
-            # Record container
-            SandboxContainer.objects.create(
-                container_id=container.id,
-                execution_id=execution_id,
-                language=language,
-                status='running'
-            )
-            
-            # Wait for container to finish or timeout
+        backend = get_sandbox_backend()
+        
+        # Programs that do not parse, or are known not to compile, never get a sandbox
+        compile_error = preflight_check(backend, language, lang_config, code, get_program_files(code, lang_config))
+        if compile_error is not None:
+            run = {**compile_error_run(test_cases, compile_error['output']), 'compile_error': compile_error}
+        else:
+            sandbox = backend.acquire(language, lang_config)
+            healthy = False
             try:
-                container.wait(timeout=timeout)
-                status = 'completed'
-            except Exception:
-                container.stop()
-                status = 'timeout'
-            
-            # Get logs
-            stdout = container.logs(stdout=True, stderr=False).decode('utf-8')
-            stderr = container.logs(stdout=False, stderr=True).decode('utf-8')
-            
-            # Get stats
-            stats = container.stats(stream=False)
-            memory_usage = stats.get('memory_stats', {}).get('usage', 0) // 1024  # Convert to KB
-            
-            # Clean up
-            container.remove()
+                # Record container
+                track_container(sandbox.id, execution_id, language, 'running')
+                
+                # Drive the sandbox from the worker's event loop alongside other runs;
+                # cancelling the run kills the sandbox
+                session = run_session(backend, sandbox, language, lang_config, code, test_cases, stdin, timeout, parallel)
+                if cancellable:
+                    session = run_cancellable(execution_id, sandbox, session)
+                run = get_execution_engine().run(session, lane=lane, organization_id=organization_id)
+                healthy = True
+            finally:
+                # Hand the sandbox back; pooled containers are recycled after too many uses or on error
+                recycled = sandbox.close(healthy=healthy)
             
             # Update container status
-            sandbox_container = SandboxContainer.objects.get(container_id=container.id)
-            sandbox_container.status = 'removed'
-            sandbox_container.save()
-            
-            # Update execution result
-            execution_result.status = status
-            execution_result.stdout = stdout
-            execution_result.stderr = stderr
-            execution_result.execution_time = timeout if status == 'timeout' else 0  # Placeholder
-            execution_result.memory_usage = memory_usage
-            execution_result.save()
-            
-            # Run test cases if provided
-            test_results = []
-            if test_cases and status == 'completed':
-                for test_case in test_cases:
-                    # TODO: Implement test case execution
-                    pass
-            
+            track_container(sandbox.id, execution_id, language, 'removed' if recycled else 'exited')
+        
+        publish_test_results(execution_id, run['test_results'], test_cases or [])
+        
+        # Save execution result; the full output is only kept as a gzip archive
+        stdout_file, stderr_file = case_outputs(run.pop('outputs'), 0)
+        save_result(
+            execution_id,
+            run['status'],
+            stdout=run['stdout'],
+            stderr=run['stderr'],
+            stdout_archive=stdout_file.archive() if stdout_file else None,
+            stderr_archive=stderr_file.archive() if stderr_file else None,
+            execution_time=run['execution_time'],
+            cpu_time=run['cpu_time'],
+            memory_usage=run['memory_usage'],
+            private_output=private_output,
+        )
+        
+        result = {
+            'execution_id': execution_id,
+            **run,
+            'cached': False,
+        }
+        store_result(cache_key, result)
+        return result
+    
+    except RunCancelled:
+        save_result(execution_id, 'cancelled')
+        return {'status': 'cancelled', 'execution_id': execution_id}
+    
+    except Exception as e:
+        logger.exception(f"Error executing code: {e}")
+        save_result(execution_id, 'failed', stderr=str(e))
+        return {'status': 'failed', 'error': str(e)}
+
+
+def record_grade(code_submission, result, total_test_cases):
+    """
+    Store a grading run's verdicts on its code submission.
+    
+    Args:
+        code_submission (CodeSubmission): The graded submission
+        result (dict): Result of the run over all of its question's test cases
+        total_test_cases (int): Number of test cases of the question
+        
+    Returns:
+        dict: Grading results with per-test-case verdicts
+    """
+    test_results = result.get('test_results', [])
+    
+    # Update code submission
+    code_submission.passed_test_cases = sum(1 for r in test_results if r['verdict'] == 'passed')
+    code_submission.total_test_cases = total_test_cases
+    code_submission.execution_time = result.get('execution_time')
+    code_submission.cpu_time = result.get('cpu_time')
+    code_submission.memory_usage = result.get('memory_usage')
+    code_submission.save()
+    
+    # Static analysis is for reviewers, so it runs after grading on its own queue
+    if settings.EXECUTION_ANALYSIS_ON_GRADE:
+        code_submission_id = str(code_submission.id)
+        transaction.on_commit(lambda: analyze_submission.delay(code_submission_id))
+    
+    return {
+        'code_submission_id': str(code_submission.id),
+        'status': result['status'],
+        'passed_test_cases': code_submission.passed_test_cases,
+        'total_test_cases': code_submission.total_test_cases,
+        'test_results': test_results,
+    }
+
+
+def _grade(code_submission_id, parallel=False, lane='grading', bypass_cache=False, stop_on_failure=None):
+    """
+    Grade a code submission against all test cases of its question.
+    
+    Questions with more than EXECUTION_GRADING_SHARD_SIZE test cases are
+    graded by shards on several workers (see execution.grading). Questions
+    with a reference solution are graded under their calibrated time limits
+    (see execution.limits).
+    
+    Args:
+        code_submission_id (str): ID of the code submission
+        parallel (bool, optional): Run test cases concurrently in the sandbox
+        lane (str, optional): Priority lane the run belongs to
+        bypass_cache (bool, optional): Always run in a sandbox, ignoring memoized results
+        stop_on_failure (bool, optional): Stop sharded grading at the first test case that
+            does not pass; defaults to EXECUTION_GRADING_STOP_ON_FAILURE
+        
+    Returns:
+        dict: Grading results with per-test-case verdicts, or the ``grading`` status and
+            grading_id of a sharded run, whose verdicts are stored when its last shard ends
+    """
+    try:
+        code_submission = CodeSubmission.objects.select_related(
+            'candidate_answer__candidate_test__test', 'candidate_answer__question'
+        ).get(id=code_submission_id)
+        question = code_submission.candidate_answer.question
+        version = test_case_version(question.id)
+        test_cases = load_test_cases(question.id, version)
+        timeout = get_time_limit(question, code_submission.language, version)
+        organization_id = str(code_submission.candidate_answer.candidate_test.test.organization_id)
+        
+        shards = shard_test_cases(
+            test_cases, settings.EXECUTION_GRADING_SHARD_SIZE, settings.EXECUTION_GRADING_MAX_SHARDS
+        )
+        # Sharded runs, and runs in a language this node does not serve, go to the language's nodes
+        if len(shards) > 1 or not serves_language(code_submission.language):
+            if stop_on_failure is None:
+                stop_on_failure = settings.EXECUTION_GRADING_STOP_ON_FAILURE
+            grading_id = str(uuid.uuid4())
+            execution_ids = shard_execution_ids(grading_id, len(shards))
+            queue = dispatch_queue(code_submission.language, lane, organization_id)
+            header = group(
+                grade_shard.signature(
+                    (code_submission.code_content, code_submission.language, shard, execution_id),
+                    {
+                        'shard_execution_ids': execution_ids if stop_on_failure else None,
+                        'timeout': timeout,
+                        'parallel': parallel,
+                        'bypass_cache': bypass_cache,
+                        'lane': lane,
+                        'organization_id': organization_id,
+                    },
+                    queue=queue,
+                )
+                for shard, execution_id in zip(shards, execution_ids)
+            )
+            chord(header)(finish_grading.signature((code_submission_id,), queue=queue))
             return {
-                'execution_id': execution_id,
-                'status': status,
-                'stdout': stdout,
-                'stderr': stderr,
-                'execution_time': execution_result.execution_time,
-                'memory_usage': memory_usage,
-                'test_results': test_results
+                'code_submission_id': code_submission_id,
+                'status': 'grading',
+                'grading_id': grading_id,
+                'shards': len(shards),
+                'total_test_cases': len(test_cases),
             }
+        
+        result = execute_code(
+            code_submission.code_content,
+            code_submission.language,
+            test_cases=test_cases,
+            timeout=timeout,
+            parallel=parallel,
+            bypass_cache=bypass_cache,
+            lane=lane,
+            organization_id=organization_id,
+        )
+        return record_grade(code_submission, result, len(test_cases))
     
     except Exception as e:
-        logger.exception(f"Error executing code: {e}")
-        execution_result.status = 'failed'
-        execution_result.stderr = str(e)
-        execution_result.save()
+        logger.exception(f"Error grading submission: {e}")
         return {'status': 'failed', 'error': str(e)}
 
 
+@shared_task
+def grade_shard(code, language, test_cases, execution_id, shard_execution_ids=None, timeout=None, parallel=False,
+                bypass_cache=False, lane='grading', organization_id=None):
+    """
+    Run one shard of a submission's test cases.
+    
+    Args:
+        code (str): The code to grade
+        language (str): The programming language
+        test_cases (list): Test cases of the shard
+        execution_id (str): ID of the shard's run
+        shard_execution_ids (list, optional): IDs of every shard of the grading run, to
+            cancel once a test case of this shard does not pass; None grades every shard
+        timeout (float, optional): Per-test-case time limit in seconds; defaults to the language's
+        parallel (bool, optional): Run test cases concurrently in the sandbox
+        bypass_cache (bool, optional): Always run in a sandbox, ignoring memoized results
+        lane (str, optional): Priority lane the run belongs to
+        organization_id (str, optional): Organisation whose fair share of sandboxes the run uses
+        
+    Returns:
+        dict: Status, resource usage and one result per test case of the shard
+    """
+    result = shard_result(execute_code(
+        code, language, execution_id=execution_id, test_cases=test_cases, timeout=timeout, parallel=parallel,
+        bypass_cache=bypass_cache, lane=lane, organization_id=organization_id,
+        cancellable=bool(shard_execution_ids),
+    ), test_cases)
+    
+    if shard_execution_ids and result['status'] != 'cancelled' and any(
+        entry['verdict'] != 'passed' for entry in result['test_results']
+    ):
+        for other in shard_execution_ids:
+            if other != execution_id:
+                cancel_run(other)
+    return result
+
+
+@shared_task
+def finish_grading(shard_results, code_submission_id):
+    """
+    Store the merged verdicts of a sharded grading run.
+    
+    Args:
+        shard_results (list): Results of ``grade_shard``, in shard order
+        code_submission_id (str): ID of the code submission
+        
+    Returns:
+        dict: Grading results with per-test-case verdicts
+    """
+    result = merge_shard_results(shard_results)
+    code_submission = CodeSubmission.objects.get(id=code_submission_id)
+    return record_grade(code_submission, result, len(result['test_results']))
+
+
+@shared_task
+def grade_submission(code_submission_id, parallel=False, stop_on_failure=None, organization_id=None):
+    """
+    Grade a final code submission on the grading lane.
+    
+    Args:
+        code_submission_id (str): ID of the code submission
+        parallel (bool, optional): Run test cases concurrently in the sandbox
+        stop_on_failure (bool, optional): Stop sharded grading at the first test case that does not pass
+        organization_id (str, optional): Organisation of the submission; routes the task to its
+            fair queue (execution.nodes.route_fair_queue) when queued
+        
+    Returns:
+        dict: Grading results with per-test-case verdicts
+    """
+    return _grade(code_submission_id, parallel=parallel, lane='grading', stop_on_failure=stop_on_failure)
+
+
+@shared_task
+def rejudge_submission(code_submission_id, parallel=False, organization_id=None):
+    """
+    Grade a code submission again on the background rejudge lane.
+    
+    Args:
+        code_submission_id (str): ID of the code submission
+        parallel (bool, optional): Run test cases concurrently in the sandbox
+        organization_id (str, optional): Organisation of the submission; routes the task to its
+            fair queue (execution.nodes.route_fair_queue) when queued
+        
+    Returns:
+        dict: Grading results with per-test-case verdicts
+    """
+    # Test cases may have changed since the last run, so never replay a memoized result;
+    # a rejudge always produces the full set of verdicts
+    return _grade(code_submission_id, parallel=parallel, lane='rejudge', bypass_cache=True, stop_on_failure=False)
+
+
+@shared_task
+def rejudge_question(question_id):
+    """
+    Queue a rejudge of every code submission to a question.
+    
+    Args:
+        question_id (str): ID of the question
+        
+    Returns:
+        dict: Number of queued rejudges
+    """
+    code_submissions = CodeSubmission.objects.filter(
+        candidate_answer__question_id=question_id
+    ).values_list('id', 'candidate_answer__candidate_test__test__organization_id')
+    
+    count = 0
+    for code_submission_id, organization_id in code_submissions.iterator():
+        rejudge_submission.delay(str(code_submission_id), organization_id=str(organization_id))
+        count += 1
+    
+    return {'question_id': question_id, 'queued': count}
+
+
+@shared_task
+def calibrate_time_limits(question_id):
+    """
+    Calibrate a question's time limits from its reference solution.
+    
+    Args:
+        question_id (str): ID of the question
+        
+    Returns:
+        dict: Calibration status, the reference runtime and each language's time limit
+    """
+    question = Question.objects.get(id=question_id)
+    language = question.reference_language
+    version = test_case_version(question_id)
+    test_cases = load_test_cases(question_id, version)
+    if not question.reference_solution or not test_cases:
+        return {'question_id': question_id, 'status': 'skipped'}
+    
+    key = calibration_key(question.reference_solution, language, version)
+    if language not in LANGUAGE_CONFIGS:
+        error = f"Unsupported language: {language}"
+        save_calibration(question_id, key, version, language, 'failed', error=error)
+        return {'question_id': question_id, 'status': 'failed', 'error': error}
+    
+    runs = []
+    for _ in range(settings.EXECUTION_CALIBRATION_RUNS):
+        # Measure real runs under the language's own timeout, on the background lane
+        result = execute_code(question.reference_solution, language, test_cases=test_cases,
+                              bypass_cache=True, lane='rejudge')
+        test_results = result.get('test_results') or []
+        failed = [entry for entry in test_results if entry['verdict'] != 'passed']
+        if result['status'] != 'completed' or failed or not test_results:
+            if result['status'] == 'compile_error':
+                error = f"Reference solution did not compile: {result['stderr'][:200]}"
+            else:
+                error = result.get('error') or f"Reference solution did not pass {len(failed) or len(test_cases)} test cases"
+            save_calibration(question_id, key, version, language, 'failed', error=error)
+            logger.warning(f"Could not calibrate time limits of question {question_id}: {error}")
+            return {'question_id': question_id, 'status': 'failed', 'error': error}
+        runs.append(test_results)
+    
+    runtime = reference_runtime(runs)
+    time_limits = calibrated_limits(
+        runtime, language, {name: config['timeout'] for name, config in LANGUAGE_CONFIGS.items()}
+    )
+    save_calibration(question_id, key, version, language, 'calibrated', runtime=runtime, time_limits=time_limits)
+    return {'question_id': question_id, 'status': 'calibrated', 'reference_runtime': runtime,
+            'time_limits': time_limits}
+
+
+@shared_task
+def analyze_submission(code_submission_id):
+    """
+    Run static analysis on a code submission.
+    
+    Args:
+        code_submission_id (str): ID of the code submission
+        
+    Returns:
+        dict: Analysis counts
+    """
+    return analyze_submissions(list(CodeSubmission.objects.filter(id=code_submission_id)))
+
+
+@shared_task
+def analyze_assessment(assessment_id):
+    """
+    Run static analysis on every code submission of an assessment.
+    
+    Args:
+        assessment_id (str): ID of the assessment
+        
+    Returns:
+        dict: Analysis counts
+    """
+    code_submissions = CodeSubmission.objects.filter(
+        candidate_answer__candidate_test__candidate_assessment__assessment_id=assessment_id
+    ).only('id', 'language', 'code_content').order_by('id')
+    
+    totals = {'assessment_id': assessment_id, 'analyzed': 0, 'run': 0, 'skipped': 0}
+    batch_size = settings.EXECUTION_ANALYSIS_BATCH_SIZE
+    batch = []
+    for code_submission in code_submissions.iterator(chunk_size=batch_size):
+        batch.append(code_submission)
+        if len(batch) == batch_size:
+            for key, count in analyze_submissions(batch).items():
+                totals[key] += count
+            batch = []
+    if batch:
+        for key, count in analyze_submissions(batch).items():
+            totals[key] += count
+    return totals
+
+
+@shared_task
+def reap_sandboxes():
+    """
+    Send a sweep for orphaned sandbox containers to every live execution host.
+    
+    Returns:
+        dict: The hosts a sweep was sent to
+    """
+    hosts = sorted({node['host'] for node in get_nodes() if 'host' in node})
+    for host in hosts:
+        # A sweep that waits past the next one is redundant
+        reap_node_sandboxes.apply_async(queue=node_queue(host), expires=settings.EXECUTION_REAPER_INTERVAL)
+    return {'hosts': hosts}
+
+
+@shared_task
+def reap_node_sandboxes():
+    """
+    Remove sandbox containers left behind by dead workers on this host and close their records.
+    
+    Returns:
+        dict: Counts of the sweep
+    """
+    return reap_orphaned_sandboxes()
+
+
 @shared_task
 def check_plagiarism(code_submission_id, language, question_id=None):
     """
@@ -192,6 +840,9 @@ def check_plagiarism(code_submission_id, language, question_id=None):
     Returns:
         dict: Plagiarism detection results
     """
+    # Only plagiarism checks need the C extension, so keep it out of worker start-up
+    from Levenshtein import distance
+    
     try:
         # Get code submission
         code_submission = CodeSubmission.objects.get(id=code_submission_id)
@@ -232,7 +883,7 @@ def check_plagiarism(code_submission_id, language, question_id=None):
                 if similarity > 0.7:
                     similar_submission = SimilarSubmission.objects.create(
                         plagiarism_result=plagiarism_result,
-                        candidate_id=submission.candidate_answer.candidate_test.candidate_id,
+                        candidate_id=submission.candidate_answer.candidate_test.candidate_assessment.candidate_id,
                         similarity_score=similarity * 100,
                         matching_lines=matching_lines
                     )
@@ -0,0 +1,305 @@
+"""
+Worker-local cache of each question's test cases.
+
+Grading needs every test case of a question, and their inputs and expected
+outputs can be large. Instead of loading them from the database for every
+run, a worker keeps them as bundles keyed by question and a hash of their
+content (``grading.test_case_version``), so any change to a test case makes
+the next lookup miss.
+
+Bundles live in two tiers:
+
+- on local disk, one file per question holding an index and the raw
+  inputs and expected outputs, shared by the processes of a host. A process
+  decodes a bundle once when it loads it into memory. The directory is
+  bounded in size and evicts the least recently used bundles first; it is
+  only rescanned when the bound may be exceeded or ``EVICT_INTERVAL`` passed.
+- in memory, as decoded test case lists bounded by
+  ``EXECUTION_TEST_CASE_CACHE_MEMORY_BYTES``, so repeated runs of a process
+  reuse the same strings instead of copying them again
+
+Cached test case lists are shared; callers must not modify them.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Start of every bundle file, followed by the index length (8 bytes), the JSON index and the data
+BUNDLE_MAGIC = b'BLTC2\n'
+BUNDLE_SUFFIX = '.bundle'
+INDEX_LENGTH_BYTES = 8
+
+# Longest time between rescans of the directory, in seconds; other processes' bundles only count after one
+EVICT_INTERVAL = 10.0
+
+
+def write_bundle(path, test_cases):
+    """
+    Write test cases to a bundle file.
+
+    Args:
+        path (str): Path of the bundle file
+        test_cases (list): Test case dicts with ``input_data`` and ``expected_output``
+
+    Returns:
+        int: Size of the file in bytes
+    """
+    index, chunks, offset = [], [], 0
+    for test_case in test_cases:
+        entry = {key: value for key, value in test_case.items() if key not in ('input_data', 'expected_output')}
+        for field in ('input_data', 'expected_output'):
+            if field not in test_case:
+                continue
+            data = (test_case[field] or '').encode('utf-8')
+            entry[field] = [offset, len(data)]
+            chunks.append(data)
+            offset += len(data)
+        index.append(entry)
+    header = json.dumps(index).encode('utf-8')
+
+    # Write to a temporary file first so readers never see a partial bundle
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(BUNDLE_MAGIC)
+        f.write(len(header).to_bytes(INDEX_LENGTH_BYTES, 'big'))
+        f.write(header)
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(temp_path, path)
+    return len(BUNDLE_MAGIC) + INDEX_LENGTH_BYTES + len(header) + offset
+
+
+class TestCaseBundle:
+    """Parsed bundle file, read in one call."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        if not data.startswith(BUNDLE_MAGIC):
+            raise ValueError("Not a test case bundle")
+        start = len(BUNDLE_MAGIC) + INDEX_LENGTH_BYTES
+        length = int.from_bytes(data[len(BUNDLE_MAGIC):start], 'big')
+        self.index = json.loads(data[start:start + length])
+        self._data = data
+        self._offset = start + length
+
+    def __len__(self):
+        return len(self.index)
+
+    def field(self, position, name):
+        """
+        Return a test case's input or expected output.
+
+        Args:
+            position (int): Position of the test case in the bundle
+            name (str): ``input_data`` or ``expected_output``
+
+        Returns:
+            bytes: The UTF-8 encoded field, or None if the test case has none
+        """
+        span = self.index[position].get(name)
+        if span is None:
+            return None
+        offset, length = span
+        start = self._offset + offset
+        return self._data[start:start + length]
+
+    def test_cases(self):
+        """Decode every test case into the dicts ``execute_code`` takes."""
+        test_cases = []
+        for position, entry in enumerate(self.index):
+            test_case = dict(entry)
+            for name in ('input_data', 'expected_output'):
+                if name in entry:
+                    test_case[name] = self.field(position, name).decode('utf-8')
+            test_cases.append(test_case)
+        return test_cases
+
+
+def _size(test_cases):
+    return sum(len(test_case.get('input_data') or '') + len(test_case.get('expected_output') or '')
+               for test_case in test_cases)
+
+
+class TestCaseCache:
+    """Size-bounded LRU store of test case bundles, on local disk and in memory."""
+
+    def __init__(self, directory, max_bytes, memory_max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_max_bytes = memory_max_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        # Bytes on disk as of the last scan plus what this process wrote since
+        self._disk_bytes = 0
+        self._last_scan = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, question_id, version):
+        return os.path.join(self.directory, f"{question_id}.{version}{BUNDLE_SUFFIX}")
+
+    def get(self, question_id, version):
+        """
+        Look up the test cases of a question.
+
+        Args:
+            question_id (str): ID of the question
+            version (str): Result of ``test_case_version`` for the question
+
+        Returns:
+            list: Test case dicts, or None on a miss
+        """
+        key = (str(question_id), version)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+        path = self._path(question_id, version)
+        try:
+            bundle = TestCaseBundle(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Discarding corrupt test case bundle {path}: {e}")
+            self._remove(path)
+            self.misses += 1
+            return None
+        test_cases = bundle.test_cases()
+        self._touch(path)
+        self._remember(key, test_cases)
+        self.disk_hits += 1
+        return test_cases
+
+    def put(self, question_id, version, test_cases):
+        """
+        Store the test cases of a question, replacing its older versions.
+
+        Args:
+            question_id (str): ID of the question
+            version (str): Result of ``test_case_version`` for the question
+            test_cases (list): Test case dicts
+        """
+        self.invalidate(question_id)
+        path = self._path(question_id, version)
+        written = write_bundle(path, test_cases)
+        self._touch(path)
+        self._remember((str(question_id), version), test_cases)
+        self._evict(written)
+
+    def invalidate(self, question_id):
+        """Forget every version of a question's test cases."""
+        question_id = str(question_id)
+        with self._lock:
+            for key in [key for key in self._memory if key[0] == question_id]:
+                self._memory_bytes -= self._memory.pop(key)[1]
+        prefix = question_id + '.'
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(prefix) and entry.name.endswith(BUNDLE_SUFFIX):
+                self._remove(entry.path)
+
+    def _remember(self, key, test_cases):
+        size = _size(test_cases)
+        if size > self.memory_max_bytes:
+            return
+        with self._lock:
+            if key in self._memory:
+                self._memory_bytes -= self._memory.pop(key)[1]
+            self._memory[key] = (test_cases, size)
+            self._memory_bytes += size
+            while self._memory_bytes > self.memory_max_bytes:
+                _, (_, evicted) = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted
+
+    def _touch(self, path):
+        # Filesystem timestamps come from a coarse clock; set a precise one for LRU order
+        now = time.time_ns()
+        try:
+            os.utime(path, ns=(now, now))
+        except FileNotFoundError:
+            pass
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(BUNDLE_SUFFIX):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self, written):
+        now = time.monotonic()
+        with self._lock:
+            self._disk_bytes += written
+            if self._disk_bytes <= self.max_bytes and self._last_scan is not None \
+                    and now - self._last_scan < EVICT_INTERVAL:
+                return
+            self._last_scan = now
+        # Scanned without the lock; concurrent sweeps at worst remove a bundle twice
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+        with self._lock:
+            self._disk_bytes = total
+
+    def stats(self):
+        """Return the number of bundles, their size in each tier and hit counts."""
+        entries = self._entries()
+        with self._lock:
+            memory_entries, memory_bytes = len(self._memory), self._memory_bytes
+        return {
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+            'memory_entries': memory_entries,
+            'memory_bytes': memory_bytes,
+            'memory_max_bytes': self.memory_max_bytes,
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_test_case_cache():
+    """Get the worker's test case cache, creating it on first use."""
+    global _cache
+    from django.conf import settings
+
+    with _cache_lock:
+        if _cache is None:
+            _cache = TestCaseCache(
+                settings.EXECUTION_TEST_CASE_CACHE_DIR,
+                settings.EXECUTION_TEST_CASE_CACHE_MAX_BYTES,
+                settings.EXECUTION_TEST_CASE_CACHE_MEMORY_BYTES,
+            )
+    return _cache
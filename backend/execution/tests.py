@@ -0,0 +1,1356 @@
+import asyncio
+import importlib.util
+import gzip
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import uuid
+from unittest import mock
+from celery.app.amqp import Queues
+from django.core.cache import cache
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from kombu import Queue
+from assessments.models import (
+    Assessment, CandidateAnswer, CandidateAssessment, CandidateTest, CodeSubmission, Question, Test, TestLibrary,
+    TestCase as QuestionTestCase,
+)
+from bluapt.celery import app
+from execution.benchmark import benchmark_plagiarism
+from execution.analysis import analyze_python, cyclomatic_complexity
+from execution.batch import collect_batch_outputs, parse_batch_results, compile_error_results
+from execution.engine import ExecutionEngine, get_execution_engine
+from execution.events import LocalEventBus
+from execution.fair import FairScheduler
+from execution.grading import load_test_cases, shard_result, shard_test_cases
+from execution.limits import calibrated_limits
+from execution.coalesce import cancel_run, claim_slot, is_cancelled
+from execution.comparators import compare_output, register_checker
+from execution.compile_cache import CompileCache, compile_cache_key, get_compile_cache
+from execution.preflight import check_javascript, check_python
+from execution.test_case_cache import TestCaseBundle, TestCaseCache
+from execution.reaper import get_reaper_report, reap_orphaned_sandboxes
+from execution.output import capture, demux, iter_tar_files
+from execution.pool import OWNER_KEY_PREFIX, OWNER_LABEL, POOL_LABEL, ContainerPool, PoolExhausted, reset_command
+from execution.sandbox import SANDBOX_BACKENDS, DockerSandbox, LocalSandboxBackend, SandboxUnavailable, get_sandbox_backend
+from execution.lifecycle import get_container, get_status, set_owner, set_status, track_container
+from execution.management.commands.benchmark_execution import benchmark_fake_docker
+from execution.nodes import (
+    dispatch_queue, get_language_capacity, node_queue, report_capacity, subscribe_language_queues,
+)
+from execution.models import ExecutionResult, StaticAnalysisResult
+from users.models import Organization, User
+from execution.tasks import (
+    LANGUAGE_CONFIGS, analyze_assessment, calibrate_time_limits, execute_code, grade_shard, grade_submission,
+    queue_execution, reap_sandboxes, run_session,
+)
+from execution.views import execution_events, stream_events
+from execution.warmup import get_readiness, run_warmup_program, warm_up
+
+PYTHON_CONFIG = {
+    'image': 'python:3.9-slim',
+    'extension': 'py',
+    'command': 'python',
+    'timeout': 10,
+    'memory_limit': '128m',
+}
+
+# Loading every task module must stay cheap: Celery autodiscovery imports them in each process
+IMPORT_BUDGET_SECONDS = 2.0
+HEAVY_MODULES = ['docker', 'numpy', 'pandas', 'requests', 'Levenshtein']
+
+IMPORT_PROBE = '''
+import json, sys, time
+import django
+django.setup()
+started = time.perf_counter()
+import analytics.tasks, execution.tasks
+print(json.dumps({
+    'seconds': time.perf_counter() - started,
+    'loaded': [name for name in %r if name in sys.modules],
+}))
+''' % (HEAVY_MODULES,)
+
+
+class ImportCostTests(SimpleTestCase):
+    def test_task_modules_import_within_budget(self):
+        """Task modules load quickly and leave heavy clients and libraries unloaded"""
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'bluapt.settings'}
+        probe = subprocess.run(
+            [sys.executable, '-c', IMPORT_PROBE],
+            capture_output=True, text=True, env=env, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        )
+        report = json.loads(probe.stdout.splitlines()[-1])
+
+        self.assertEqual(report['loaded'], [])
+        self.assertLess(report['seconds'], IMPORT_BUDGET_SECONDS)
+
+
+class ContainerPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.client = mock.MagicMock()
+        self.client.containers.run.side_effect = lambda **kwargs: mock.MagicMock(
+            exec_run=mock.MagicMock(return_value=(0, b''))
+        )
+
+    def test_fill_starts_min_size_containers(self):
+        """Filling the pool pre-starts the minimum number of containers"""
+        pool = ContainerPool(self.client, 'python', PYTHON_CONFIG, min_size=2, max_size=4)
+        pool.fill()
+
+        self.assertEqual(self.client.containers.run.call_count, 2)
+        self.assertEqual(pool.stats()['idle'], 2)
+
+    def test_container_is_reused_until_max_uses(self):
+        """A healthy container goes back to the pool until it is worn out"""
+        pool = ContainerPool(self.client, 'python', PYTHON_CONFIG, min_size=0, max_size=1, max_uses=2)
+
+        first = pool.acquire()
+        self.assertFalse(pool.release(first))
+        second = pool.acquire()
+        self.assertIs(first, second)
+        self.assertTrue(pool.release(second))
+        self.assertEqual(pool.stats()['recycled'], 1)
+
+    def test_failed_run_recycles_container(self):
+        """A container is discarded when the run using it fails"""
+        pool = ContainerPool(self.client, 'python', PYTHON_CONFIG, min_size=0, max_size=1)
+
+        with self.assertRaises(RuntimeError):
+            with pool.container() as pooled:
+                raise RuntimeError('boom')
+
+        pooled.container.remove.assert_called_once_with(force=True)
+        self.assertEqual(pool.stats()['size'], 0)
+
+    @override_settings(EXECUTION_SANDBOX_USER='1000:1000', EXECUTION_SANDBOX_PIDS_LIMIT=32)
+    def test_containers_are_locked_down(self):
+        """Pooled containers are read-only and capped, and resets kill what a run left behind"""
+        pool = ContainerPool(self.client, 'python', PYTHON_CONFIG, min_size=0, max_size=1)
+        pooled = pool.acquire()
+        pool.release(pooled)
+
+        options = self.client.containers.run.call_args.kwargs
+        self.assertTrue(options['read_only'])
+        self.assertEqual(options['cap_drop'], ['ALL'])
+        self.assertNotIn('SYS_ADMIN', options['cap_add'])
+        self.assertEqual(options['pids_limit'], 32)
+        self.assertIn('/tmp', options['tmpfs'])
+        self.assertEqual(pooled.user, '1000:1000')
+        pooled.container.exec_run.assert_called_once_with(['sh', '-c', reset_command('1000:1000')], user='root')
+        self.assertIn('setpriv --reuid=1000 --regid=1000', reset_command('1000:1000'))
+
+    @override_settings(EXECUTION_SANDBOX_KILL_GRACE=0)
+    def test_hung_exec_kills_its_container(self):
+        """An exec still running past its wall timeout takes its container down with it"""
+        pool = ContainerPool(self.client, 'python', PYTHON_CONFIG, min_size=0, max_size=1)
+        sandbox = DockerSandbox(pool, pool.acquire())
+        killed = threading.Event()
+        sandbox.pooled.container.kill.side_effect = killed.set
+        api = sandbox.pooled.container.client.api
+        api.exec_create.return_value = {'Id': 'exec'}
+        api.exec_start.side_effect = lambda *args, **kwargs: iter([(b'', None)] if killed.wait(5) else [])
+        api.exec_inspect.return_value = {'ExitCode': None}
+
+        exit_code, _, _ = get_execution_engine().run(sandbox.aexec('sleep 60', wall_timeout=0.1))
+
+        self.assertEqual(exit_code, 137)
+        self.assertTrue(killed.is_set())
+        self.assertIn('timeout -s KILL 1 sh -c', api.exec_create.call_args.args[1][-1])
+
+    def test_acquire_times_out_when_pool_is_full(self):
+        """Acquiring from a full pool raises once the timeout expires"""
+        pool = ContainerPool(self.client, 'python', PYTHON_CONFIG, min_size=0, max_size=1)
+        pool.acquire()
+
+        with self.assertRaises(PoolExhausted):
+            pool.acquire(timeout=0.01)
+        self.assertEqual(pool.stats()['utilization'], 1.0)
+
+
+class BatchResultTests(SimpleTestCase):
+    def setUp(self):
+        self.test_cases = [
+            {'id': 'a', 'input_data': '1 2', 'expected_output': '3\n'},
+            {'id': 'b', 'input_data': '2 2', 'expected_output': '5'},
+            {'id': 'c', 'input_data': '', 'expected_output': ''},
+        ]
+
+    def test_verdicts_are_derived_from_runner_output(self):
+        """Each test case gets a verdict, time and memory from the runner files"""
+        files = {
+            'out/0.meta': b'0 10.00 10.25 2048',
+            'out/0.out': b'3  \n',
+            'out/0.times': b'0m0.01s 0m0.00s\n0m0.00s 0m0.00s\n0m0.01s 0m0.00s\n0m0.15s 0m0.05s\n',
+            'out/1.meta': b'0 10.25 10.30 2048',
+            'out/1.out': b'4\n',
+            'out/2.meta': b'124 10.30 12.30 4096',
+        }
+
+        results = parse_batch_results(files, self.test_cases)
+
+        self.assertEqual([r['verdict'] for r in results], ['passed', 'failed', 'timeout'])
+        self.assertEqual(results[0]['execution_time'], 0.25)
+        self.assertEqual(results[0]['cpu_time'], 0.2)
+        self.assertEqual(results[0]['memory_usage'], 2048)
+        self.assertEqual(results[1]['cpu_time'], 0)
+
+    def test_stdout_is_compared_in_full_while_captured(self):
+        """Output longer than the kept head is still judged on all of it"""
+        expected = 'line\n' * 10000
+        test_cases = [{'id': 'a', 'input_data': '', 'expected_output': expected}]
+        stdout = expected.encode()
+        files = [
+            ('out/0.meta', [b'0 10.00 10.25 2048']),
+            ('out/0.out', (stdout[start:start + 4096] for start in range(0, len(stdout), 4096))),
+        ]
+
+        outputs = collect_batch_outputs(files, 1024, test_cases=test_cases)
+        results = parse_batch_results(outputs, test_cases)
+
+        self.assertTrue(outputs['out/0.out'].truncated)
+        self.assertEqual(results[0]['verdict'], 'passed')
+        self.assertIsNone(results[0]['mismatch'])
+
+    def test_mismatch_position_is_reported(self):
+        """A failed test case says where its output first differs"""
+        test_cases = [{'id': 'a', 'input_data': '', 'expected_output': '1\n2\n3\n'}]
+        files = {'out/0.meta': b'0 10.00 10.25 2048', 'out/0.out': b'1\n2\n4\n'}
+
+        results = parse_batch_results(files, test_cases)
+
+        self.assertEqual(results[0]['verdict'], 'failed')
+        self.assertEqual(results[0]['mismatch'], {'line': 3, 'column': 1, 'expected': '3', 'actual': '4'})
+
+    def test_unknown_checker_is_an_error_for_its_test_case_only(self):
+        """Invalid comparison options give that test case an error verdict instead of failing the run"""
+        test_cases = [
+            {'id': 'a', 'input_data': '', 'expected_output': '1', 'comparison': {'mode': 'custom', 'checker': 'gone'}},
+            {'id': 'b', 'input_data': '', 'expected_output': '1'},
+        ]
+        files = [
+            ('out/0.meta', [b'0 10.00 10.25 2048']),
+            ('out/0.out', [b'1\n']),
+            ('out/1.meta', [b'0 10.25 10.50 2048']),
+            ('out/1.out', [b'1\n']),
+        ]
+
+        results = parse_batch_results(collect_batch_outputs(files, 1024, test_cases=test_cases), test_cases)
+
+        self.assertEqual([r['verdict'] for r in results], ['error', 'passed'])
+        self.assertIn('Unknown output checker: gone', results[0]['stderr'])
+        self.assertEqual(results[0]['stdout'], '1\n')
+        self.assertIsNone(results[0]['mismatch'])
+
+    def test_compile_error_fails_every_case(self):
+        """A failed build step marks all test cases as errors"""
+        results = compile_error_results(self.test_cases, 'program.cpp:1: error')
+
+        self.assertTrue(all(r['verdict'] == 'error' for r in results))
+        self.assertEqual(results[0]['stderr'], 'program.cpp:1: error')
+
+
+class ComparatorTests(SimpleTestCase):
+    def test_whitespace_mode_ignores_trailing_whitespace_and_blank_lines(self):
+        """The default mode forgives trailing spaces and outer blank lines only"""
+        self.assertTrue(compare_output('\n1 2  \n3\n\n', '1 2\n3')['match'])
+        self.assertFalse(compare_output('1  2\n3', '1 2\n3')['match'])
+        self.assertEqual(compare_output('1\n\n3', '1\n3')['line'], 2)
+
+    def test_exact_mode_reports_position_across_chunks(self):
+        """Exact comparison works on chunked output and stops at the first difference"""
+        result = compare_output([b'ab', b'c\nd', b'ex'], 'abc\ndfx', mode='exact')
+
+        self.assertEqual(result, {'match': False, 'line': 2, 'column': 2, 'expected': 'fx', 'actual': 'ex'})
+        self.assertTrue(compare_output([b'caf', 'é'.encode()[:1], 'é'.encode()[1:]], 'café', mode='exact')['match'])
+
+    def test_token_mode(self):
+        """Tokens match regardless of how whitespace separates them"""
+        self.assertTrue(compare_output('1   2\n3', '1 2 3', mode='tokens')['match'])
+        self.assertEqual(
+            compare_output('1 2', '1 2 3', mode='tokens'),
+            {'match': False, 'line': 1, 'column': 4, 'expected': '3', 'actual': ''},
+        )
+
+    def test_float_mode_uses_tolerances(self):
+        """Numbers match within the absolute or relative tolerance"""
+        self.assertTrue(compare_output('0.3333334 1e9', '0.333333 1000000001', mode='float')['match'])
+        self.assertFalse(compare_output('0.34', '0.33', mode='float')['match'])
+        self.assertTrue(compare_output('0.34', '0.33', mode='float', abs_tol=0.02)['match'])
+        self.assertFalse(compare_output('yes', 'no', mode='float')['match'])
+
+    def test_custom_checker(self):
+        """Registered checkers decide custom comparisons"""
+        @register_checker('same_sum')
+        def same_sum(actual, expected, test_case):
+            return sum(map(int, ''.join(actual).split())) == sum(map(int, ''.join(expected).split()))
+
+        self.assertTrue(compare_output('1 4', '2 3', mode='custom', checker='same_sum')['match'])
+        with self.assertRaises(ValueError):
+            compare_output('1', '1', mode='custom', checker='missing')
+
+
+class PreflightTests(SimpleTestCase):
+    def test_python_syntax_error_is_located(self):
+        """Python is compiled in-process and the error keeps its position"""
+        error = check_python("print('hi'\n", 'program.py')
+
+        self.assertEqual(error['stage'], 'syntax')
+        self.assertEqual(error['line'], 1)
+        self.assertIn('SyntaxError', error['output'])
+        self.assertIsNone(check_python("import sys\nprint(sys.argv)\n", 'program.py'))
+
+    def test_javascript_is_only_parsed(self):
+        """node --check reports syntax errors without running the program"""
+        if not shutil.which('node'):
+            self.skipTest('node is not installed')
+        error = check_javascript("console.log(1;\n", 'program.js')
+
+        self.assertEqual(error['line'], 1)
+        self.assertTrue(error['message'].startswith('SyntaxError'))
+        self.assertNotIn('bluapt-preflight-', error['output'])
+        self.assertIsNone(check_javascript("process.exit(3);\n", 'program.js'))
+
+
+class CompileCacheTests(SimpleTestCase):
+    def test_key_depends_on_code_flags_and_toolchain(self):
+        """Changing any part of the build produces a different key"""
+        key = compile_cache_key('cpp', 'int main(){}', 'g++ -o build/program program.cpp', 'sha256:a')
+
+        self.assertEqual(key, compile_cache_key('cpp', 'int main(){}', 'g++ -o build/program program.cpp', 'sha256:a'))
+        self.assertNotEqual(key, compile_cache_key('cpp', 'int main(){ }', 'g++ -o build/program program.cpp', 'sha256:a'))
+        self.assertNotEqual(key, compile_cache_key('cpp', 'int main(){}', 'g++ -O2 -o build/program program.cpp', 'sha256:a'))
+        self.assertNotEqual(key, compile_cache_key('cpp', 'int main(){}', 'g++ -o build/program program.cpp', 'sha256:b'))
+        with mock.patch('execution.compile_cache.CACHE_FORMAT_VERSION', 1):
+            self.assertNotEqual(key, compile_cache_key('cpp', 'int main(){}', 'g++ -o build/program program.cpp', 'sha256:a'))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        """The cache stays under its size bound by dropping the oldest entries"""
+        with tempfile.TemporaryDirectory() as directory:
+            cache = CompileCache(directory, max_bytes=50000)
+            cache.put('a', {'build/program': b'a' * 10000})
+            cache.put('b', {'build/program': b'b' * 10000})
+            self.assertIsNotNone(cache.get('a'))
+            cache.put('c', {'build/program': b'c' * 10000})
+
+            self.assertIsNone(cache.get('b'))
+            self.assertIsNotNone(cache.get('a'))
+            self.assertLessEqual(cache.stats()['bytes'], 50000)
+
+
+class TestCaseCacheTests(TestCase):
+    def create_question(self):
+        """Create a coding question without test cases; returns its ID."""
+        user = User.objects.create_user(f'cases-{uuid.uuid4().hex}@example.com', first_name='Cass', last_name='Case')
+        library = TestLibrary.objects.create(title='Cases', description='', creator=user, category='cases',
+                                             difficulty='beginner')
+        return Question.objects.create(test=library, content='Add two numbers', type='coding', difficulty='easy').id
+
+    def test_bundles_are_read_back_and_evicted_least_recently_used_first(self):
+        """Bundles survive a cold memory tier, keep their fields' raw bytes and stay under the size bound"""
+        test_cases = [{'id': '1', 'input_data': 'h\u00e9llo\n', 'expected_output': 'x', 'comparison': {'mode': 'exact'}}]
+        with tempfile.TemporaryDirectory() as directory:
+            cache = TestCaseCache(directory, max_bytes=25000, memory_max_bytes=0)
+            cache.put('q1', 'v1', test_cases)
+            self.assertEqual(cache.get('q1', 'v1'), test_cases)
+            bundle = TestCaseBundle(os.path.join(directory, 'q1.v1.bundle'))
+            self.assertEqual(bundle.field(0, 'input_data'), 'h\u00e9llo\n'.encode('utf-8'))
+
+            cache.put('q2', 'v1', [{'id': '2', 'input_data': 'a' * 10000}])
+            cache.put('q3', 'v1', [{'id': '3', 'input_data': 'b' * 10000}])
+            cache.get('q2', 'v1')
+            cache.put('q4', 'v1', [{'id': '4', 'input_data': 'c' * 10000}])
+
+            self.assertIsNone(cache.get('q3', 'v1'))
+            self.assertIsNotNone(cache.get('q2', 'v1'))
+            self.assertLessEqual(cache.stats()['bytes'], 25000)
+
+    def test_editing_a_test_case_invalidates_the_question_bundle(self):
+        """Cached test cases cost one small query per load until a test case changes"""
+        question_id = self.create_question()
+        test_case = QuestionTestCase.objects.create(question_id=question_id, input_data='1 2', expected_output='3')
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch('execution.grading.get_test_case_cache',
+                           return_value=TestCaseCache(directory, 10 ** 6, 10 ** 6)):
+            first = load_test_cases(question_id)
+            with self.assertNumQueries(1):
+                self.assertIs(load_test_cases(question_id), first)
+
+            test_case.expected_output = '4'
+            test_case.save()
+            QuestionTestCase.objects.create(question_id=question_id, input_data='2 2', expected_output='4')
+            edited = load_test_cases(question_id)
+            # Bulk updates leave updated_at alone, but not the content
+            QuestionTestCase.objects.filter(id=test_case.id).update(expected_output='5')
+            updated = load_test_cases(question_id)
+
+        self.assertEqual([case['expected_output'] for case in first], ['3'])
+        self.assertEqual([case['expected_output'] for case in edited], ['4', '4'])
+        self.assertEqual([case['expected_output'] for case in updated], ['5', '4'])
+
+
+class OutputCaptureTests(SimpleTestCase):
+    def test_output_past_the_limit_is_truncated(self):
+        """Only the first bytes are kept and a marker tells how many were dropped"""
+        output = capture([b'abc', b'defgh', b'ij'], limit=4)
+
+        self.assertTrue(output.truncated)
+        self.assertEqual(output.size, 10)
+        self.assertEqual(output.text(), 'abcd\n... [output truncated: 6 more bytes]\n')
+        self.assertIsNone(output.archive())
+
+    def test_full_output_can_be_kept_gzipped(self):
+        """The gzip archive holds every byte even when the kept head is capped"""
+        output = capture([b'x' * 100000, b'end'], limit=10, compress=True)
+
+        self.assertEqual(gzip.decompress(output.archive()), b'x' * 100000 + b'end')
+        self.assertLess(len(output.archive()), 1000)
+
+    def test_interleaved_streams_are_split_in_one_pass(self):
+        """Docker's (stdout, stderr) frames are separated into capped streams"""
+        stdout, stderr = demux([(b'out1', None), (None, b'err'), (b'out2', None)], limit=6)
+
+        self.assertEqual(stdout.text(), 'out1ou\n... [output truncated: 2 more bytes]\n')
+        self.assertEqual(stderr.text(), 'err')
+
+    def test_tar_stream_is_read_file_by_file(self):
+        """Files are read from a chunked tar stream without buffering the archive"""
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w') as tar:
+            for name, data in (('out/0.out', b'hello'), ('out/0.meta', b'0 1 2 3')):
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        data = buffer.getvalue()
+        chunks = (data[i:i + 100] for i in range(0, len(data), 100))
+
+        files = {name: b''.join(file_chunks) for name, file_chunks in iter_tar_files(chunks)}
+
+        self.assertEqual(files, {'out/0.out': b'hello', 'out/0.meta': b'0 1 2 3'})
+
+
+class ExecutionEngineTests(SimpleTestCase):
+    def setUp(self):
+        self.engine = ExecutionEngine(max_concurrency=3)
+        self.addCleanup(self.engine.stop)
+
+    def test_sessions_run_concurrently_up_to_the_limit(self):
+        """Sessions share one event loop and at most max_concurrency run at once"""
+        peak = 0
+
+        async def session():
+            nonlocal peak
+            peak = max(peak, self.engine.in_flight)
+            await asyncio.sleep(0.1)
+            return 'done'
+
+        started = time.monotonic()
+        futures = [self.engine.submit(session()) for _ in range(6)]
+
+        self.assertEqual([f.result(5) for f in futures], ['done'] * 6)
+        self.assertEqual(peak, 3)
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(self.engine.stats()['completed'], 6)
+
+    def test_busy_lane_does_not_starve_other_lanes(self):
+        """A lane that used up its budget leaves room for interactive runs"""
+        engine = ExecutionEngine(max_concurrency=4, lane_limits={'interactive': 2, 'rejudge': 2})
+        self.addCleanup(engine.stop)
+        release = asyncio.Event()
+
+        async def rejudge():
+            await release.wait()
+
+        async def interactive():
+            return engine.stats()['lanes']
+
+        rejudges = [engine.submit(rejudge(), lane='rejudge') for _ in range(10)]
+        lanes = engine.run(interactive(), timeout=5, lane='interactive')
+
+        self.assertEqual(lanes['rejudge']['in_flight'], 2)
+        self.assertEqual(lanes['interactive']['in_flight'], 1)
+        engine.loop.call_soon_threadsafe(release.set)
+        for future in rejudges:
+            future.result(5)
+
+    def test_local_sandboxes_are_driven_without_blocking(self):
+        """Processes in several local sandboxes are awaited side by side"""
+        backend = get_sandbox_backend('local')
+        sandboxes = [backend.acquire('python', PYTHON_CONFIG) for _ in range(3)]
+        for sandbox in sandboxes:
+            self.addCleanup(sandbox.close)
+
+        started = time.monotonic()
+        futures = [self.engine.submit(sandbox.aexec('sleep 0.5; echo ok', timeout=5)) for sandbox in sandboxes]
+        results = [f.result(10) for f in futures]
+
+        self.assertEqual([(code, out.text()) for code, out, _ in results], [(0, 'ok\n')] * 3)
+        self.assertLess(time.monotonic() - started, 1.4)
+
+    def test_runaway_command_is_killed(self):
+        """A command outliving its wall-clock guard is killed"""
+        sandbox = get_sandbox_backend('local').acquire('python', PYTHON_CONFIG)
+        self.addCleanup(sandbox.close)
+
+        with override_settings(EXECUTION_LOCAL_KILL_GRACE=0):
+            exit_code, _, _ = self.engine.run(sandbox.aexec('sleep 30', timeout=1, wall_timeout=0.2), timeout=10)
+
+        self.assertEqual(exit_code, 128 + 9)
+
+
+@override_settings(EXECUTION_SANDBOX_BACKEND='local')
+class FairSchedulerTests(SimpleTestCase):
+    def run_schedule(self, scheduler, runs):
+        """Queue (tenant, seconds) runs behind a full scheduler and return the order they start in."""
+        order = []
+
+        async def run(tenant, seconds):
+            await scheduler.acquire(tenant)
+            order.append(tenant)
+            await asyncio.sleep(0)
+            scheduler.release(tenant, seconds)
+
+        async def main():
+            await scheduler.acquire('blocker')
+            tasks = [asyncio.create_task(run(tenant, seconds)) for tenant, seconds in runs]
+            await asyncio.sleep(0)
+            scheduler.release('blocker')
+            await asyncio.gather(*tasks)
+
+        asyncio.run(main())
+        return order
+
+    def test_busy_organisation_does_not_starve_others(self):
+        """A late organisation is served before the backlog of a busy one"""
+        scheduler = FairScheduler(capacity=1)
+
+        order = self.run_schedule(scheduler, [('campus', 1)] * 10 + [('startup', 1)] * 2)
+
+        self.assertLess(order.index('startup'), 3)
+        self.assertEqual(order.count('startup'), 2)
+
+    def test_weights_set_the_share(self):
+        """An organisation with twice the weight gets twice the runs while both wait"""
+        scheduler = FairScheduler(capacity=1, weights={'premium': 2})
+
+        order = self.run_schedule(scheduler, [('premium', 1)] * 12 + [('basic', 1)] * 12)
+
+        self.assertEqual(order[:9].count('premium'), 6)
+
+    def test_organisation_cap_leaves_room_for_others(self):
+        """Runs beyond an organisation's cap wait even when slots are free"""
+        scheduler = FairScheduler(capacity=4, max_per_tenant=2)
+
+        async def main():
+            for _ in range(2):
+                await scheduler.acquire('campus')
+            waiting = asyncio.create_task(scheduler.acquire('campus'))
+            await asyncio.sleep(0)
+            await asyncio.wait_for(scheduler.acquire('startup'), 1)
+            stats = scheduler.stats()
+            scheduler.release('campus', 1)
+            await asyncio.wait_for(waiting, 1)
+            return stats
+
+        stats = asyncio.run(main())
+        self.assertEqual(stats['campus'], {'in_flight': 2, 'waiting': 1, 'completed': 0, 'usage': 0.0, 'weight': 1})
+        self.assertEqual(stats['startup']['in_flight'], 1)
+
+
+class WarmUpTests(SimpleTestCase):
+    def test_prepare_pins_the_pulled_image(self):
+        """Containers start from the image digest resolved during warm-up"""
+        backend = SANDBOX_BACKENDS['docker']()
+        backend._client = mock.MagicMock()
+        backend._client.images.pull.return_value = mock.MagicMock(id='sha256:abc')
+        lang_config = {**PYTHON_CONFIG, 'image': 'python:pinned-test'}
+
+        digest = backend.prepare(lang_config)
+        backend.acquire('pinned-test', lang_config)
+
+        self.assertEqual(digest, 'sha256:abc')
+        backend._client.images.pull.assert_called_once_with('python:pinned-test')
+        self.assertEqual(backend._client.containers.run.call_args.kwargs['image'], 'sha256:abc')
+
+    @override_settings(EXECUTION_SANDBOX_BACKEND='local')
+    def test_warm_up_runs_a_program_and_reports_readiness(self):
+        """Each warmed-up language runs its trivial program and is reported ready"""
+        readiness = warm_up(['python'])
+
+        self.assertTrue(readiness['ready'])
+        self.assertEqual(readiness['languages']['python']['error'], None)
+        self.assertEqual(get_readiness(), readiness)
+        self.assertEqual(get_readiness(readiness['host']), readiness)
+
+    def test_warm_up_fails_without_setpriv(self):
+        """An image whose setpriv cannot switch users is never reported ready"""
+        sandbox = mock.MagicMock()
+        sandbox.unprivileged.return_value = 'setpriv --reuid=1000 --regid=1000 --clear-groups'
+        sandbox.exec.return_value = (1, capture([b''], 100), capture([b'setpriv: unrecognized option'], 100))
+        backend = mock.MagicMock()
+        backend.acquire.return_value = sandbox
+
+        with self.assertRaisesRegex(RuntimeError, 'cannot drop privileges'):
+            run_warmup_program(backend, 'javascript', LANGUAGE_CONFIGS['javascript'])
+        sandbox.close.assert_called_once_with(healthy=False)
+
+
+class LanguageNodeTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def advertise(self, languages, capacity, in_flight, pid):
+        engine = mock.MagicMock()
+        engine.stats.return_value = {'max_concurrency': capacity, 'in_flight': in_flight, 'lanes': {}}
+        with override_settings(EXECUTION_NODE_LANGUAGES=languages), \
+                mock.patch('execution.nodes.get_execution_engine', return_value=engine), \
+                mock.patch('execution.warmup.get_readiness', return_value=None), \
+                mock.patch('execution.nodes.os.getpid', return_value=pid):
+            return report_capacity()
+
+    def test_runs_follow_the_nodes_serving_their_language(self):
+        """Runs go to a language queue while its nodes have room and overflow to generalists when they are full"""
+        self.assertEqual(dispatch_queue('cpp', 'grading'), 'execution.grading')
+
+        self.advertise(['cpp'], capacity=4, in_flight=1, pid=1)
+        self.assertEqual(dispatch_queue('cpp', 'grading'), 'execution.grading.cpp')
+        self.assertEqual(dispatch_queue('python', 'grading'), 'execution.grading')
+
+        self.advertise(['cpp'], capacity=4, in_flight=4, pid=1)
+        self.assertEqual(dispatch_queue('cpp', 'grading'), 'execution.grading.cpp')
+        self.advertise([], capacity=8, in_flight=2, pid=2)
+        self.assertEqual(dispatch_queue('cpp', 'grading'), 'execution.grading')
+        self.assertEqual(get_language_capacity()['cpp'], {'nodes': 2, 'capacity': 12, 'in_flight': 6, 'free': 6})
+
+        with override_settings(EXECUTION_LANGUAGE_QUEUES=False):
+            self.assertEqual(dispatch_queue('python', 'interactive'), 'execution.interactive')
+
+    def test_organisations_share_the_workers_through_fair_queues(self):
+        """Each organisation's runs go to one fair queue of their queue, and workers consume them all"""
+        queues = {dispatch_queue('python', 'grading', f'org-{index}') for index in range(50)}
+        self.assertEqual(queues, {f'execution.grading.fair{bucket}' for bucket in range(8)})
+        self.assertEqual(dispatch_queue('python', 'grading', 'org-1'), dispatch_queue('python', 'grading', 'org-1'))
+        with override_settings(EXECUTION_FAIR_QUEUES=1):
+            self.assertEqual(dispatch_queue('python', 'grading', 'org-1'), 'execution.grading')
+
+        worker_queues = Queues([Queue('execution.grading')])
+        worker_queues.select(['execution.grading'])
+        with override_settings(EXECUTION_NODE_LANGUAGES=['cpp']):
+            subscribe_language_queues(worker_queues, ['execution.grading'])
+        self.assertEqual(set(worker_queues.consume_from), {
+            'execution.grading.cpp', *(f'execution.grading.cpp.fair{bucket}' for bucket in range(8)),
+            'execution', node_queue(),
+        })
+
+@override_settings(EXECUTION_SANDBOX_BACKEND='local')
+class LocalSandboxExecutionTests(TestCase):
+    def setUp(self):
+        # Builds and test cases go to throwaway directories, not the worker's caches
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        cache_dirs = override_settings(
+            EXECUTION_COMPILE_CACHE_DIR=os.path.join(scratch.name, 'compile-cache'),
+            EXECUTION_TEST_CASE_CACHE_DIR=os.path.join(scratch.name, 'test-cases'),
+        )
+        cache_dirs.enable()
+        self.addCleanup(cache_dirs.disable)
+        for target in ('execution.compile_cache._cache', 'execution.test_case_cache._cache'):
+            patcher = mock.patch(target, None)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_execute_code_runs_without_docker(self):
+        """The local process sandbox runs code through the normal task path"""
+        result = execute_code("print(input()[::-1])", 'python', test_cases=[
+            {'id': '1', 'input_data': 'abc', 'expected_output': 'cba'},
+            {'id': '2', 'input_data': 'xy', 'expected_output': 'xy'},
+        ])
+
+        self.assertEqual(result['status'], 'completed')
+        self.assertEqual([r['verdict'] for r in result['test_results']], ['passed', 'failed'])
+        execution_result = ExecutionResult.objects.get(execution_id=result['execution_id'])
+        self.assertEqual(execution_result.stdout, 'cba\n')
+
+    def test_code_only_sees_its_private_root(self):
+        """Candidate code cannot read the host's files or write outside its workspace"""
+        probe = (
+            f"# {uuid.uuid4()}\nimport os\n"
+            f"print([os.path.exists(p) for p in {[__file__, get_compile_cache().directory]!r}])\n"
+            "try:\n    open('/usr/bluapt-probe', 'w')\nexcept OSError:\n    print('read-only')\n"
+            "open('/tmp/scratch', 'w').write('ok')\nprint(open('/tmp/scratch').read())"
+        )
+        result = execute_code(probe, 'python')
+
+        self.assertEqual(result['stdout'], '[False, False]\nread-only\nok\n')
+
+    def test_code_cannot_rewrite_its_measurements(self):
+        """The runner's measurements next to the workspace are read-only to the program"""
+        probe = (
+            f"# {uuid.uuid4()}\nimport glob\n"
+            "for name in glob.glob('../out/*'):\n"
+            "    try:\n        open(name, 'w').write('0 0 0 0')\n        print('rewrote', name)\n"
+            "    except OSError:\n        pass\n"
+            "print(sorted(glob.glob('../out/*.meta')))"
+        )
+        result = execute_code(probe, 'python')
+
+        self.assertEqual(result['stdout'], '[]\n')
+        self.assertEqual(result['status'], 'completed')
+
+    def test_refuses_to_run_without_isolation(self):
+        """Without namespaces the backend raises unless unisolated runs are allowed"""
+        with mock.patch.object(LocalSandboxBackend, '_detect_jail', return_value=None):
+            backend = LocalSandboxBackend()
+
+        with self.assertRaises(SandboxUnavailable):
+            backend.acquire('python', PYTHON_CONFIG)
+        with override_settings(EXECUTION_LOCAL_ALLOW_UNISOLATED=True):
+            backend.acquire('python', PYTHON_CONFIG).close()
+
+    def test_run_is_written_to_the_database_once(self):
+        """Status changes and container tracking stay out of the database until the final write"""
+        container_ids = []
+        backend = get_sandbox_backend()
+        acquire = backend.acquire
+
+        def tracking_acquire(*args):
+            sandbox = acquire(*args)
+            container_ids.append(sandbox.id)
+            return sandbox
+
+        with mock.patch.object(backend, 'acquire', tracking_acquire), self.assertNumQueries(1):
+            result = execute_code(f"# {uuid.uuid4()}\nprint('hi')", 'python')
+
+        self.assertEqual(result['status'], 'completed')
+        self.assertEqual(get_status(result['execution_id']), 'completed')
+        self.assertEqual(get_container(container_ids[0])['status'], 'removed')
+
+    def test_rerun_replaces_the_result(self):
+        """Running an existing execution_id again updates its row in place"""
+        execution_id = str(uuid.uuid4())
+
+        execute_code("print('first')", 'python', execution_id=execution_id)
+        execute_code("print('second')", 'python', execution_id=execution_id)
+
+        self.assertEqual(ExecutionResult.objects.get(execution_id=execution_id).stdout, 'second\n')
+
+    def test_identical_runs_are_memoized(self):
+        """Re-running identical code and input is served from the result cache"""
+        code = f"# {uuid.uuid4()}\nprint(int(input()) * 2)"
+
+        first = execute_code(code, 'python', stdin='21')
+        second = execute_code(code, 'python', stdin='21')
+        bypassed = execute_code(code, 'python', stdin='21', bypass_cache=True)
+        other_input = execute_code(code, 'python', stdin='5')
+
+        self.assertEqual(first['stdout'], '42\n')
+        self.assertFalse(first['cached'])
+        self.assertTrue(second['cached'])
+        self.assertEqual(second['stdout'], '42\n')
+        self.assertTrue(ExecutionResult.objects.get(execution_id=second['execution_id']).is_cached)
+        self.assertFalse(bypassed['cached'])
+        self.assertEqual(other_input['stdout'], '10\n')
+
+    def test_timed_out_test_cases_are_not_memoized(self):
+        """A run where a test case timed out, maybe under load, is run again rather than replayed"""
+        code = f"# {uuid.uuid4()}\nimport time\nif input() == 'slow': time.sleep(5)\nprint('ok')"
+        test_cases = [{'id': '1', 'input_data': 'fast', 'expected_output': 'ok'},
+                      {'id': '2', 'input_data': 'slow', 'expected_output': 'ok'}]
+
+        first = execute_code(code, 'python', test_cases=test_cases, timeout=1)
+        second = execute_code(code, 'python', test_cases=test_cases, timeout=1)
+
+        self.assertEqual([entry['verdict'] for entry in first['test_results']], ['passed', 'timeout'])
+        self.assertFalse(second['cached'])
+
+    def test_runner_failure_fails_the_run(self):
+        """A runner that does not finish fails the run instead of reporting per-test-case errors"""
+        code = f"# {uuid.uuid4()}\nprint(input())"
+        failed = (137, capture([b''], 10), capture([b'Killed'], 10))
+        with mock.patch('execution.sandbox.LocalSandbox.aexec', side_effect=[failed]):
+            result = execute_code(code, 'python', test_cases=[{'id': '1', 'input_data': 'a', 'expected_output': 'a'}])
+        again = execute_code(code, 'python', test_cases=[{'id': '1', 'input_data': 'a', 'expected_output': 'a'}])
+
+        self.assertEqual(result['status'], 'failed')
+        self.assertIn('Test runner exited with code 137', result['error'])
+        self.assertFalse(again['cached'])
+
+    def test_timeout_is_enforced(self):
+        """A program running past its timeout is stopped"""
+        result = execute_code("while True: pass", 'python', timeout=1)
+
+        self.assertEqual(result['status'], 'timeout')
+
+    @override_settings(EXECUTION_OUTPUT_MAX_BYTES=1024, EXECUTION_OUTPUT_GZIP=True)
+    def test_flooding_output_is_capped(self):
+        """A program printing megabytes stores a capped head and a gzip of the rest"""
+        result = execute_code(f"# {uuid.uuid4()}\nfor i in range(200000): print('spam')", 'python')
+
+        self.assertEqual(result['status'], 'completed')
+        self.assertLess(len(result['stdout']), 1100)
+        self.assertIn('[output truncated: ', result['stdout'])
+        execution_result = ExecutionResult.objects.get(execution_id=result['execution_id'])
+        self.assertEqual(gzip.decompress(execution_result.stdout_archive), b'spam\n' * 200000)
+
+    def test_resource_usage_is_measured(self):
+        """Wall time, CPU time and peak memory come from the program itself"""
+        result = execute_code(
+            f"# {uuid.uuid4()}\nblock = bytearray(64 * 1024 * 1024)\ntotal = sum(range(3000000))",
+            'python',
+        )
+
+        self.assertEqual(result['status'], 'completed')
+        self.assertGreater(result['cpu_time'], 0)
+        self.assertGreaterEqual(result['execution_time'], result['cpu_time'] * 0.5)
+        self.assertGreater(result['memory_usage'], 64 * 1024)
+        self.assertLess(result['memory_usage'], 128 * 1024)
+
+    def test_python_forks_from_a_zygote_in_reused_sandboxes(self):
+        """Runs in a sandbox that outlives them are forked from a warm interpreter and share no state"""
+        backend = get_sandbox_backend()
+        lang_config = LANGUAGE_CONFIGS['python']
+        sandbox = backend.acquire('python', lang_config)
+        sandbox.reusable = True
+        code = "import math\nprint(hasattr(math, 'leaked'), int(input()) * 2)\nmath.leaked = True"
+        test_cases = [{'id': '1', 'input_data': '21', 'expected_output': 'False 42'}]
+        try:
+            runs = [
+                get_execution_engine().run(run_session(backend, sandbox, 'python', lang_config, code, test_cases, None, 5))
+                for _ in range(2)
+            ]
+        finally:
+            sandbox.close()
+
+        for run in runs:
+            self.assertEqual(run['test_results'][0]['verdict'], 'passed')
+            self.assertIn('out/0.cpu', run['outputs'])
+
+    def test_compiled_program_is_cached(self):
+        """A second run of the same C++ program reuses the cached build"""
+        code = f"#include <iostream>\n// {uuid.uuid4()}\nint main() {{ std::cout << 6 * 7; }}"
+        compile_cache = get_compile_cache()
+        hits = compile_cache.hits
+
+        first = execute_code(code, 'cpp')
+        second = execute_code(code, 'cpp', bypass_cache=True)
+
+        self.assertEqual(first['stdout'], '42')
+        self.assertEqual(second['stdout'], '42')
+        self.assertEqual(compile_cache.hits, hits + 1)
+
+    def test_compile_error_is_reported(self):
+        """Compiler output is returned when the program does not build"""
+        result = execute_code("int main() { return }", 'cpp')
+
+        self.assertEqual(result['status'], 'compile_error')
+        self.assertEqual(get_status(result['execution_id']), 'compile_error')
+        self.assertIn('error', result['stderr'])
+
+    def test_syntax_errors_never_acquire_a_sandbox(self):
+        """Programs that fail pre-flight checks are answered without a sandbox"""
+        backend = get_sandbox_backend()
+        code = f"// {uuid.uuid4()}\nint main() {{ return }}"
+        execute_code(code, 'cpp')
+
+        with mock.patch.object(backend, 'acquire') as acquire:
+            python = execute_code("def f(:\n    pass", 'python', test_cases=[
+                {'id': '1', 'input_data': '', 'expected_output': ''},
+            ])
+            cpp = execute_code(code, 'cpp', bypass_cache=True)
+
+        acquire.assert_not_called()
+        self.assertEqual([python['status'], cpp['status']], ['compile_error', 'compile_error'])
+        self.assertEqual(python['compile_error']['line'], 1)
+        self.assertEqual(python['test_results'][0]['verdict'], 'error')
+        self.assertEqual(cpp['compile_error']['stage'], 'compile')
+        self.assertIn('error', cpp['stderr'])
+
+
+class RunCoalescingTests(TestCase):
+    def test_identical_runs_share_and_new_runs_supersede(self):
+        """Repeated clicks share a run; changed code cancels the older run of the same question"""
+        candidate_test_id, question_id = str(uuid.uuid4()), str(uuid.uuid4())
+        with mock.patch('execution.tasks.execute_code.apply_async') as apply_async:
+            first = queue_execution("print(1)", 'python', candidate_test_id=candidate_test_id, question_id=question_id)
+            again = queue_execution("print(1)", 'python', candidate_test_id=candidate_test_id, question_id=question_id)
+            other_question = queue_execution("print(1)", 'python', candidate_test_id=candidate_test_id,
+                                             question_id=str(uuid.uuid4()))
+            edited = queue_execution("print(2)", 'python', candidate_test_id=candidate_test_id, question_id=question_id)
+
+        self.assertEqual(first, again)
+        self.assertNotEqual(first, other_question)
+        self.assertEqual(apply_async.call_count, 3)
+        self.assertTrue(is_cancelled(first))
+        self.assertFalse(is_cancelled(other_question))
+        self.assertFalse(is_cancelled(edited))
+
+    def test_a_stuck_slot_lock_is_left_to_its_owner(self):
+        """A request that cannot lock its slot runs uncoalesced, leaving the slot and the lock alone"""
+        candidate_test_id, question_id = str(uuid.uuid4()), str(uuid.uuid4())
+        slot_key = f'execution:slot:{candidate_test_id}:{question_id}'
+        cache.set(slot_key + ':lock', 42, timeout=60)
+
+        with mock.patch('execution.coalesce.SLOT_LOCK_TIMEOUT', 0.05):
+            result = claim_slot(candidate_test_id, question_id, 'fingerprint', 'new-run')
+
+        self.assertEqual(result, ('new-run', True, None))
+        self.assertIsNone(cache.get(slot_key))
+        self.assertEqual(cache.get(slot_key + ':lock'), 42)
+
+    def test_cancelled_queued_run_never_starts(self):
+        """A run cancelled before a worker picks it up is closed without a sandbox"""
+        execution_id = str(uuid.uuid4())
+        cancel_run(execution_id)
+
+        with mock.patch.object(get_sandbox_backend(), 'acquire') as acquire:
+            result = execute_code("print('late')", 'python', execution_id=execution_id)
+
+        acquire.assert_not_called()
+        self.assertEqual(result['status'], 'cancelled')
+        self.assertEqual(ExecutionResult.objects.get(execution_id=execution_id).status, 'cancelled')
+
+    @override_settings(EXECUTION_SANDBOX_BACKEND='local', EXECUTION_CANCEL_POLL_INTERVAL=0.05)
+    def test_cancelling_a_running_run_kills_its_sandbox(self):
+        """Cancellation reaches the sandbox instead of waiting for the program to finish"""
+        execution_id = str(uuid.uuid4())
+        canceller = threading.Timer(0.5, cancel_run, [execution_id])
+        canceller.start()
+        started = time.monotonic()
+        try:
+            result = execute_code(f"# {uuid.uuid4()}\nimport time\ntime.sleep(20)", 'python',
+                                  execution_id=execution_id, timeout=20)
+        finally:
+            canceller.cancel()
+
+        self.assertEqual(result['status'], 'cancelled')
+        self.assertLess(time.monotonic() - started, 10)
+
+
+def fake_execute_code(code, language, execution_id=None, test_cases=None, **kwargs):
+    """Pass every test case except those whose input is "fail", without a sandbox."""
+    return {
+        'status': 'completed', 'execution_time': 0.5, 'cpu_time': 0.25, 'memory_usage': 1024,
+        'test_results': [
+            {'test_case_id': test_case['id'], 'verdict': 'failed' if test_case['input_data'] == 'fail' else 'passed'}
+            for test_case in test_cases
+        ],
+    }
+
+
+class ShardedGradingTests(TestCase):
+    def create_submission(self):
+        """Create a code submission to a question of its own; returns (question, submission)."""
+        organization = Organization.objects.create(name='Grading')
+        user = User.objects.create_user(f'grading-{uuid.uuid4().hex}@example.com', first_name='Grace', last_name='Grader')
+        library = TestLibrary.objects.create(title='Grading', description='', creator=user, category='grading',
+                                             difficulty='beginner')
+        question = Question.objects.create(test=library, content='Echo the input', type='coding', difficulty='easy')
+        test = Test.objects.create(title='Grading', description='', instructions='', category='grading',
+                                   difficulty='easy', created_by=user, organization=organization)
+        assessment = Assessment.objects.create(title='Grading', description='', time_limit=60, passing_score=50,
+                                               created_by=user, organization=organization)
+        candidate_test = CandidateTest.objects.create(
+            candidate_assessment=CandidateAssessment.objects.create(candidate=user, assessment=assessment), test=test,
+        )
+        answer = CandidateAnswer.objects.create(candidate_test=candidate_test, question=question, content='')
+        return question, CodeSubmission.objects.create(candidate_answer=answer, language='python',
+                                                       code_content="print(input())")
+
+    def test_test_cases_split_into_balanced_ordered_shards(self):
+        """Shards keep test case order, differ in size by at most one and respect the shard cap"""
+        shards = shard_test_cases(list(range(10)), 3, 16)
+
+        self.assertEqual([len(shard) for shard in shards], [3, 3, 2, 2])
+        self.assertEqual(sum(shards, []), list(range(10)))
+        self.assertEqual(len(shard_test_cases(list(range(100)), 3, 4)), 4)
+        self.assertEqual(shard_test_cases(list(range(3)), 0, 4), [[0, 1, 2]])
+
+    @override_settings(EXECUTION_GRADING_SHARD_SIZE=2)
+    def test_shards_are_merged_into_the_submission(self):
+        """A big problem set is graded as a chord of shards whose verdicts land in test case order"""
+        question, submission = self.create_submission()
+        submission_id = str(submission.id)
+        inputs = ['a', 'b', 'fail', 'c', 'd']
+        test_case_ids = [
+            str(QuestionTestCase.objects.create(question=question, input_data=value, expected_output=value).id)
+            for value in inputs
+        ]
+
+        app.conf.task_always_eager = True
+        try:
+            with mock.patch('execution.tasks.execute_code', side_effect=fake_execute_code) as execute:
+                queued = grade_submission(submission_id, stop_on_failure=False)
+        finally:
+            app.conf.task_always_eager = False
+
+        self.assertEqual((queued['status'], queued['shards']), ('grading', 3))
+        self.assertEqual(execute.call_count, 3)
+        submission = CodeSubmission.objects.get(id=submission_id)
+        self.assertEqual((submission.passed_test_cases, submission.total_test_cases), (4, 5))
+        self.assertEqual(float(submission.execution_time), 1.5)
+        self.assertEqual(submission.memory_usage, 1024)
+        merged = sorted(execute.call_args_list, key=lambda call: inputs.index(call.kwargs['test_cases'][0]['input_data']))
+        self.assertEqual([case['id'] for call in merged for case in call.kwargs['test_cases']], test_case_ids)
+
+    def test_first_failing_shard_cancels_the_others(self):
+        """With stop-on-failure, a failing shard cancels its siblings, whose test cases are skipped"""
+        execution_ids = [str(uuid.uuid4()) for _ in range(3)]
+        with mock.patch('execution.tasks.execute_code', side_effect=fake_execute_code):
+            result = grade_shard("print(1)", 'python', [{'id': '1', 'input_data': 'fail'}], execution_ids[1],
+                                 shard_execution_ids=execution_ids)
+
+        self.assertEqual(result['test_results'][0]['verdict'], 'failed')
+        self.assertEqual([is_cancelled(execution_id) for execution_id in execution_ids], [True, False, True])
+        skipped = shard_result({'status': 'cancelled', 'execution_id': execution_ids[0]}, [{'id': '0'}])
+        self.assertEqual(skipped['test_results'][0]['verdict'], 'skipped')
+
+    def test_grading_tasks_go_to_their_organisations_fair_queue(self):
+        """Grading a submission is routed, without a query, to the fair queue its organisation hashes to"""
+        _, submission = self.create_submission()
+        organization_id = str(submission.candidate_answer.candidate_test.test.organization_id)
+
+        with self.assertNumQueries(0):
+            route = app.amqp.router.route({}, 'execution.tasks.grade_submission', (str(submission.id),),
+                                          {'organization_id': organization_id})
+
+        self.assertEqual(route['queue'].name, dispatch_queue('python', 'grading', organization_id))
+        self.assertRegex(route['queue'].name, r'^execution\.grading\.fair\d$')
+        explicit = app.amqp.router.route({'queue': 'execution.grading'}, 'execution.tasks.grade_submission',
+                                         (str(submission.id),), {})
+        self.assertEqual(explicit['queue'].name, 'execution.grading')
+
+
+
+class TimeLimitCalibrationTests(TestCase):
+    def create_submission(self, reference_solution, reference_language):
+        """Create a Python submission to a question with a reference solution; returns (question, submission)."""
+        organization = Organization.objects.create(name='Limits')
+        user = User.objects.create_user(f'limits-{uuid.uuid4().hex}@example.com', first_name='Tim', last_name='Keeper')
+        library = TestLibrary.objects.create(title='Limits', description='', creator=user, category='limits',
+                                             difficulty='beginner')
+        question = Question.objects.create(
+            test=library, content='Echo the input', type='coding', difficulty='easy',
+            reference_solution=reference_solution, reference_language=reference_language,
+        )
+        test = Test.objects.create(title='Limits', description='', instructions='', category='limits',
+                                   difficulty='easy', created_by=user, organization=organization)
+        assessment = Assessment.objects.create(title='Limits', description='', time_limit=60, passing_score=50,
+                                               created_by=user, organization=organization)
+        candidate_test = CandidateTest.objects.create(
+            candidate_assessment=CandidateAssessment.objects.create(candidate=user, assessment=assessment), test=test,
+        )
+        answer = CandidateAnswer.objects.create(candidate_test=candidate_test, question=question, content='')
+        return question, CodeSubmission.objects.create(candidate_answer=answer, language='python',
+                                                       code_content="print(input())")
+
+    def test_limits_scale_per_language_within_bounds(self):
+        """Limits multiply the reference runtime by each language's slowness, floored and capped at the timeout"""
+        self.assertEqual(calibrated_limits(0.2, 'cpp', {'cpp': 10, 'java': 15, 'python': 10}),
+                         {'cpp': 1.0, 'java': 1.2, 'python': 3.0})
+        self.assertEqual(calibrated_limits(1.0, 'cpp', {'python': 10}), {'python': 10})
+
+    @override_settings(EXECUTION_ANALYSIS_ON_GRADE=False)
+    def test_grading_uses_limits_calibrated_on_the_current_test_cases(self):
+        """Calibrated questions are graded under their limit; changed test cases fall back and recalibrate"""
+        question, submission = self.create_submission("print(input())", 'cpp')
+        question_id, submission_id = str(question.id), str(submission.id)
+        QuestionTestCase.objects.create(question=question, input_data='a', expected_output='a')
+
+        def timed_execute_code(code, language, test_cases=None, **kwargs):
+            result = fake_execute_code(code, language, test_cases=test_cases)
+            for entry in result['test_results']:
+                entry['execution_time'] = 0.4
+            return result
+
+        def grade():
+            with mock.patch('execution.tasks.execute_code', side_effect=timed_execute_code) as execute, \
+                    mock.patch('execution.tasks.calibrate_time_limits.apply_async') as schedule, \
+                    self.captureOnCommitCallbacks(execute=True):
+                grade_submission(submission_id)
+            return execute.call_args.kwargs['timeout'], schedule.call_count
+
+        self.assertEqual(grade(), (None, 1))
+        with mock.patch('execution.tasks.execute_code', side_effect=timed_execute_code) as execute:
+            calibrated = calibrate_time_limits(question_id)
+        self.assertEqual(execute.call_count, 3)
+        self.assertEqual((calibrated['status'], calibrated['reference_runtime']), ('calibrated', 0.4))
+        self.assertEqual(calibrated['time_limits']['python'], 6.0)
+        self.assertEqual(grade(), (6.0, 0))
+
+        QuestionTestCase.objects.create(question=question, input_data='b', expected_output='b')
+        self.assertEqual(grade(), (None, 1))
+
+class StaticAnalysisTests(TestCase):
+    def create_assessment_submissions(self, codes):
+        """Create one candidate's submission of each program to an assessment; returns (assessment, submissions)."""
+        organization = Organization.objects.create(name='Analysis')
+        user = User.objects.create_user(f'analysis-{uuid.uuid4().hex}@example.com', first_name='Ana', last_name='Lyst')
+        library = TestLibrary.objects.create(title='Analysis', description='', creator=user, category='analysis',
+                                             difficulty='beginner')
+        test = Test.objects.create(title='Analysis', description='', instructions='', category='analysis',
+                                   difficulty='easy', created_by=user, organization=organization)
+        assessment = Assessment.objects.create(title='Analysis', description='', time_limit=60, passing_score=50,
+                                               created_by=user, organization=organization)
+        submissions = []
+        for code in codes:
+            candidate = User.objects.create_user(f'candidate-{uuid.uuid4().hex}@example.com', first_name='Can',
+                                                 last_name='Didate')
+            candidate_test = CandidateTest.objects.create(
+                candidate_assessment=CandidateAssessment.objects.create(candidate=candidate, assessment=assessment),
+                test=test,
+            )
+            question = Question.objects.create(test=library, content='Echo the input', type='coding', difficulty='easy')
+            answer = CandidateAnswer.objects.create(candidate_test=candidate_test, question=question, content=code)
+            submissions.append(CodeSubmission.objects.create(candidate_answer=answer, language='python',
+                                                             code_content=code))
+        return assessment, submissions
+
+    def test_cyclomatic_complexity_counts_paths_per_function(self):
+        """Each branch, loop, handler and boolean operator adds a path to its own function"""
+        code = (
+            "def solve(values):\n"
+            "    total = 0\n"
+            "    for value in values:\n"
+            "        if value > 0 and value % 2:\n"
+            "            total += value\n"
+            "    def helper():\n"
+            "        return [v for v in values if v]\n"
+            "    try:\n"
+            "        return total\n"
+            "    except ValueError:\n"
+            "        return 0\n"
+            "print(solve([1, 2]) if True else 0)\n"
+        )
+
+        self.assertEqual(cyclomatic_complexity(code), {'<module>': 2, 'solve': 5, 'solve.helper': 3})
+
+    @override_settings(EXECUTION_ANALYSIS_PROCESSES=0)
+    def test_assessment_batch_analyses_identical_code_once(self):
+        """Findings are stored per submission but identical code is analysed once and then cached"""
+        assessment, submissions = self.create_assessment_submissions(["print(input())"] * 3)
+        assessment_id = str(assessment.id)
+        findings = {'lint_score': 9.5, 'lint_messages': [], 'security_issues': [], 'complexity': {'<module>': 1},
+                    'max_complexity': 1, 'errors': {}}
+        analyzer = mock.MagicMock(return_value=findings)
+
+        with mock.patch.dict('execution.analysis._analyzers', {'python': analyzer}):
+            first = analyze_assessment(assessment_id)
+            again = analyze_assessment(assessment_id)
+
+        self.assertEqual((first['analyzed'], first['run']), (3, 1))
+        self.assertEqual((again['analyzed'], again['run']), (3, 0))
+        analyzer.assert_called_once_with("print(input())")
+        self.assertEqual(
+            sorted(str(row.code_submission_id) for row in StaticAnalysisResult.objects.all()),
+            sorted(str(submission.id) for submission in submissions),
+        )
+        self.assertEqual(float(StaticAnalysisResult.objects.first().lint_score), 9.5)
+
+    def test_python_findings_include_lint_and_security_issues(self):
+        """pylint scores the program and bandit reports risky calls"""
+        if not (importlib.util.find_spec('pylint') and importlib.util.find_spec('bandit')):
+            self.skipTest('pylint and bandit are not installed')
+
+        findings = analyze_python("import subprocess\nsubprocess.call(input(), shell=True)\n")
+
+        self.assertEqual(findings['errors'], {})
+        self.assertIsNotNone(findings['lint_score'])
+        self.assertIn('B602', [issue['test_id'] for issue in findings['security_issues']])
+
+
+class SandboxReaperTests(TestCase):
+    def pooled(self, container_id, owner, state='running', age=3600):
+        return {'Id': container_id, 'State': state, 'Created': int(time.time()) - age,
+                'Labels': {POOL_LABEL: 'python', OWNER_LABEL: owner}}
+
+    def test_orphans_are_killed_removed_and_their_records_closed(self):
+        """Containers of dead owners are reaped in bulk; live and young ones are left alone"""
+        cache.set(OWNER_KEY_PREFIX + 'alive:1', time.time())
+        api = mock.MagicMock()
+        api.containers.return_value = [
+            self.pooled('live', 'alive:1'),
+            self.pooled('orphan-1', 'dead:2'),
+            self.pooled('orphan-2', 'dead:2'),
+            self.pooled('young', 'dead:3', age=5),
+            self.pooled('exited', 'dead:2', state='exited'),
+        ]
+        api.prune_containers.return_value = {'ContainersDeleted': ['orphan-1', 'orphan-2', 'exited'],
+                                             'SpaceReclaimed': 4096}
+        for container_id in ('live', 'orphan-1', 'elsewhere'):
+            track_container(container_id, uuid.uuid4(), 'python', 'running')
+        backend = mock.MagicMock()
+        backend.name = 'docker'
+        backend.client.api = api
+
+        with mock.patch('execution.reaper.get_sandbox_backend', return_value=backend):
+            report = reap_orphaned_sandboxes()
+
+        self.assertEqual(sorted(call.args[0] for call in api.kill.call_args_list), ['orphan-1', 'orphan-2'])
+        api.prune_containers.assert_called_once_with(filters={'label': POOL_LABEL})
+        self.assertEqual(
+            {key: report[key] for key in ('checked', 'orphaned', 'killed', 'removed', 'space_reclaimed', 'records_updated')},
+            {'checked': 5, 'orphaned': 3, 'killed': 2, 'removed': 3, 'space_reclaimed': 4096, 'records_updated': 1},
+        )
+        # Containers of other daemons are theirs to reconcile
+        self.assertEqual(
+            {container_id: get_container(container_id)['status'] for container_id in ('live', 'orphan-1', 'elsewhere')},
+            {'live': 'running', 'orphan-1': 'removed', 'elsewhere': 'running'},
+        )
+        self.assertEqual(get_reaper_report(), report)
+
+    def test_sweeps_go_to_every_execution_host(self):
+        """The periodic sweep is fanned out to the node queue of each live host, once per host"""
+        nodes = [{'node': 'a:1', 'host': 'a'}, {'node': 'a:2', 'host': 'a'}, {'node': 'b:1', 'host': 'b'}]
+        with mock.patch('execution.tasks.get_nodes', return_value=nodes), \
+                mock.patch('execution.tasks.reap_node_sandboxes.apply_async') as apply_async:
+            result = reap_sandboxes()
+
+        self.assertEqual(result, {'hosts': ['a', 'b']})
+        self.assertEqual([call.kwargs['queue'] for call in apply_async.call_args_list],
+                         ['execution.node.a', 'execution.node.b'])
+
+
+class BenchmarkTests(TransactionTestCase):
+    latencies = {'start': 0, 'wait': 0, 'compile': 0, 'logs': 0, 'stats': 0}
+
+    def test_execute_code_benchmark_runs_on_fake_docker(self):
+        """The harness drives every run through the fake daemon and counts its queries"""
+        report = benchmark_fake_docker(
+            {'test_cases': [1, 3], 'code_size': [100, 300]}, runs=6, concurrency=1, latencies=self.latencies
+        )
+
+        self.assertEqual(report['runs'], 6)
+        self.assertEqual(report['failed'], 0)
+        self.assertEqual(report['queries_per_run'], 1)
+        self.assertLessEqual(report['latency']['p50'], report['latency']['p99'])
+
+    def test_plagiarism_benchmark(self):
+        """Every generated submission is checked against the others"""
+        report = benchmark_plagiarism({'languages': {'python': 1}}, submissions=4)
+
+        self.assertEqual(report['runs'], 4)
+        self.assertEqual(report['failed'], 0)
+
+
+class LocalEventBusTests(SimpleTestCase):
+    def test_subscribers_get_their_channel_only(self):
+        """Events published from another thread reach subscribers of that channel"""
+        bus = LocalEventBus()
+
+        async def main():
+            async with bus.subscribe('a') as a_messages, bus.subscribe('b') as b_messages:
+                await asyncio.to_thread(bus.publish, 'a', {'event': 'running'})
+                received = await asyncio.wait_for(a_messages.__anext__(), 1)
+                with self.assertRaises(asyncio.TimeoutError):
+                    await asyncio.wait_for(b_messages.__anext__(), 0.05)
+            return received
+
+        self.assertEqual(asyncio.run(main()), {'event': 'running'})
+
+
+@override_settings(EXECUTION_SANDBOX_BACKEND='local', EXECUTION_EVENT_BUS='local')
+class ExecutionEventStreamTests(TransactionTestCase):
+    def test_run_progress_is_streamed(self):
+        """A client following a run gets queued, running, per-test-case and completed events"""
+        execution_id = str(uuid.uuid4())
+        set_status(execution_id, 'pending')
+        test_cases = [
+            {'id': '1', 'input_data': 'abc', 'expected_output': 'cba'},
+            {'id': '2', 'input_data': 'xy', 'expected_output': 'xy'},
+        ]
+
+        async def follow():
+            frames = stream_events(execution_id)
+            received = [await frames.__anext__()]
+            run = asyncio.create_task(asyncio.to_thread(
+                execute_code, f"# {uuid.uuid4()}\nprint(input()[::-1])", 'python',
+                execution_id=execution_id, test_cases=test_cases,
+            ))
+            received += [frame async for frame in frames]
+            await run
+            return received
+
+        frames = asyncio.run(follow())
+
+        events = [frame.split('\n')[0] for frame in frames]
+        self.assertEqual(events, [
+            'event: queued', 'event: running', 'event: test_case', 'event: test_case', 'event: completed',
+        ])
+        self.assertIn('"verdict": "failed"', frames[3])
+        self.assertIn('"status": "completed"', frames[4])
+
+    def test_finished_run_is_replayed(self):
+        """Following a run that already finished yields its result straight away"""
+        result = execute_code("print('done')", 'python')
+
+        async def follow():
+            return [frame async for frame in stream_events(result['execution_id'])]
+
+        frames = asyncio.run(follow())
+
+        self.assertEqual(len(frames), 1)
+        self.assertTrue(frames[0].startswith('event: completed'))
+        self.assertIn('"stdout": "done\\n"', frames[0])
+
+    def test_only_the_owner_may_follow_a_run(self):
+        """A run's events are only streamed to the user it was queued for and to staff"""
+        result = execute_code("print('done')", 'python')
+        execution_id = result['execution_id']
+        owner = User.objects.create_user(f'owner-{uuid.uuid4().hex}@example.com', first_name='Owen', last_name='Er')
+        other = User.objects.create_user(f'other-{uuid.uuid4().hex}@example.com', first_name='Otto', last_name='Er')
+        staff = User.objects.create_user(f'staff-{uuid.uuid4().hex}@example.com', first_name='Stef', last_name='Af',
+                                         is_staff=True)
+        set_owner(execution_id, owner.pk)
+
+        def status(user):
+            request = RequestFactory().get(f'/execution/{execution_id}/events/')
+            request.user = user
+            return asyncio.run(execution_events(request, uuid.UUID(execution_id))).status_code
+
+        self.assertEqual(status(AnonymousUser()), 401)
+        self.assertEqual(status(other), 404)
+        self.assertEqual(status(owner), 200)
+        self.assertEqual(status(staff), 200)
+
+    def test_hidden_test_cases_stay_out_of_events(self):
+        """Events never carry expected output, nor the output of hidden test cases"""
+        execution_id = str(uuid.uuid4())
+        set_status(execution_id, 'pending')
+        test_cases = [
+            {'id': '1', 'input_data': 'secret', 'expected_output': 'terces', 'hidden': True},
+            {'id': '2', 'input_data': 'abc', 'expected_output': 'abc'},
+        ]
+
+        async def follow():
+            frames = stream_events(execution_id)
+            received = [await frames.__anext__()]
+            run = asyncio.create_task(asyncio.to_thread(
+                execute_code, f"# {uuid.uuid4()}\nprint(input()[::-1])", 'python',
+                execution_id=execution_id, test_cases=test_cases,
+            ))
+            received += [frame async for frame in frames]
+            await run
+            return received
+
+        frames = asyncio.run(follow())
+
+        hidden, visible, completed = frames[2:]
+        self.assertIn('"verdict": "passed"', hidden)
+        self.assertNotIn('terces', hidden)
+        self.assertIn('"actual": "cba"', visible)
+        self.assertNotIn('"expected"', visible)
+        self.assertNotIn('terces', completed)
+        replayed = asyncio.run(self.replay(execution_id))
+        self.assertNotIn('terces', replayed)
+
+    @staticmethod
+    async def replay(execution_id):
+        return ''.join([frame async for frame in stream_events(execution_id)])
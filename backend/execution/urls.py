@@ -0,0 +1,6 @@
+from django.urls import path
+from .views import execution_events
+
+urlpatterns = [
+    path('<uuid:execution_id>/events/', execution_events, name='execution-events'),
+]
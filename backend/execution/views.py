@@ -0,0 +1,96 @@
+"""
+Views for the execution service.
+"""
+import asyncio
+import json
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from .events import TERMINAL_STATUSES, channel_name, get_event_bus
+from .lifecycle import STATUS_EVENTS, get_owner, get_result, get_status, has_private_output
+
+
+def format_event(message):
+    """Encode an event as a server-sent-events frame."""
+    return f"event: {message['event']}\ndata: {json.dumps(message)}\n\n"
+
+
+async def stream_events(execution_id):
+    """
+    Yield the server-sent-events frames of a run until it completes.
+
+    Subscribing comes first, so nothing published while the current state is
+    looked up is missed; a run that already finished yields its result at once.
+    """
+    execution_id = str(execution_id)
+    deadline = time.monotonic() + settings.EXECUTION_EVENTS_TIMEOUT
+    async with get_event_bus().subscribe(channel_name(execution_id)) as messages:
+        status = await sync_to_async(get_status)(execution_id)
+        if status in TERMINAL_STATUSES:
+            result = await sync_to_async(get_result)(execution_id)
+            if result is not None:
+                if await sync_to_async(has_private_output)(execution_id):
+                    result.update(stdout='', stderr='')
+                yield format_event({'event': 'completed', 'execution_id': execution_id, **result})
+                return
+        elif status in STATUS_EVENTS:
+            yield format_event({'event': STATUS_EVENTS[status], 'execution_id': execution_id})
+
+        # The next message is awaited in a task: cancelling it on a keep-alive
+        # timeout would close the subscription's generator
+        pending = None
+        try:
+            while time.monotonic() < deadline:
+                if pending is None:
+                    pending = asyncio.ensure_future(messages.__anext__())
+                done, _ = await asyncio.wait({pending}, timeout=settings.EXECUTION_EVENTS_KEEPALIVE)
+                if not done:
+                    # Keeps proxies from closing an idle stream
+                    yield ': keep-alive\n\n'
+                    continue
+                message = pending.result()
+                pending = None
+                yield format_event(message)
+                if message['event'] == 'completed':
+                    return
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+
+def authenticate(request):
+    """Return the user of a request, authenticated the way the API authenticates them."""
+    request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    try:
+        return request.user
+    except AuthenticationFailed:
+        return None
+
+
+def may_follow(user, execution_id):
+    """Whether a user may follow a run: staff may follow any run, others only the runs queued for them."""
+    if user is None or not user.is_authenticated:
+        return False
+    return user.is_staff or get_owner(execution_id) == str(user.pk)
+
+
+async def execution_events(request, execution_id):
+    """
+    Stream a run's progress as server-sent events: queued, running, one
+    test_case event per test case and completed. Only the user the run was
+    queued for, and staff, may follow it.
+    """
+    user = await sync_to_async(authenticate)(request)
+    if user is None or not user.is_authenticated:
+        return HttpResponse(status=401)
+    if not await sync_to_async(may_follow)(user, str(execution_id)):
+        # Runs of other users look the same as runs that do not exist
+        return HttpResponse(status=404)
+    response = StreamingHttpResponse(stream_events(execution_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,120 @@
+"""
+Sandbox warm-up for execution workers.
+
+Before a worker takes runs, every language in LANGUAGE_CONFIGS gets its
+image pulled and pinned to the digest it resolved to, its sandbox pool
+filled, and a trivial program compiled and run, so the first real run
+after a deploy or scale-up pays neither the pull nor cold page caches.
+The outcome is kept as this process's readiness report and shared in the
+Django cache under the worker's host name for health checks.
+"""
+import logging
+import os
+import socket
+import time
+from django.conf import settings
+from django.core.cache import cache
+from .engine import get_execution_engine
+from .sandbox import get_sandbox_backend
+from .tasks import LANGUAGE_CONFIGS, run_session
+
+logger = logging.getLogger(__name__)
+
+READINESS_KEY_PREFIX = 'execution:readiness:'
+
+# Each program prints "ok"
+WARMUP_PROGRAMS = {
+    'python': "print('ok')",
+    'javascript': "console.log('ok');",
+    'java': 'public class Main { public static void main(String[] args) { System.out.println("ok"); } }',
+    'cpp': '#include <iostream>\nint main() { std::cout << "ok" << std::endl; }',
+}
+
+_readiness = None
+
+
+def check_unprivileged(sandbox):
+    """Fail unless the sandbox can drop privileges, e.g. because its image lacks util-linux setpriv."""
+    prefix = sandbox.unprivileged()
+    if not prefix:
+        return
+    exit_code, stdout, stderr = sandbox.exec(f"{prefix} true", privileged=True)
+    if exit_code != 0:
+        output = stderr.text() or stdout.text()
+        raise RuntimeError(f"Sandbox cannot drop privileges (exit code {exit_code}): {output[:200]}")
+
+
+def run_warmup_program(backend, language, lang_config):
+    """Run a language's warm-up program in a sandbox and fail unless it prints "ok"."""
+    sandbox = backend.acquire(language, lang_config)
+    healthy = False
+    try:
+        # Without it every run, and every reset between runs, would fail
+        check_unprivileged(sandbox)
+        run = get_execution_engine().run(run_session(
+            backend, sandbox, language, lang_config, WARMUP_PROGRAMS[language],
+            [{'id': 'warmup', 'input_data': '', 'expected_output': 'ok'}], None, lang_config['timeout'],
+        ))
+        healthy = True
+    finally:
+        sandbox.close(healthy=healthy)
+    result = run['test_results'][0]
+    if result['verdict'] != 'passed':
+        raise RuntimeError(f"Warm-up program {result['verdict']}: {(result['stderr'] or result['stdout'])[:200]}")
+
+
+def warm_up(languages=None, pull=True, sandboxes=True):
+    """
+    Prepare the sandbox images and sandboxes of this worker.
+
+    Args:
+        languages (list, optional): Languages to warm up; defaults to all of LANGUAGE_CONFIGS
+        pull (bool, optional): Pull images from the registry rather than only resolving local ones
+        sandboxes (bool, optional): Also fill sandbox pools and run the warm-up programs
+
+    Returns:
+        dict: ``ready`` flag and a per-language report of digest, timings and errors
+    """
+    global _readiness
+    backend = get_sandbox_backend()
+    report = {}
+    for language in languages or LANGUAGE_CONFIGS:
+        lang_config = LANGUAGE_CONFIGS[language]
+        entry = {'image': lang_config['image'], 'digest': None, 'ready': False, 'seconds': 0, 'error': None}
+        started = time.monotonic()
+        try:
+            entry['digest'] = backend.prepare(lang_config, pull=pull)
+            if sandboxes:
+                backend.warm(language, lang_config)
+                run_warmup_program(backend, language, lang_config)
+            entry['ready'] = True
+        except Exception as e:
+            logger.exception(f"Error warming up {language} sandboxes: {e}")
+            entry['error'] = str(e)
+        entry['seconds'] = round(time.monotonic() - started, 2)
+        report[language] = entry
+
+    _readiness = {
+        'host': socket.gethostname(),
+        'pid': os.getpid(),
+        'backend': backend.name,
+        'ready': all(entry['ready'] for entry in report.values()),
+        'languages': report,
+    }
+    cache.set(READINESS_KEY_PREFIX + socket.gethostname(), _readiness, timeout=settings.EXECUTION_STATE_TTL)
+    return _readiness
+
+
+def get_readiness(host=None):
+    """
+    Get a warm-up readiness report.
+
+    Args:
+        host (str, optional): Worker host name; defaults to this process
+
+    Returns:
+        dict: Report from ``warm_up``, or None if that host has not warmed up
+    """
+    if host is None:
+        return _readiness
+    return cache.get(READINESS_KEY_PREFIX + host)
@@ -0,0 +1,111 @@
+"""
+Zygote runner for Python programs.
+
+A language whose LANGUAGE_CONFIGS entry sets ``'runner': 'zygote'`` runs its
+programs as forks of a long-lived interpreter (``python_zygote.py``) when the
+sandbox is reused between runs, instead of starting the interpreter once per
+test case. The batch runner starts the zygote on first use and then replaces
+each ``python program.py`` with a small shell client that asks the zygote for
+a child, waits for its exit code and CPU time, and exits the same way, so the
+runner's timing, memory sampling and verdicts work unchanged.
+
+The zygote and its client run with the runner's privileges, so the zygote can
+write each child's pid and CPU time where the runner keeps its measurements;
+every child drops to the sandbox user before it runs candidate code. The
+zygote lives next to the workspace rather than in it, in a directory only the
+runner's user can enter, and exits once a reset removes that directory.
+"""
+import os
+from .sandbox import parse_memory_limit
+
+ZYGOTE_RUNNER = 'zygote'
+
+# Workspace directory the zygote's files are copied into before it starts
+FILES_DIR = '.zygote'
+
+SERVER_NAME = 'python_zygote.py'
+CLIENT_NAME = 'client.sh'
+
+# Longest wait for a freshly started zygote to become ready, in hundredths of a second
+START_TIMEOUT = 1000
+
+with open(os.path.join(os.path.dirname(__file__), SERVER_NAME)) as f:
+    SERVER_SOURCE = f.read()
+
+# Runs a program in a child of the zygote, standing in for `python <program>`:
+# sh client.sh <zygote dir> <program> <pid file> <timeout>
+# The zygote leaves the child's CPU time next to the pid file, in a .cpu file.
+CLIENT_SOURCE = """case "$3" in /*) pid_file=$3 ;; *) pid_file=$PWD/$3 ;; esac
+status=$1/status.$$
+rm -f "$status"
+mkfifo -m 600 "$status" || exit 126
+# The child takes its streams from fds 4-6: redirections such as `read <&3`
+# swap fd 0 while the shell waits
+exec 3<> "$status" 4<&0 5>&1 6>&2
+echo "$$ $2 $pid_file $4 $status" >> "$1/requests"
+read code <&3
+rm -f "$status"
+exit "${code:-126}"
+"""
+
+# Starts the zygote unless it is already serving this sandbox
+SETUP_TEMPLATE = """zygote={zygote_dir}
+if ! {{ [ -p $zygote/requests ] && read zygote_pid < $zygote/pid && kill -0 $zygote_pid; }} 2>/dev/null; then
+  rm -rf $zygote && mkdir -m 700 $zygote
+  cp {files_dir}/{server} {files_dir}/{client} $zygote/
+  ( {python} $zygote/{server} $zygote {address_space} {user} < /dev/null > /dev/null 2> $zygote/log & )
+  i=0
+  while [ ! -f $zygote/ready ] && [ $i -lt {start_timeout} ]; do sleep 0.01; i=$((i + 1)); done
+fi
+"""
+
+
+def uses_zygote(lang_config, sandbox):
+    """Whether runs of a language go through a zygote in this sandbox."""
+    # A zygote only pays off in sandboxes that outlive a single run. Those are Docker's, where its
+    # children switch to the sandbox user; in the local jail they would keep the runner's uid
+    return lang_config.get('runner') == ZYGOTE_RUNNER and sandbox.reusable
+
+
+def zygote_dir(workspace):
+    return workspace.rstrip('/') + FILES_DIR
+
+
+def build_zygote_files():
+    """Return the zygote's files, keyed by workspace-relative name."""
+    return {
+        f"{FILES_DIR}/{SERVER_NAME}": SERVER_SOURCE,
+        f"{FILES_DIR}/{CLIENT_NAME}": CLIENT_SOURCE,
+    }
+
+
+def build_zygote_setup(workspace, lang_config, user=''):
+    """
+    Build the runner snippet that starts the sandbox's zygote if it is not running.
+
+    Args:
+        workspace (str): Sandbox workspace holding the files from ``build_zygote_files``
+        lang_config (dict): Entry from LANGUAGE_CONFIGS
+        user (str): ``Sandbox.user`` the children run as, empty to only drop capabilities
+
+    Returns:
+        str: Shell script text
+    """
+    address_space = lang_config.get('address_space_limit')
+    return SETUP_TEMPLATE.format(
+        zygote_dir=zygote_dir(workspace),
+        files_dir=f"{workspace}/{FILES_DIR}",
+        server=SERVER_NAME,
+        client=CLIENT_NAME,
+        python=lang_config['command'],
+        # Without an explicit limit the sandbox's own memory limit applies
+        address_space=parse_memory_limit(address_space) if address_space else 0,
+        start_timeout=START_TIMEOUT,
+        user=user or '-',
+    )
+
+
+def get_zygote_command(workspace, source, timeout):
+    """Return the command that runs a program through the zygote; it expects its pid file as $0."""
+    directory = zygote_dir(workspace)
+    return f'sh {directory}/{CLIENT_NAME} {directory} {workspace}/{source} "$0" {timeout}'